@@ -0,0 +1,342 @@
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+if __package__ is None or __package__ == "":
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent.parent))
+
+from service.benchmarks.stand_ins import StandInServer
+from service.benchmarks.startup import measure_startup
+
+DEFAULT_CITY = "Brampton, ON, Canada"
+DEFAULT_DATE = "2023-06-01"
+DEFAULT_SIZES = (256, 512, 1024)
+DEFAULT_TOLERANCE = 0.2
+MODELS = ("auto", "unet", "stand-in")
+
+
+class StandInModel:
+    """Cheap U-Net substitute for machines without TensorFlow: a blurred, damped copy of the input."""
+
+    def predict_on_batch(self, batch: np.ndarray) -> np.ndarray:
+        import cv2
+
+        return np.stack([cv2.blur(tile, (15, 15)) * -0.5 for tile in batch[..., 0]])[..., np.newaxis]
+
+
+def _model_factory(model: str) -> Tuple[str, Callable[[], Any]]:
+    if model in ("auto", "unet"):
+        try:
+            import tensorflow as tf
+        except ImportError:
+            if model == "unet":
+                raise
+            print("TensorFlow not available, using the stand-in model")
+        else:
+            def build():
+                from service.simulation.model import build_unet
+
+                # Untrained weights cost the same to run as a checkpoint.
+                tf.random.set_seed(0)
+                return build_unet()
+
+            return "unet", build
+    return "stand-in", StandInModel
+
+
+def configure_environment(server: StandInServer, workdir: Path) -> None:
+    """Point every external endpoint at ``server``; must run before the service modules are imported."""
+    host = server.url.split("://", 1)[1]
+    os.environ.update(
+        {
+            "STAC_API_URL": f"{server.url}/stac",
+            "NOMINATIM_DOMAIN": f"{host}/nominatim",
+            "NOMINATIM_SCHEME": "http",
+            "CITY_DATA_URL": f"{server.url}/ninjas/city",
+            "API_NINJAS_API_KEY": "benchmark",
+            "SAS_TOKEN_URL": f"{server.url}/sas/token",
+            "SAS_SIGNED_HOSTS": "127.0.0.1",
+            "SCENE_STATS_PATH": str(workdir / "scene_stats.sqlite"),
+        }
+    )
+
+    import osmnx as ox
+
+    ox.settings.nominatim_url = f"{server.url}/nominatim"
+    ox.settings.overpass_url = f"{server.url}/overpass"
+    ox.settings.overpass_rate_limit = False
+    ox.settings.cache_folder = str(workdir / "osm-cache")
+    ox.settings.log_console = False
+
+
+def _layout(bbox: Sequence[float], count: int, seed: int) -> Dict[str, List]:
+    rng = np.random.default_rng(seed)
+    lon_min, lat_min, lon_max, lat_max = bbox
+    lats = lat_min + (lat_max - lat_min) * rng.uniform(0.3, 0.7, count)
+    lons = lon_min + (lon_max - lon_min) * rng.uniform(0.3, 0.7, count)
+    return {"types": ["trees"] * count, "lats": lats.tolist(), "lons": lons.tolist()}
+
+
+def scenarios(city: str, date: str, bbox: Sequence[float], interventions: int) -> List[Tuple[str, Callable]]:
+    """``(name, call(client, run))`` pairs, ordered so each scenario finds the session data it needs."""
+    query = {"city": city, "date": date}
+    cached_layout = _layout(bbox, interventions, seed=1_000_000)
+    return [
+        ("imagery_heat", lambda client, run: client.get("/imagery/heat", query_string=query)),
+        ("imagery_ndvi", lambda client, run: client.get("/imagery/ndvi", query_string=query)),
+        ("imagery_heat_array", lambda client, run: client.get("/imagery/heat", query_string={**query, "format": "array"})),
+        ("imagery_ndvi_array", lambda client, run: client.get("/imagery/ndvi", query_string={**query, "format": "array"})),
+        (
+            "imagery_heat_composite",
+            lambda client, run: client.get("/imagery/heat", query_string={**query, "format": "array", "composite": "first"}),
+        ),
+        (
+            "imagery_ndvi_composite",
+            lambda client, run: client.get("/imagery/ndvi", query_string={**query, "format": "array", "composite": "median"}),
+        ),
+        ("score", lambda client, run: client.get("/score", query_string={"city": city})),
+        ("weakspots", lambda client, run: client.get("/weakspots")),
+        ("weakspots_stream", lambda client, run: client.get("/weakspots", query_string={"stream": "1"})),
+        # A new layout every run so each call pays for inference; the cached variant repeats one layout.
+        ("simulate", lambda client, run: client.post("/simulate", json=_layout(bbox, interventions, seed=run))),
+        ("simulate_cached", lambda client, run: client.post("/simulate", json=cached_layout)),
+        (
+            "simulate_plan",
+            lambda client, run: client.post("/simulate/plan", json={"type": "trees", "count": 100, "step": 20, "max_sites": 10}),
+        ),
+        # Last, because indexing the scenes first warms the COG pool and SAS cache for everything after it.
+        ("timeseries", lambda client, run: client.get("/timeseries", query_string={"city": city, "interval": "month"})),
+    ]
+
+
+def _stage_totals() -> Dict[str, Tuple[int, float]]:
+    from service.metrics import STAGE_SECONDS
+
+    return {key[0]: value for key, value in STAGE_SECONDS.totals().items()}
+
+
+def _diff_traffic(before: Dict[str, Dict[str, int]], after: Dict[str, Dict[str, int]], runs: int) -> Dict[str, Dict[str, float]]:
+    traffic = {}
+    for service, counts in after.items():
+        previous = before.get(service, {"requests": 0, "bytes": 0})
+        requests = counts["requests"] - previous["requests"]
+        if requests:
+            traffic[service] = {
+                "requests": requests / runs,
+                "bytes": (counts["bytes"] - previous["bytes"]) / runs,
+            }
+    return traffic
+
+
+def run_scenario(name: str, call: Callable, client, server: StandInServer, repeat: int, timeout: float) -> Dict[str, Any]:
+    stages_before, traffic_before = _stage_totals(), server.traffic()
+    durations, status, response_bytes, shape = [], None, 0, None
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        for run in range(repeat):
+            def timed_call():
+                start = time.perf_counter()
+                response = call(client, run)
+                body = response.get_data()
+                return time.perf_counter() - start, response, body
+
+            try:
+                elapsed, response, body = executor.submit(timed_call).result(timeout)
+            except TimeoutError:
+                # Retries are bounded by IMAGERY_ATTEMPTS; this only guards against a call that hangs.
+                print(f"{name} did not finish within {timeout:.0f}s, aborting")
+                os._exit(2)
+
+            durations.append(elapsed)
+            status, response_bytes = response.status_code, len(body)
+            shape = response.headers.get("X-Array-Shape", shape)
+            if status != 200:
+                print(f"{name} returned {status}: {body[:200]!r}")
+                break
+
+    stages_after = _stage_totals()
+    stages_ms = {
+        stage: (total - stages_before.get(stage, (0, 0.0))[1]) * 1000.0 / len(durations)
+        for stage, (count, total) in stages_after.items()
+        if count > stages_before.get(stage, (0, 0.0))[0]
+    }
+    warm = durations[1:]
+    return {
+        "scenario": name,
+        "status": status,
+        "runs": len(durations),
+        "cold_ms": durations[0] * 1000.0,
+        "warm_ms_p50": float(np.median(warm)) * 1000.0 if warm else None,
+        "warm_ms_min": float(np.min(warm)) * 1000.0 if warm else None,
+        "response_bytes": response_bytes,
+        "array_shape": shape,
+        "stages_ms": dict(sorted(stages_ms.items())),
+        "remote": _diff_traffic(traffic_before, server.traffic(), len(durations)),
+    }
+
+
+def run_benchmarks(
+    server: StandInServer,
+    city: str,
+    date: str,
+    sizes: Sequence[int],
+    repeat: int,
+    interventions: int,
+    timeout: float,
+    only: Optional[Sequence[str]] = None,
+) -> List[Dict[str, Any]]:
+    from service.imagery.scene_stats import SceneStatsIngester, SceneStatsStore, set_scene_stats_store
+    from service.main import create_app
+    from service.simulation.result_cache import get_simulation_cache
+
+    bbox = server.city_bbox(city)
+    results = []
+    for size in sizes:
+        server.publish_scenes(bbox, size, date=date)
+        get_simulation_cache().clear()
+        app = create_app()
+        client = app.test_client()
+
+        for name, call in scenarios(city, date, bbox, interventions):
+            if only and name not in only:
+                continue
+            if name == "timeseries":
+                # Indexing is the background ingester's job, so it stays outside the timed calls.
+                store = SceneStatsStore(Path(os.environ["SCENE_STATS_PATH"]).with_name(f"scene_stats_{size}.sqlite"))
+                set_scene_stats_store(store)
+                SceneStatsIngester(store, [city], start=date).ingest_all()
+            result = {"size": size, **run_scenario(name, call, client, server, repeat, timeout)}
+            warm = f", warm {result['warm_ms_p50']:.1f}ms" if result["warm_ms_p50"] is not None else ""
+            print(f"[{size}] {name}: cold {result['cold_ms']:.1f}ms{warm} (status {result['status']})")
+            results.append(result)
+    return results
+
+
+def compare(
+    results: List[Dict[str, Any]],
+    baseline: Dict[str, Any],
+    tolerance: float,
+    startup: Optional[Dict[str, Any]] = None,
+) -> List[str]:
+    """Scenarios whose typical latency grew by more than ``tolerance`` against ``baseline``."""
+
+    def latency(entry: Dict[str, Any]) -> float:
+        return entry["warm_ms_p50"] if entry.get("warm_ms_p50") is not None else entry["cold_ms"]
+
+    previous = {(entry["scenario"], entry["size"]): entry for entry in baseline.get("results", [])}
+    regressions = []
+    print(f"{'scenario':<22}{'size':>6}{'baseline ms':>14}{'current ms':>14}{'ratio':>8}")
+    for entry in results:
+        old = previous.get((entry["scenario"], entry["size"]))
+        if old is None or old.get("status") != 200 or entry["status"] != 200:
+            continue
+        ratio = latency(entry) / max(latency(old), 1e-9)
+        flag = "  REGRESSION" if ratio > 1 + tolerance else ""
+        print(f"{entry['scenario']:<22}{entry['size']:>6}{latency(old):>14.1f}{latency(entry):>14.1f}{ratio:>8.2f}{flag}")
+        if flag:
+            regressions.append(f"{entry['scenario']}@{entry['size']}")
+
+    if startup and baseline.get("startup"):
+        old, new = baseline["startup"]["import_ms_p50"], startup["import_ms_p50"]
+        ratio = new / max(old, 1e-9)
+        flag = "  REGRESSION" if ratio > 1 + tolerance else ""
+        print(f"{'startup_import':<22}{'':>6}{old:>14.1f}{new:>14.1f}{ratio:>8.2f}{flag}")
+        if flag:
+            regressions.append("startup_import")
+    return regressions
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the API end to end against local stand-ins for every external service.")
+    parser.add_argument("--sizes", default=",".join(map(str, DEFAULT_SIZES)), help="Comma-separated raster widths in pixels.")
+    parser.add_argument("--repeat", type=int, default=3, help="Calls per scenario; the first is reported as cold.")
+    parser.add_argument("--city", default=DEFAULT_CITY, help="City with cached geocoder responses in service/cache.")
+    parser.add_argument("--date", default=DEFAULT_DATE, help="Imagery search date.")
+    parser.add_argument("--interventions", type=int, default=50, help="Points per /simulate call.")
+    parser.add_argument("--scenarios", default=None, help="Comma-separated subset of scenarios to run.")
+    parser.add_argument("--model", choices=MODELS, default="auto", help="U-Net with random weights, or a cheap stand-in.")
+    parser.add_argument("--startup-runs", type=int, default=5, help="Fresh interpreters used to time startup; 0 skips it.")
+    parser.add_argument("--timeout", type=float, default=600.0, help="Seconds before a single call is treated as hung.")
+    parser.add_argument("--output", type=Path, default=Path("benchmark_results.json"), help="JSON results path.")
+    parser.add_argument("--compare", type=Path, default=None, help="Baseline JSON to compare against.")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE, help="Allowed slowdown before failing.")
+    args = parser.parse_args(argv)
+
+    sizes = [int(v) for v in args.sizes.split(",") if v.strip()]
+    only = [v.strip() for v in args.scenarios.split(",")] if args.scenarios else None
+
+    startup = measure_startup(args.startup_runs) if args.startup_runs > 0 else None
+    if startup is not None:
+        print(
+            f"Startup: import {startup['import_ms_p50']:.0f}ms, create_app {startup['create_app_ms_p50']:.0f}ms, "
+            f"heavy modules loaded: {', '.join(startup['heavy_modules_loaded']) or 'none'}"
+        )
+
+    with tempfile.TemporaryDirectory(prefix="heat-bench-") as workdir:
+        server = StandInServer(Path(workdir)).start()
+        try:
+            configure_environment(server, Path(workdir))
+
+            from service.simulation.inference_server import InferenceServer, set_inference_server
+
+            model_name, factory = _model_factory(args.model)
+            inference_server = InferenceServer(model_factory=factory, model_version=f"benchmark-{model_name}")
+            set_inference_server(inference_server)
+            # Load the model up front so the first size does not carry it.
+            inference_server.predict(np.zeros((1, 128, 128, 1), dtype=np.float32))
+
+            started = time.perf_counter()
+            results = run_benchmarks(server, args.city, args.date, sizes, args.repeat, args.interventions, args.timeout, only)
+            elapsed = time.perf_counter() - started
+        finally:
+            server.stop()
+
+    report = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "host": {
+            "platform": platform.platform(),
+            "processor": platform.processor(),
+            "cpu_count": os.cpu_count(),
+            "python": platform.python_version(),
+        },
+        "config": {
+            "city": args.city,
+            "date": args.date,
+            "sizes": sizes,
+            "repeat": args.repeat,
+            "interventions": args.interventions,
+            "model": model_name,
+        },
+        "elapsed_seconds": elapsed,
+        "startup": startup,
+        "results": results,
+    }
+    args.output.write_text(json.dumps(report, indent=2))
+    print(f"Wrote {len(results)} results to {args.output}")
+
+    failed = [f"{r['scenario']}@{r['size']}" for r in results if r["status"] != 200]
+    if failed:
+        print(f"Failed scenarios: {', '.join(failed)}")
+
+    if args.compare is not None:
+        baseline = json.loads(args.compare.read_text())
+        if baseline.get("config", {}).get("model") != model_name:
+            print(f"Warning: baseline used the {baseline.get('config', {}).get('model')} model, this run used {model_name}")
+        regressions = compare(results, baseline, args.tolerance, startup)
+        if regressions:
+            print(f"Regressions beyond {args.tolerance:.0%}: {', '.join(regressions)}")
+            return 1
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
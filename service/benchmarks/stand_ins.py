@@ -0,0 +1,436 @@
+from __future__ import annotations
+
+import json
+import math
+import re
+import threading
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+import cv2
+import numpy as np
+import rasterio
+import rasterio.shutil
+from rasterio.transform import from_bounds
+from rasterio.warp import transform_bounds
+
+CACHE_DIR = Path(__file__).resolve().parent.parent / "cache"
+COLLECTION = "landsat-c2-l2"
+
+# Landsat Collection 2 Level-2 scaling as published in the Planetary Computer items.
+LANDSAT_BANDS = {
+    "lwir11": {"data_type": "uint16", "nodata": 0, "scale": 0.00341802, "offset": 149.0, "unit": "kelvin"},
+    "red": {"data_type": "uint16", "nodata": 0, "scale": 2.75e-05, "offset": -0.2},
+    "nir08": {"data_type": "uint16", "nodata": 0, "scale": 2.75e-05, "offset": -0.2},
+}
+
+CONFORMANCE = [
+    "https://api.stacspec.org/v1.0.0/core",
+    "https://api.stacspec.org/v1.0.0/item-search",
+    "https://api.stacspec.org/v1.0.0/item-search#query",
+    "https://api.stacspec.org/v1.0.0/item-search#sort",
+    "http://www.opengis.net/spec/ogcapi-features-1/1.0/conf/core",
+    "http://www.opengis.net/spec/ogcapi-features-1/1.0/conf/geojson",
+]
+
+POPULATION = {
+    "brampton": 656480,
+    "toronto": 2794356,
+    "hamilton": 569353,
+    "guelph": 143740,
+    "regina": 226404,
+    "waterloo": 67314,
+    "windsor": 229660,
+    "caledon": 76581,
+    "austin": 961855,
+    "mumbai": 12442373,
+    "new york": 8335897,
+}
+DEFAULT_POPULATION = 500000
+SAS_TOKEN_TTL = timedelta(hours=1)
+
+
+def _smooth_noise(rng: np.random.Generator, shape: Tuple[int, int], cells: int = 12) -> np.ndarray:
+    coarse = rng.standard_normal((cells, cells)).astype(np.float32)
+    return cv2.resize(coarse, (shape[1], shape[0]), interpolation=cv2.INTER_CUBIC)
+
+
+def synthetic_bands(shape: Tuple[int, int], seed: int = 0) -> Dict[str, np.ndarray]:
+    """Landsat-like DN rasters: a warm, sparsely vegetated core fading into green surroundings."""
+    rng = np.random.default_rng(seed)
+    rows, cols = np.meshgrid(np.linspace(-1, 1, shape[0]), np.linspace(-1, 1, shape[1]), indexing="ij")
+    urban = np.exp(-(rows ** 2 + cols ** 2) / 0.3).astype(np.float32)
+    urban += 0.15 * _smooth_noise(rng, shape, 24)
+
+    ndvi = np.clip(0.65 - 0.6 * urban + 0.08 * _smooth_noise(rng, shape), -0.2, 0.9)
+    kelvin = 296.0 + 12.0 * urban - 5.0 * ndvi + 0.8 * rng.standard_normal(shape).astype(np.float32)
+    nir = np.clip(0.3 + 0.04 * _smooth_noise(rng, shape), 0.05, 0.6)
+    red = nir * (1 - ndvi) / (1 + ndvi)
+
+    def to_dn(values: np.ndarray, band: str) -> np.ndarray:
+        meta = LANDSAT_BANDS[band]
+        return np.clip(np.rint((values - meta["offset"]) / meta["scale"]), 1, 65535).astype(np.uint16)
+
+    return {"lwir11": to_dn(kelvin, "lwir11"), "red": to_dn(red, "red"), "nir08": to_dn(nir, "nir08")}
+
+
+def utm_crs(lon: float, lat: float) -> str:
+    zone = int((lon + 180) // 6) + 1
+    return f"EPSG:{(32600 if lat >= 0 else 32700) + zone}"
+
+
+def write_cog(path: Path, data: np.ndarray, crs: str, bounds: Tuple[float, float, float, float], nodata: int = 0) -> None:
+    height, width = data.shape
+    with rasterio.MemoryFile() as memfile:
+        with memfile.open(
+            driver="GTiff",
+            height=height,
+            width=width,
+            count=1,
+            dtype=data.dtype,
+            crs=crs,
+            transform=from_bounds(*bounds, width, height),
+            nodata=nodata,
+        ) as dataset:
+            dataset.write(data, 1)
+            rasterio.shutil.copy(dataset, path, driver="COG", compress="DEFLATE", blocksize=512)
+
+
+def _load_osm_cache(cache_dir: Path) -> Tuple[List[Dict[str, Any]], List[Tuple[Tuple[float, float, float, float], Path]]]:
+    """Nominatim places and the node extent of each cached Overpass response."""
+    places, overpass = [], []
+    for path in sorted(cache_dir.glob("*.json")):
+        try:
+            payload = json.loads(path.read_text())
+        except (OSError, json.JSONDecodeError):
+            continue
+        if isinstance(payload, list):
+            places.extend(place for place in payload if "boundingbox" in place)
+        elif isinstance(payload, dict) and payload.get("elements"):
+            nodes = [(e["lat"], e["lon"]) for e in payload["elements"] if e.get("type") == "node" and "lat" in e]
+            if nodes:
+                lats, lons = zip(*nodes)
+                overpass.append(((min(lats), min(lons), max(lats), max(lons)), path))
+    return places, overpass
+
+
+class StandInServer:
+    """Serves every external dependency of the API from ``127.0.0.1``.
+
+    One threaded HTTP server answers as a STAC API, a static COG host with range
+    requests, the SAS token endpoint, Nominatim, Overpass and the api-ninjas city
+    endpoint. Geocoder and Overpass answers come from the osmnx response cache
+    in ``service/cache``. ``publish_scenes`` replaces the searchable Landsat
+    items, so one server can be reused across raster sizes. Request and byte counts per service are kept
+    to show how much remote traffic each endpoint causes.
+    """
+
+    def __init__(self, workdir: Path, cache_dir: Path = CACHE_DIR) -> None:
+        self.workdir = Path(workdir)
+        self.cog_dir = self.workdir / "cogs"
+        self.cog_dir.mkdir(parents=True, exist_ok=True)
+        self.places, self._overpass = _load_osm_cache(cache_dir)
+        self.items: List[Dict[str, Any]] = []
+
+        self._lock = threading.Lock()
+        self._traffic: Dict[str, List[int]] = {}
+        self._httpd = ThreadingHTTPServer(("127.0.0.1", 0), _make_handler(self))
+        self._httpd.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "StandInServer":
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="stand-in-server", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def record(self, service: str, nbytes: int) -> None:
+        with self._lock:
+            counts = self._traffic.setdefault(service, [0, 0])
+            counts[0] += 1
+            counts[1] += nbytes
+
+    def traffic(self) -> Dict[str, Dict[str, int]]:
+        with self._lock:
+            return {service: {"requests": c[0], "bytes": c[1]} for service, c in self._traffic.items()}
+
+    def find_place(self, query: str) -> Optional[Dict[str, Any]]:
+        name = query.split(",")[0].strip().lower()
+        for place in self.places:
+            if place.get("name", "").lower() == name or place.get("display_name", "").lower().startswith(name):
+                return place
+        return None
+
+    def city_bbox(self, city: str) -> Tuple[float, float, float, float]:
+        place = self.find_place(city)
+        if place is None:
+            raise KeyError(f"No cached geocoder response for '{city}' in {CACHE_DIR}")
+        lat_min, lat_max, lon_min, lon_max = map(float, place["boundingbox"])
+        return lon_min, lat_min, lon_max, lat_max
+
+    def overpass_response(self, query: str) -> Dict[str, Any]:
+        """The cached response whose extent holds the queried polygon's centre, smallest first."""
+        coords = [float(v) for poly in re.findall(r"poly:'([^']*)'", query) for v in poly.split()]
+        empty = {"version": 0.6, "generator": "stand-in", "elements": []}
+        if len(coords) < 2:
+            return empty
+        lat, lon = float(np.mean(coords[0::2])), float(np.mean(coords[1::2]))
+
+        matches = [
+            ((extent[2] - extent[0]) * (extent[3] - extent[1]), path)
+            for extent, path in self._overpass
+            if extent[0] <= lat <= extent[2] and extent[1] <= lon <= extent[3]
+        ]
+        if not matches:
+            return empty
+        return json.loads(min(matches)[1].read_text())
+
+    def publish_scenes(
+        self,
+        bbox: Tuple[float, float, float, float],
+        size: int,
+        scenes: int = 2,
+        margin: float = 0.1,
+        date: str = "2023-07-01",
+    ) -> None:
+        """Write ``scenes`` synthetic items covering ``bbox`` at a resolution giving ``size`` pixels across.
+
+        The clearest item has a strip of nodata so the API falls through to the next one,
+        as it does with partial real scenes.
+        """
+        lon_min, lat_min, lon_max, lat_max = bbox
+        crs = utm_crs((lon_min + lon_max) / 2, (lat_min + lat_max) / 2)
+        left, bottom, right, top = transform_bounds("EPSG:4326", crs, *bbox, densify_pts=21)
+        resolution = max(right - left, top - bottom) / size
+
+        pad_lon, pad_lat = (lon_max - lon_min) * margin, (lat_max - lat_min) * margin
+        footprint = (lon_min - pad_lon, lat_min - pad_lat, lon_max + pad_lon, lat_max + pad_lat)
+        left, bottom, right, top = transform_bounds("EPSG:4326", crs, *footprint, densify_pts=21)
+        shape = (math.ceil((top - bottom) / resolution), math.ceil((right - left) / resolution))
+        bounds = (left, top - shape[0] * resolution, left + shape[1] * resolution, top)
+
+        start = datetime.strptime(date, "%Y-%m-%d")
+        items = []
+        for index in range(scenes):
+            item_id = f"LC09_SYNTHETIC_{size}_{index:02d}"
+            bands = synthetic_bands(shape, seed=index)
+            if index == 0 and scenes > 1:
+                for data in bands.values():
+                    data[:, : shape[1] // 10] = 0
+
+            assets = {}
+            for band, data in bands.items():
+                name = f"{item_id}_{band}.tif"
+                write_cog(self.cog_dir / name, data, crs, bounds)
+                assets[band] = {
+                    "href": f"{self.url}/cogs/{name}",
+                    "type": "image/tiff; application=geotiff; profile=cloud-optimized",
+                    "roles": ["data"],
+                    "raster:bands": [LANDSAT_BANDS[band]],
+                    "proj:shape": list(shape),
+                    "proj:transform": [resolution, 0.0, bounds[0], 0.0, -resolution, bounds[3]],
+                }
+
+            west, south, east, north = footprint
+            items.append(
+                {
+                    "type": "Feature",
+                    "stac_version": "1.0.0",
+                    "stac_extensions": [
+                        "https://stac-extensions.github.io/eo/v1.1.0/schema.json",
+                        "https://stac-extensions.github.io/raster/v1.1.0/schema.json",
+                        "https://stac-extensions.github.io/projection/v1.1.0/schema.json",
+                    ],
+                    "id": item_id,
+                    "collection": COLLECTION,
+                    "bbox": list(footprint),
+                    "geometry": {
+                        "type": "Polygon",
+                        "coordinates": [[[west, south], [east, south], [east, north], [west, north], [west, south]]],
+                    },
+                    "properties": {
+                        "datetime": start.replace(day=min(start.day + 8 * index, 28)).strftime("%Y-%m-%dT16:00:00Z"),
+                        "eo:cloud_cover": 1.0 + 2.0 * index,
+                        "platform": "landsat-9",
+                        "proj:epsg": int(crs.split(":")[1]),
+                    },
+                    "assets": assets,
+                    "links": [],
+                }
+            )
+
+        with self._lock:
+            self.items = items
+        print(f"Published {scenes} synthetic scenes of {shape[1]}x{shape[0]} pixels at {resolution:.1f} m")
+
+    def search(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        with self._lock:
+            items = list(self.items)
+
+        collections = params.get("collections")
+        if isinstance(collections, str):
+            collections = collections.split(",")
+        if collections:
+            items = [item for item in items if item["collection"] in collections]
+
+        bbox = params.get("bbox")
+        if isinstance(bbox, str):
+            bbox = [float(v) for v in bbox.split(",")]
+        if bbox:
+            items = [
+                item for item in items
+                if item["bbox"][0] <= bbox[2] and bbox[0] <= item["bbox"][2]
+                and item["bbox"][1] <= bbox[3] and bbox[1] <= item["bbox"][3]
+            ]
+
+        interval = params.get("datetime")
+        if interval and "/" in interval:
+            start, end = (part[:10] if part not in ("", "..") else None for part in interval.split("/"))
+            items = [
+                item for item in items
+                if (start is None or item["properties"]["datetime"][:10] >= start)
+                and (end is None or item["properties"]["datetime"][:10] <= end)
+            ]
+
+        query = params.get("query") or {}
+        if isinstance(query, str):
+            query = json.loads(query)
+        operators = {"lt": float.__lt__, "lte": float.__le__, "gt": float.__gt__, "gte": float.__ge__, "eq": float.__eq__}
+        for prop, conditions in query.items():
+            for op, value in conditions.items():
+                items = [item for item in items if operators[op](float(item["properties"].get(prop, math.nan)), float(value))]
+
+        return {
+            "type": "FeatureCollection",
+            "features": items,
+            "numberMatched": len(items),
+            "numberReturned": len(items),
+            "links": [],
+        }
+
+    def landing_page(self) -> Dict[str, Any]:
+        root = f"{self.url}/stac"
+        return {
+            "type": "Catalog",
+            "stac_version": "1.0.0",
+            "id": "stand-in",
+            "description": "Local stand-in for the Planetary Computer STAC API",
+            "conformsTo": CONFORMANCE,
+            "links": [
+                {"rel": "self", "href": root, "type": "application/json"},
+                {"rel": "root", "href": root, "type": "application/json"},
+                {"rel": "search", "href": f"{root}/search", "type": "application/geo+json", "method": "GET"},
+                {"rel": "search", "href": f"{root}/search", "type": "application/geo+json", "method": "POST"},
+                {"rel": "conformance", "href": f"{root}/conformance", "type": "application/json"},
+            ],
+        }
+
+
+def _make_handler(server: StandInServer):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args) -> None:
+            pass
+
+        def _send(self, service: str, body: bytes, content_type: str = "application/json", status: int = 200, headers=None) -> None:
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            if self.command != "HEAD":
+                self.wfile.write(body)
+            server.record(service, len(body))
+
+        def _send_json(self, service: str, payload: Any, status: int = 200) -> None:
+            self._send(service, json.dumps(payload).encode("utf-8"), status=status)
+
+        def _body(self) -> bytes:
+            length = int(self.headers.get("Content-Length") or 0)
+            return self.rfile.read(length) if length else b""
+
+        def _send_cog(self, name: str) -> None:
+            path = server.cog_dir / Path(name).name
+            if not path.exists():
+                self._send_json("cogs", {"error": "not found"}, 404)
+                return
+
+            size = path.stat().st_size
+            match = re.match(r"bytes=(\d+)-(\d*)", self.headers.get("Range", ""))
+            if match is None:
+                self._send("cogs", path.read_bytes(), "image/tiff", headers={"Accept-Ranges": "bytes"})
+                return
+
+            start = int(match.group(1))
+            end = min(int(match.group(2)) if match.group(2) else size - 1, size - 1)
+            if start >= size:
+                self._send("cogs", b"", "image/tiff", 416, {"Content-Range": f"bytes */{size}"})
+                return
+            with path.open("rb") as handle:
+                handle.seek(start)
+                body = handle.read(end - start + 1)
+            self._send(
+                "cogs", body, "image/tiff", 206,
+                {"Accept-Ranges": "bytes", "Content-Range": f"bytes {start}-{end}/{size}"},
+            )
+
+        def do_HEAD(self) -> None:
+            self.do_GET()
+
+        def do_GET(self) -> None:
+            url = urlparse(self.path)
+            params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+            path = url.path.rstrip("/")
+
+            if path.startswith("/cogs/"):
+                self._send_cog(path[len("/cogs/"):])
+            elif path == "/stac":
+                self._send_json("stac", server.landing_page())
+            elif path == "/stac/conformance":
+                self._send_json("stac", {"conformsTo": CONFORMANCE})
+            elif path == "/stac/search":
+                self._send_json("stac", server.search(params))
+            elif path == "/nominatim/search":
+                place = server.find_place(params.get("q", ""))
+                self._send_json("geocoder", [place] if place else [])
+            elif path == "/ninjas/city":
+                name = params.get("name", "").strip()
+                population = POPULATION.get(name.lower(), DEFAULT_POPULATION)
+                self._send_json("population", [{"name": name.title(), "population": population, "is_capital": False}])
+            elif path.startswith("/sas/token/"):
+                expiry = datetime.now(timezone.utc) + SAS_TOKEN_TTL
+                self._send_json("sas", {
+                    "msft:expiry": expiry.strftime("%Y-%m-%dT%H:%M:%SZ"),
+                    "token": f"se={expiry.strftime('%Y-%m-%dT%H%%3A%M%%3A%SZ')}&sp=rl&sig=stand-in",
+                })
+            elif path == "/overpass/status":
+                self._send("overpass", b"Connected as: 0\nCurrent time: \nAnnounced endpoint: none\nRate limit: 0\n2 slots available now.\n", "text/plain")
+            else:
+                self._send_json("unknown", {"error": f"no stand-in for {url.path}"}, 404)
+
+        def do_POST(self) -> None:
+            path = urlparse(self.path).path.rstrip("/")
+            body = self._body()
+
+            if path == "/stac/search":
+                self._send_json("stac", server.search(json.loads(body or b"{}")))
+            elif path == "/overpass/interpreter":
+                query = parse_qs(body.decode("utf-8")).get("data", [""])[0]
+                self._send_json("overpass", server.overpass_response(query))
+            else:
+                self._send_json("unknown", {"error": f"no stand-in for {path}"}, 404)
+
+    return Handler
@@ -0,0 +1,75 @@
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+from typing import Any, Dict
+
+import numpy as np
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent.parent
+
+# Modules that should only load once a request needs them.
+HEAVY_MODULES = (
+    "tensorflow",
+    "osmnx",
+    "geopandas",
+    "shapely",
+    "sklearn",
+    "matplotlib",
+    "rasterio",
+    "pystac_client",
+    "planetary_computer",
+    "geopy",
+    "odc.stac",
+    "dask",
+    "xarray",
+)
+
+_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+from service.main import create_app
+imported = time.perf_counter()
+create_app()
+created = time.perf_counter()
+print(json.dumps({
+    "import_ms": (imported - start) * 1000.0,
+    "create_app_ms": (created - imported) * 1000.0,
+    "loaded": [name for name in %r if name in sys.modules],
+}))
+"""
+
+
+def measure_startup(runs: int = 5) -> Dict[str, Any]:
+    """Import and app-creation time of ``service.main`` in fresh interpreters.
+
+    The STAC URL points at a closed port, so any network call made at import
+    time fails the probe instead of being timed.
+    """
+    env = {**os.environ, "STAC_API_URL": "http://127.0.0.1:9/stac", "PROFILING_ENABLED": ""}
+    samples = []
+    for _ in range(runs):
+        completed = subprocess.run(
+            [sys.executable, "-c", _PROBE % (HEAVY_MODULES,)],
+            cwd=PROJECT_ROOT,
+            env=env,
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        samples.append(json.loads(completed.stdout.strip().splitlines()[-1]))
+
+    import_ms = [sample["import_ms"] for sample in samples]
+    create_ms = [sample["create_app_ms"] for sample in samples]
+    return {
+        "runs": runs,
+        "import_ms_p50": float(np.median(import_ms)),
+        "import_ms_max": float(np.max(import_ms)),
+        "create_app_ms_p50": float(np.median(create_ms)),
+        "heavy_modules_loaded": samples[-1]["loaded"],
+    }
+
+
+if __name__ == "__main__":
+    print(json.dumps(measure_startup(), indent=2))
@@ -0,0 +1,121 @@
+from __future__ import annotations
+
+import zlib
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+from flask import Response, request
+
+try:
+    import zstandard
+except ImportError:  # optional dependency
+    zstandard = None
+
+DTYPES = ("float16", "uint8")
+COMPRESSIONS = ("none", "deflate", "zstd")
+UINT8_NODATA = 255
+
+ARRAY_HEADERS = [
+    "X-Array-Shape",
+    "X-Array-Dtype",
+    "X-Array-Scale",
+    "X-Array-Offset",
+    "X-Array-Nodata",
+    "X-Array-Compression",
+    "X-Bounding-Box",
+    "X-Image-Date",
+]
+
+
+def quantize_uint8(array: np.ndarray) -> Tuple[np.ndarray, float, float]:
+    """Map finite values onto 0..254 and NaN onto ``UINT8_NODATA``."""
+    finite = np.isfinite(array)
+    if not finite.any():
+        return np.full(array.shape, UINT8_NODATA, dtype=np.uint8), 1.0, 0.0
+
+    lo = float(np.min(array, where=finite, initial=np.inf))
+    hi = float(np.max(array, where=finite, initial=-np.inf))
+    scale = (hi - lo) / (UINT8_NODATA - 1) or 1.0
+
+    quantized = np.full(array.shape, UINT8_NODATA, dtype=np.uint8)
+    quantized[finite] = np.rint((array[finite] - lo) / scale).astype(np.uint8)
+    return quantized, scale, lo
+
+
+def encode_array(
+    array: np.ndarray,
+    dtype: str = "float16",
+    compression: str = "deflate",
+) -> Tuple[bytes, Dict[str, str]]:
+    """Encode a 2D raster as little-endian bytes plus the headers needed to decode it.
+
+    Decoding is ``value = raw * scale + offset``, with NaN (float16) or
+    ``X-Array-Nodata`` (uint8) marking missing pixels.
+    """
+    if dtype not in DTYPES:
+        raise ValueError(f"Unsupported dtype '{dtype}', expected one of {DTYPES}")
+    if compression not in COMPRESSIONS:
+        raise ValueError(f"Unsupported compression '{compression}', expected one of {COMPRESSIONS}")
+
+    array = np.asarray(array)
+    headers = {
+        "X-Array-Shape": ",".join(str(v) for v in array.shape),
+        "X-Array-Dtype": dtype,
+        "X-Array-Compression": compression,
+    }
+
+    if dtype == "float16":
+        raw = array.astype("<f2")
+        headers.update({"X-Array-Scale": "1.0", "X-Array-Offset": "0.0"})
+    else:
+        raw, scale, offset = quantize_uint8(array)
+        headers.update(
+            {
+                "X-Array-Scale": repr(scale),
+                "X-Array-Offset": repr(offset),
+                "X-Array-Nodata": str(UINT8_NODATA),
+            }
+        )
+
+    payload = np.ascontiguousarray(raw).tobytes()
+    if compression == "deflate":
+        payload = zlib.compress(payload, 6)
+    elif compression == "zstd":
+        if zstandard is None:
+            raise ValueError("zstd compression requires the 'zstandard' package")
+        payload = zstandard.ZstdCompressor(level=3).compress(payload)
+
+    return payload, headers
+
+
+def wants_array_output() -> bool:
+    return request.args.get("format", "png").lower() == "array"
+
+
+def array_output_params() -> Tuple[str, str]:
+    dtype = request.args.get("dtype", "float16").lower()
+    compression = request.args.get("compression", "deflate").lower()
+
+    if dtype not in DTYPES:
+        raise ValueError(f"Unsupported dtype '{dtype}', expected one of {DTYPES}")
+    if compression not in COMPRESSIONS:
+        raise ValueError(f"Unsupported compression '{compression}', expected one of {COMPRESSIONS}")
+    if compression == "zstd" and zstandard is None:
+        raise ValueError("zstd compression requires the 'zstandard' package")
+
+    return dtype, compression
+
+
+def array_response(
+    array: np.ndarray,
+    bbox: Tuple[float, float, float, float],
+    image_date: Optional[str] = None,
+) -> Response:
+    dtype, compression = array_output_params()
+
+    payload, headers = encode_array(array, dtype=dtype, compression=compression)
+    headers["X-Bounding-Box"] = ",".join(repr(float(v)) for v in bbox)
+    if image_date:
+        headers["X-Image-Date"] = image_date
+
+    return Response(payload, mimetype="application/octet-stream", headers=headers)
@@ -0,0 +1,184 @@
+from __future__ import annotations
+
+import math
+import os
+import threading
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+
+from ..metrics import BYTES_READ, timed
+from .cog_reader import gdal_options
+from .conversions import dn_to_celsius, dn_to_scaled, ndvi_from_reflectance, thermal_constants
+from .sas_tokens import get_sas_token_manager
+
+# "memory" reads each band window as one array; "chunked" always loads through odc.stac and dask;
+# "auto" switches to chunked once a bbox would exceed CHUNKED_MIN_PIXELS at Landsat resolution.
+RASTER_BACKEND = os.getenv("RASTER_BACKEND", "memory").strip().lower()
+CHUNKED_MIN_PIXELS = int(os.getenv("CHUNKED_MIN_PIXELS", str(4096 * 4096)))
+RASTER_CHUNK_SIZE = int(os.getenv("RASTER_CHUNK_SIZE", "1024"))
+RASTER_WORKERS = int(os.getenv("RASTER_WORKERS", str(min(os.cpu_count() or 4, 8))))
+# Chunked maps are block-averaged down to this many pixels per side before rendering.
+RENDER_MAX_SIDE = int(os.getenv("RENDER_MAX_SIDE", "2048"))
+
+LANDSAT_RESOLUTION = 30.0
+METRES_PER_DEGREE = 111_320.0
+
+_rio_configured = False
+_rio_lock = threading.Lock()
+
+
+def estimate_pixels(bbox: Tuple[float, float, float, float], resolution: float = LANDSAT_RESOLUTION) -> int:
+    lon_min, lat_min, lon_max, lat_max = bbox
+    height = (lat_max - lat_min) * METRES_PER_DEGREE / resolution
+    width = (lon_max - lon_min) * METRES_PER_DEGREE * math.cos(math.radians((lat_min + lat_max) / 2)) / resolution
+    return int(abs(height * width))
+
+
+def use_chunked(bbox: Optional[Tuple[float, float, float, float]] = None, shape: Optional[Tuple[int, int]] = None) -> bool:
+    if RASTER_BACKEND == "chunked":
+        return True
+    if RASTER_BACKEND != "auto":
+        return False
+    pixels = shape[0] * shape[1] if shape is not None else estimate_pixels(bbox)
+    return pixels >= CHUNKED_MIN_PIXELS
+
+
+def compute(*values):
+    """Evaluate dask values together on a bounded thread pool, sharing reads between them."""
+    import dask
+
+    with dask.config.set(scheduler="threads", num_workers=RASTER_WORKERS):
+        return dask.compute(*values)
+
+
+def gather(*values) -> Tuple[Any, ...]:
+    """Python scalars from numpy or dask reductions; dask ones are computed in a single pass."""
+    if any(hasattr(value, "dask") for value in values):
+        values = compute(*values)
+    return tuple(value.item() if hasattr(value, "item") else value for value in values)
+
+
+def as_chunked(*arrays: np.ndarray):
+    import dask.array as da
+
+    return tuple(da.from_array(array, chunks=RASTER_CHUNK_SIZE) for array in arrays)
+
+
+def _configure_rio() -> None:
+    global _rio_configured
+    with _rio_lock:
+        if not _rio_configured:
+            from odc.stac import configure_rio
+
+            configure_rio(**gdal_options())
+            _rio_configured = True
+
+
+def _load(item, keys, bbox):
+    import odc.stac
+
+    _configure_rio()
+    manager = get_sas_token_manager()
+    collection = item.collection_id
+    dataset = odc.stac.load(
+        [item],
+        bands=keys,
+        bbox=bbox,
+        chunks={"x": RASTER_CHUNK_SIZE, "y": RASTER_CHUNK_SIZE},
+        patch_url=lambda href: manager.sign_href(href, collection),
+    ).isel(time=0)
+    for key in keys:
+        BYTES_READ.inc(dataset[key].data.nbytes, source="cog")
+    return dataset
+
+
+def _profile(dataset, key: str) -> Dict[str, Any]:
+    geobox = dataset.odc.geobox
+    return {
+        "crs": str(geobox.crs),
+        "transform": geobox.affine,
+        "height": geobox.shape[0],
+        "width": geobox.shape[1],
+        "dtype": str(dataset[key].dtype),
+        "nodata": dataset[key].attrs.get("nodata"),
+    }
+
+
+def _converted(dataset, item, key: str, nodata_value=None, apply_scale: bool = False, celsius: bool = False):
+    """The band as a lazy float32 dask array, converted block by block through the DN lookup tables."""
+    asset = item.assets[key]
+    band_info = (asset.extra_fields.get("raster:bands") or [{}])[0]
+    nodata = nodata_value
+    if nodata is None:
+        nodata = dataset[key].attrs.get("nodata", band_info.get("nodata"))
+
+    dn = dataset[key].data
+    if celsius:
+        return dn.map_blocks(dn_to_celsius, *thermal_constants(asset), nodata=nodata, dtype=np.float32)
+    if apply_scale:
+        return dn.map_blocks(
+            dn_to_scaled, band_info.get("scale"), band_info.get("offset"), nodata=nodata, dtype=np.float32
+        )
+    return dn.map_blocks(dn_to_scaled, nodata=nodata, dtype=np.float32)
+
+
+def _materialize(lazy) -> Tuple[np.ndarray, int]:
+    import dask.array as da
+
+    values, missing = compute(lazy, da.isnan(lazy).sum())
+    return values, int(missing)
+
+
+def _asset_key(item, band_substring: str) -> Optional[str]:
+    return next((key for key in item.assets if band_substring in key), None)
+
+
+@timed("chunked_load")
+def load_heat_chunked(item, bbox, nodata_value=0):
+    """Celsius surface temperature of ``item`` over ``bbox`` with its missing-pixel count, read chunk-wise."""
+    key = _asset_key(item, "lwir11")
+    if key is None:
+        return None, None, None, None
+    dataset = _load(item, [key], bbox)
+    celsius, missing = _materialize(_converted(dataset, item, key, nodata_value=nodata_value, celsius=True))
+    return celsius, missing, _profile(dataset, key), item.assets[key]
+
+
+@timed("chunked_load")
+def load_ndvi_chunked(item, bbox):
+    """NDVI of ``item`` over ``bbox`` with its missing-pixel count; red and NIR only exist per chunk."""
+    red_key, nir_key = _asset_key(item, "red"), _asset_key(item, "nir08")
+    if red_key is None or nir_key is None:
+        return None, None, None
+    dataset = _load(item, [red_key, nir_key], bbox)
+    red = _converted(dataset, item, red_key, apply_scale=True)
+    nir = _converted(dataset, item, nir_key, apply_scale=True)
+    ndvi, missing = _materialize(red.map_blocks(ndvi_from_reflectance, nir, dtype=np.float32))
+    return ndvi, missing, _profile(dataset, red_key)
+
+
+def _block_nanmean(block: np.ndarray, factor: int) -> np.ndarray:
+    rows, cols = block.shape[0] // factor, block.shape[1] // factor
+    block = block[: rows * factor, : cols * factor].reshape(rows, factor, cols, factor)
+    valid = ~np.isnan(block)
+    total = np.where(valid, block, 0).sum(axis=(1, 3))
+    count = valid.sum(axis=(1, 3))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return (total / count).astype(np.float32)
+
+
+def overview(array: np.ndarray, max_side: int = RENDER_MAX_SIDE) -> np.ndarray:
+    """Block-mean ``array`` in parallel so neither side exceeds ``max_side`` pixels."""
+    factor = math.ceil(max(array.shape) / max_side)
+    if factor <= 1:
+        return array
+
+    import dask.array as da
+
+    rows, cols = array.shape[0] // factor * factor, array.shape[1] // factor * factor
+    step = max(RASTER_CHUNK_SIZE // factor, 1) * factor
+    lazy = da.from_array(array[:rows, :cols], chunks=step)
+    chunks = tuple(tuple(size // factor for size in axis) for axis in lazy.chunks)
+    (reduced,) = compute(lazy.map_blocks(_block_nanmean, factor, chunks=chunks, dtype=np.float32))
+    return reduced
@@ -0,0 +1,221 @@
+from __future__ import annotations
+
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+import numpy as np
+
+from ..metrics import COG_FETCHED_BYTES, COG_READ_BYTES, COG_READ_REQUESTS, COG_REQUESTS, count_cache
+
+# GDAL settings for range reads of remote COGs; any of them can be overridden from the environment.
+DEFAULT_GDAL_OPTIONS = {
+    # Never list the "directory" of an asset URL looking for sidecar files.
+    "GDAL_DISABLE_READDIR_ON_OPEN": "EMPTY_DIR",
+    "CPL_VSIL_CURL_ALLOWED_EXTENSIONS": ".tif,.TIF,.tiff",
+    # Fetch the whole COG header with the first request.
+    "GDAL_INGESTED_BYTES_AT_OPEN": "65536",
+    # Process-wide LRU of downloaded byte ranges, shared across handles.
+    "CPL_VSIL_CURL_CACHE_SIZE": str(256 * 1024 * 1024),
+    "GDAL_HTTP_MULTIPLEX": "YES",
+    "GDAL_HTTP_VERSION": "2TLS",
+    "GDAL_HTTP_MERGE_CONSECUTIVE_RANGES": "YES",
+    "GDAL_HTTP_MAX_RETRY": "3",
+    "GDAL_HTTP_RETRY_DELAY": "0.5",
+    # Decoded block cache in MB.
+    "GDAL_CACHEMAX": "256",
+}
+DEFAULT_MAX_DATASETS = 12  # a few scenes of three bands each
+
+
+def gdal_options() -> Dict[str, Any]:
+    options = {name: os.getenv(name, value) for name, value in DEFAULT_GDAL_OPTIONS.items()}
+    # rasterio insists on integers for sizes such as GDAL_CACHEMAX.
+    return {name: int(value) if value.isdigit() else value for name, value in options.items()}
+
+
+def unsigned_href(href: str) -> str:
+    """The asset URL without its query string, so re-signed hrefs share one handle."""
+    return href.split("?", 1)[0]
+
+
+class _Handle:
+    __slots__ = ("dataset", "href", "lock", "fetched", "fetched_bytes")
+
+    def __init__(self, dataset, href: str) -> None:
+        self.dataset = dataset
+        self.href = href
+        # Dataset handles are not thread-safe; reads through one handle are serialised.
+        self.lock = threading.Lock()
+        # Blocks already pulled through this handle, which GDAL serves from its caches.
+        self.fetched: Set[Tuple[int, int]] = set()
+        self.fetched_bytes = 0
+
+
+def _block_ranges(dataset, window, fetched: Set[Tuple[int, int]]) -> List[Tuple[int, int]]:
+    """Byte ranges of the not yet fetched tiles under ``window``, merged where contiguous."""
+    block_height, block_width = dataset.block_shapes[0]
+    first_row = max(int(window.row_off) // block_height, 0)
+    first_col = max(int(window.col_off) // block_width, 0)
+    last_row = min(int(window.row_off + window.height - 1) // block_height, (dataset.height - 1) // block_height)
+    last_col = min(int(window.col_off + window.width - 1) // block_width, (dataset.width - 1) // block_width)
+
+    blocks = []
+    for row in range(first_row, last_row + 1):
+        for col in range(first_col, last_col + 1):
+            if (row, col) in fetched:
+                continue
+            fetched.add((row, col))
+            offset = dataset.get_tag_item(f"BLOCK_OFFSET_{col}_{row}", "TIFF", bidx=1)
+            size = dataset.get_tag_item(f"BLOCK_SIZE_{col}_{row}", "TIFF", bidx=1)
+            if offset and size and int(size) > 0:
+                blocks.append((int(offset), int(size)))
+
+    ranges: List[Tuple[int, int]] = []
+    for offset, size in sorted(blocks):
+        if ranges and ranges[-1][0] + ranges[-1][1] == offset:
+            ranges[-1] = (ranges[-1][0], ranges[-1][1] + size)
+        else:
+            ranges.append((offset, size))
+    return ranges
+
+
+class CogReader:
+    """Windowed reads of remote COGs through pooled dataset handles.
+
+    Every open and read runs inside one ``rasterio.Env`` configuration. Handles
+    are kept in an LRU keyed by the unsigned href, so the bands and windows of a
+    scene reuse the parsed header and the connection instead of reopening.
+    Remote traffic is estimated from the TIFF tile index: one request to open,
+    then one per contiguous run of tiles not fetched before. GDAL's cache
+    evictions are not visible, so once a handle has tracked its share of the
+    curl cache its tiles are assumed evicted and count as remote again.
+    """
+
+    def __init__(self, max_datasets: int = DEFAULT_MAX_DATASETS, options: Optional[Dict[str, Any]] = None) -> None:
+        self.max_datasets = max_datasets
+        self.options = dict(options if options is not None else gdal_options())
+        cache_size = int(self.options.get("CPL_VSIL_CURL_CACHE_SIZE") or 0)
+        self.fetched_budget = max(cache_size // max(max_datasets, 1), 1)
+        self._handles: "OrderedDict[str, _Handle]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _acquire(self, href: str) -> Tuple[_Handle, bool]:
+        import rasterio
+
+        key = unsigned_href(href)
+        with self._lock:
+            handle = self._handles.get(key)
+            if handle is not None:
+                self._handles.move_to_end(key)
+        count_cache("cog_dataset", handle is not None)
+        if handle is not None:
+            return handle, True
+
+        dataset = rasterio.open(href)
+        COG_REQUESTS.inc(kind="open")
+        evicted = []
+        with self._lock:
+            existing = self._handles.get(key)
+            if existing is None:
+                handle = self._handles[key] = _Handle(dataset, href)
+                while len(self._handles) > self.max_datasets:
+                    evicted.append(self._handles.popitem(last=False)[1])
+        if existing is not None:
+            # Another thread opened the same asset meanwhile.
+            dataset.close()
+            return existing, True
+        for stale in evicted:
+            self._close(stale)
+        return handle, False
+
+    def _discard(self, href: str, handle: _Handle) -> None:
+        key = unsigned_href(href)
+        with self._lock:
+            if self._handles.get(key) is handle:
+                del self._handles[key]
+        self._close(handle)
+
+    @staticmethod
+    def _close(handle: _Handle) -> None:
+        with handle.lock:
+            handle.dataset.close()
+
+    def _read(self, handle: _Handle, bbox: Tuple[float, float, float, float]) -> Tuple[np.ndarray, Dict[str, Any]]:
+        from rasterio.warp import transform_bounds
+        from rasterio.windows import from_bounds
+
+        with handle.lock:
+            src = handle.dataset
+            bbox_src = transform_bounds("EPSG:4326", src.crs, *bbox, densify_pts=21)
+            window = from_bounds(*bbox_src, transform=src.transform)
+            window = window.round_offsets().round_lengths()
+
+            if handle.fetched_bytes >= self.fetched_budget:
+                handle.fetched.clear()
+                handle.fetched_bytes = 0
+            ranges = _block_ranges(src, window, handle.fetched)
+            handle.fetched_bytes += sum(size for _, size in ranges)
+            data = src.read(1, window=window)
+            profile = src.profile
+            profile.update(
+                {
+                    "height": data.shape[0],
+                    "width": data.shape[1],
+                    "transform": src.window_transform(window),
+                }
+            )
+
+        fetched = sum(size for _, size in ranges)
+        COG_REQUESTS.inc(len(ranges), kind="range")
+        COG_FETCHED_BYTES.inc(fetched)
+        COG_READ_REQUESTS.observe(len(ranges))
+        COG_READ_BYTES.observe(fetched)
+        return data, profile
+
+    def read(self, href: str, bbox: Tuple[float, float, float, float]) -> Tuple[np.ndarray, Dict[str, Any]]:
+        """Band 1 of ``href`` inside the lon/lat ``bbox``, in the asset's native dtype."""
+        import rasterio
+        from rasterio.errors import RasterioIOError
+
+        with rasterio.Env(**self.options):
+            handle, reused = self._acquire(href)
+            try:
+                return self._read(handle, bbox)
+            except RasterioIOError:
+                if not reused:
+                    raise
+                # A pooled handle can outlive its signed URL; reopen once with the current one.
+                self._discard(href, handle)
+                handle, _ = self._acquire(href)
+                return self._read(handle, bbox)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"datasets": len(self._handles), "max_datasets": self.max_datasets}
+
+    def close(self) -> None:
+        with self._lock:
+            handles = list(self._handles.values())
+            self._handles.clear()
+        for handle in handles:
+            self._close(handle)
+
+
+_reader: Optional[CogReader] = None
+_reader_lock = threading.Lock()
+
+
+def set_cog_reader(reader: CogReader) -> None:
+    global _reader
+    with _reader_lock:
+        _reader = reader
+
+
+def get_cog_reader() -> CogReader:
+    global _reader
+    with _reader_lock:
+        if _reader is None:
+            _reader = CogReader(max_datasets=int(os.getenv("COG_MAX_DATASETS", str(DEFAULT_MAX_DATASETS))))
+        return _reader
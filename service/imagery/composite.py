@@ -0,0 +1,146 @@
+from __future__ import annotations
+
+import os
+import time
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from ..metrics import COMPOSITE_SCENES, timed
+
+# "off" keeps the best-single-scene search; "first" fills each pixel from the clearest scene that has it;
+# "median" takes the per-pixel median of scenes within COMPOSITE_WINDOW_DAYS of the clearest one.
+COMPOSITE_MODES = ("off", "first", "median")
+COMPOSITE_MODE = os.getenv("COMPOSITE_MODE", "off").strip().lower()
+COMPOSITE_MAX_SCENES = int(os.getenv("COMPOSITE_MAX_SCENES", "6"))
+COMPOSITE_COVERAGE = float(os.getenv("COMPOSITE_COVERAGE", "99.5"))  # percent of pixels
+COMPOSITE_WINDOW_DAYS = int(os.getenv("COMPOSITE_WINDOW_DAYS", "32"))
+COMPOSITE_WORKERS = int(os.getenv("COMPOSITE_WORKERS", "3"))
+COMPOSITE_TIMEOUT = float(os.getenv("COMPOSITE_TIMEOUT", "120"))
+# A median of fewer scenes is just one of them.
+MEDIAN_MIN_SCENES = 3
+
+SceneLoader = Callable[[Any], Tuple[Optional[np.ndarray], Optional[Dict[str, Any]]]]
+
+
+def item_date(item) -> str:
+    return item.properties["datetime"].split("T")[0]
+
+
+def date_label(dates: Sequence[str]) -> Optional[str]:
+    """One date, or the ISO interval spanned by several."""
+    if not dates:
+        return None
+    first, last = min(dates), max(dates)
+    return first if first == last else f"{first}/{last}"
+
+
+def _grid(scene: np.ndarray, profile: Optional[Dict[str, Any]]) -> Tuple:
+    """Shape, CRS and geotransform; scenes are merged pixel by pixel only when all three agree."""
+    profile = profile or {}
+    transform = profile.get("transform")
+    origin = tuple(round(float(value), 6) for value in tuple(transform)[:6]) if transform is not None else None
+    return scene.shape, str(profile.get("crs")), origin
+
+
+def _candidates(items: List[Any], mode: str, max_scenes: int, window_days: int) -> List[Any]:
+    if mode == "median" and items:
+        anchor = datetime.strptime(item_date(items[0]), "%Y-%m-%d")
+        items = [
+            item for item in items
+            if abs((datetime.strptime(item_date(item), "%Y-%m-%d") - anchor).days) <= window_days
+        ]
+    return items[:max_scenes]
+
+
+@timed("composite")
+def composite_scenes(
+    items: List[Any],
+    load_scene: SceneLoader,
+    mode: str = "first",
+    max_scenes: int = COMPOSITE_MAX_SCENES,
+    coverage: float = COMPOSITE_COVERAGE,
+    window_days: int = COMPOSITE_WINDOW_DAYS,
+    workers: int = COMPOSITE_WORKERS,
+    timeout: float = COMPOSITE_TIMEOUT,
+) -> Tuple[Optional[np.ndarray], Optional[str]]:
+    """Per-pixel composite of up to ``max_scenes`` of ``items``, which come ordered clearest first.
+
+    Scenes are read ``workers`` at a time and merged in order until ``coverage``
+    percent of the pixels are valid; scenes not yet started are then cancelled.
+    Scenes whose shape, CRS or geotransform differ from the first one's are
+    skipped rather than misregistered, and whatever has
+    been merged after ``timeout`` seconds is returned.
+    """
+    if mode not in COMPOSITE_MODES[1:]:
+        raise ValueError(f"Unsupported composite mode '{mode}', expected one of {COMPOSITE_MODES[1:]}")
+
+    candidates = _candidates(items, mode, max_scenes, window_days)
+    if not candidates:
+        return None, None
+
+    deadline = time.monotonic() + timeout
+    pool = ThreadPoolExecutor(max_workers=max(min(workers, len(candidates)), 1), thread_name_prefix="composite")
+    futures = [pool.submit(load_scene, item) for item in candidates]
+
+    composite: Optional[np.ndarray] = None
+    covered: Optional[np.ndarray] = None
+    stack: List[np.ndarray] = []
+    dates: List[str] = []
+    grid = None
+    percent = 0.0
+    try:
+        for item, future in zip(candidates, futures):
+            try:
+                scene, profile = future.result(timeout=max(deadline - time.monotonic(), 0))
+            except FutureTimeoutError:
+                print(f"Composite timed out after {timeout:g}s with {len(dates)} scenes")
+                break
+            except Exception as e:
+                print(f"Skipping scene {item.id}: {e}")
+                continue
+            if scene is None:
+                continue
+
+            scene_grid = _grid(scene, profile)
+            if grid is None:
+                grid = scene_grid
+            elif scene_grid != grid:
+                print(f"Skipping scene {item.id}: grid {scene_grid} does not match {grid}")
+                continue
+
+            dates.append(item_date(item))
+            if mode == "first":
+                if composite is None:
+                    composite = np.array(scene, dtype=np.float32)
+                else:
+                    gaps = np.isnan(composite)
+                    composite[gaps] = scene[gaps]
+                valid = np.count_nonzero(~np.isnan(composite))
+            else:
+                stack.append(scene)
+                covered = ~np.isnan(scene) if covered is None else covered | ~np.isnan(scene)
+                valid = np.count_nonzero(covered)
+
+            percent = 100.0 * valid / scene.size if scene.size else 0.0
+            if percent >= coverage and (mode == "first" or len(stack) >= MEDIAN_MIN_SCENES):
+                break
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    if mode == "median" and stack:
+        with warnings.catch_warnings():
+            # Pixels no scene covers stay NaN.
+            warnings.simplefilter("ignore", RuntimeWarning)
+            composite = np.nanmedian(np.stack(stack), axis=0).astype(np.float32)
+
+    if composite is None:
+        return None, None
+
+    COMPOSITE_SCENES.observe(len(dates), mode=mode)
+    print(f"Composite ({mode}) of {len(dates)} scenes covers {percent:.1f}% of the bbox")
+    return composite, date_label(dates)
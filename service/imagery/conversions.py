@@ -0,0 +1,100 @@
+from __future__ import annotations
+
+from functools import lru_cache
+from typing import Callable, Optional, Tuple
+
+import numpy as np
+
+# Landsat assets are 16-bit, so every per-pixel transform of a DN fits in one table.
+LUT_SIZE = 65536
+LUT_DTYPES = (np.dtype(np.uint8), np.dtype(np.uint16))
+
+KELVIN_OFFSET = 273.15
+
+
+def _scaled(values: np.ndarray, scale=None, offset=None, nodata=None) -> np.ndarray:
+    out = np.array(values, dtype=np.float64)
+    if nodata is not None:
+        out[np.isclose(values, nodata)] = np.nan
+    if scale is not None:
+        out *= scale
+    if offset is not None:
+        out += offset
+    return out
+
+
+def _celsius(values: np.ndarray, scale=None, offset=None, k1=None, k2=None, nodata=None) -> np.ndarray:
+    radiance = _scaled(values, scale, offset, nodata)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        if k1 and k2:
+            kelvin = k2 / np.log((k1 / np.where(radiance > 0, radiance, np.nan)) + 1)
+        else:
+            kelvin = radiance
+        celsius = kelvin - KELVIN_OFFSET
+    celsius[~np.isfinite(celsius)] = np.nan
+    return celsius
+
+
+def thermal_constants(asset) -> Tuple[Optional[float], Optional[float], Optional[float], Optional[float]]:
+    """Scale, offset and the K1/K2 Planck constants of a thermal asset, under any of their STAC names."""
+    band_info = asset.extra_fields.get("raster:bands", [{}])
+    band_meta = band_info[0] if band_info else {}
+    scale = band_meta.get("scale")
+    offset = band_meta.get("offset")
+    k1 = (
+        band_meta.get("thermal:K1")
+        or band_meta.get("therm:K1")
+        or band_meta.get("k1_constant")
+    )
+    k2 = (
+        band_meta.get("thermal:K2")
+        or band_meta.get("therm:K2")
+        or band_meta.get("k2_constant")
+    )
+    return scale, offset, k1, k2
+
+
+def _param(value) -> Optional[float]:
+    return None if value is None else float(value)
+
+
+@lru_cache(maxsize=64)
+def _lut(transform: Callable[..., np.ndarray], *params) -> np.ndarray:
+    lut = transform(np.arange(LUT_SIZE), *params).astype(np.float32)
+    lut.setflags(write=False)
+    return lut
+
+
+def _apply(transform: Callable[..., np.ndarray], dn: np.ndarray, *params) -> np.ndarray:
+    """``transform`` of ``dn`` as float32: one table lookup for 8/16-bit DNs, computed directly otherwise."""
+    params = tuple(_param(value) for value in params)
+    if dn.dtype in LUT_DTYPES:
+        return np.take(_lut(transform, *params), dn)
+    return transform(dn, *params).astype(np.float32)
+
+
+def dn_to_scaled(dn: np.ndarray, scale=None, offset=None, nodata=None) -> np.ndarray:
+    """``dn * scale + offset`` in float32, with NaN where ``dn`` is ``nodata``."""
+    return _apply(_scaled, dn, scale, offset, nodata)
+
+
+def dn_to_celsius(dn: np.ndarray, scale=None, offset=None, k1=None, k2=None, nodata=None) -> np.ndarray:
+    """Thermal DN to degrees Celsius in float32, with NaN for nodata and invalid radiance.
+
+    With ``k1``/``k2`` the scaled DN is treated as radiance and inverted with the
+    Planck relation; without them it is already a brightness temperature in Kelvin.
+    """
+    celsius = _apply(_celsius, dn, scale, offset, k1, k2, nodata)
+    if k1 and k2 and not np.isfinite(celsius).any():
+        # No positive radiance anywhere: fall back to reading the scaled DN as Kelvin.
+        celsius = _apply(_celsius, dn, scale, offset, None, None, nodata)
+    return celsius
+
+
+def ndvi_from_reflectance(red: np.ndarray, nir: np.ndarray) -> np.ndarray:
+    """NDVI of two reflectance arrays, NaN where either is missing or their sum is zero."""
+    with np.errstate(divide="ignore", invalid="ignore"):
+        denominator = nir + red
+        ndvi = (nir - red) / denominator
+    ndvi[np.abs(denominator) <= 1e-8] = np.nan
+    return ndvi
@@ -0,0 +1,186 @@
+from __future__ import annotations
+
+import io
+import math
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from ..metrics import timed
+
+TILE_SIZE = 256
+
+LAYERS: Dict[str, Dict[str, Any]] = {
+    "heat": {"data_type": "heat_map", "cmap": "inferno", "vmin": -10, "vmax": 40},
+    "ndvi": {"data_type": "ndvi_map", "cmap": "RdYlGn", "vmin": -1, "vmax": 1},
+    "simulated": {"data_type": "simulated_heat_map", "cmap": "inferno", "vmin": -10, "vmax": 40},
+}
+
+
+def tile_bounds(z: int, x: int, y: int) -> Tuple[float, float, float, float]:
+    """Return (lon_min, lat_min, lon_max, lat_max) of a web-mercator XYZ tile."""
+    n = 2 ** z
+    lon_min = x / n * 360.0 - 180.0
+    lon_max = (x + 1) / n * 360.0 - 180.0
+    lat_max = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * y / n))))
+    lat_min = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * (y + 1) / n))))
+    return lon_min, lat_min, lon_max, lat_max
+
+
+def _downsample(array: np.ndarray) -> np.ndarray:
+    rows, cols = array.shape
+    padded = np.full((rows + rows % 2, cols + cols % 2), np.nan, dtype=np.float32)
+    padded[:rows, :cols] = array
+    blocks = padded.reshape(padded.shape[0] // 2, 2, padded.shape[1] // 2, 2)
+
+    valid = np.isfinite(blocks)
+    counts = valid.sum(axis=(1, 3))
+    sums = np.where(valid, blocks, 0).sum(axis=(1, 3))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(counts > 0, sums / counts, np.nan).astype(np.float32)
+
+
+@timed("tile_pyramid")
+def build_pyramid(array: np.ndarray, min_size: int = TILE_SIZE) -> List[np.ndarray]:
+    """Full-resolution raster followed by NaN-aware 2x mean overviews."""
+    levels = [np.asarray(array, dtype=np.float32)]
+    while max(levels[-1].shape) > min_size:
+        levels.append(_downsample(levels[-1]))
+    return levels
+
+
+def _select_level(pyramid: List[np.ndarray], bbox: Tuple[float, float, float, float], z: int) -> int:
+    lon_min, _, lon_max, _ = bbox
+    raster_res = (lon_max - lon_min) / pyramid[0].shape[1]
+    tile_res = 360.0 / (2 ** z) / TILE_SIZE
+    if raster_res <= 0:
+        return 0
+    level = int(math.floor(math.log2(max(tile_res / raster_res, 1.0))))
+    return min(level, len(pyramid) - 1)
+
+
+def sample_tile(
+    pyramid: List[np.ndarray],
+    bbox: Tuple[float, float, float, float],
+    z: int,
+    x: int,
+    y: int,
+) -> Optional[np.ndarray]:
+    """Nearest-neighbour resample of the pyramid onto a TILE_SIZE x TILE_SIZE tile, or None if disjoint."""
+    lon_min, lat_min, lon_max, lat_max = bbox
+    t_lon_min, t_lat_min, t_lon_max, t_lat_max = tile_bounds(z, x, y)
+    if t_lon_max <= lon_min or t_lon_min >= lon_max or t_lat_max <= lat_min or t_lat_min >= lat_max:
+        return None
+
+    level = pyramid[_select_level(pyramid, bbox, z)]
+    rows, cols = level.shape
+
+    n = 2 ** z
+    pixel = (np.arange(TILE_SIZE) + 0.5) / TILE_SIZE
+    lons = (x + pixel) / n * 360.0 - 180.0
+    lats = np.degrees(np.arctan(np.sinh(np.pi * (1 - 2 * (y + pixel) / n))))
+
+    col_idx = np.floor((lons - lon_min) / (lon_max - lon_min) * cols).astype(np.int64)
+    row_idx = np.floor((lat_max - lats) / (lat_max - lat_min) * rows).astype(np.int64)
+    col_ok = (col_idx >= 0) & (col_idx < cols)
+    row_ok = (row_idx >= 0) & (row_idx < rows)
+
+    tile = level[np.clip(row_idx, 0, rows - 1)[:, None], np.clip(col_idx, 0, cols - 1)[None, :]]
+    return np.where(row_ok[:, None] & col_ok[None, :], tile, np.nan)
+
+
+@timed("render_tile")
+def encode_png(values: Optional[np.ndarray], cmap: str, vmin: float, vmax: float) -> bytes:
+    from matplotlib import colormaps
+    from matplotlib.colors import Normalize
+    from PIL import Image
+
+    if values is None:
+        values = np.full((TILE_SIZE, TILE_SIZE), np.nan, dtype=np.float32)
+
+    rgba = colormaps[cmap](Normalize(vmin=vmin, vmax=vmax, clip=True)(values), bytes=True)
+    rgba[..., 3] = np.where(np.isfinite(values), 255, 0)
+
+    buffer = io.BytesIO()
+    Image.fromarray(rgba, "RGBA").save(buffer, format="png")
+    return buffer.getvalue()
+
+
+class TileCache:
+    """Overview pyramids per session layer revision plus an LRU of rendered tiles."""
+
+    def __init__(self, max_pyramid_bytes: int = 512 * 1024 * 1024, max_tile_bytes: int = 64 * 1024 * 1024) -> None:
+        self.max_pyramid_bytes = max_pyramid_bytes
+        self.max_tile_bytes = max_tile_bytes
+
+        self._pyramids: "OrderedDict[Tuple, Tuple[List[np.ndarray], Tuple[float, float, float, float]]]" = OrderedDict()
+        self._pyramid_bytes = 0
+        self._tiles: "OrderedDict[Tuple, bytes]" = OrderedDict()
+        self._tile_bytes = 0
+        self._lock = threading.Lock()
+
+    def get_pyramid(self, key: Tuple) -> Optional[Tuple[List[np.ndarray], Tuple[float, float, float, float]]]:
+        with self._lock:
+            cached = self._pyramids.get(key)
+            if cached is not None:
+                self._pyramids.move_to_end(key)
+            return cached
+
+    def put_pyramid(
+        self,
+        key: Tuple,
+        pyramid: List[np.ndarray],
+        bbox: Tuple[float, float, float, float],
+    ) -> None:
+        nbytes = sum(level.nbytes for level in pyramid)
+        with self._lock:
+            previous = self._pyramids.pop(key, None)
+            if previous is not None:
+                self._pyramid_bytes -= sum(level.nbytes for level in previous[0])
+            self._pyramids[key] = (pyramid, bbox)
+            self._pyramid_bytes += nbytes
+            # The newest pyramid stays even when it alone exceeds the budget; its tiles are being requested.
+            while self._pyramid_bytes > self.max_pyramid_bytes and len(self._pyramids) > 1:
+                _, (evicted, _) = self._pyramids.popitem(last=False)
+                self._pyramid_bytes -= sum(level.nbytes for level in evicted)
+
+    def get_tile(self, key: Tuple) -> Optional[bytes]:
+        with self._lock:
+            tile = self._tiles.get(key)
+            if tile is not None:
+                self._tiles.move_to_end(key)
+            return tile
+
+    def put_tile(self, key: Tuple, tile: bytes) -> None:
+        with self._lock:
+            previous = self._tiles.pop(key, None)
+            if previous is not None:
+                self._tile_bytes -= len(previous)
+            self._tiles[key] = tile
+            self._tile_bytes += len(tile)
+            while self._tile_bytes > self.max_tile_bytes:
+                _, evicted = self._tiles.popitem(last=False)
+                self._tile_bytes -= len(evicted)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "pyramids": len(self._pyramids),
+                "pyramid_bytes": self._pyramid_bytes,
+                "max_pyramid_bytes": self.max_pyramid_bytes,
+                "tiles": len(self._tiles),
+                "bytes": self._tile_bytes,
+                "max_bytes": self.max_tile_bytes,
+            }
+
+
+_tile_cache = TileCache(
+    max_pyramid_bytes=int(float(os.getenv("TILE_PYRAMID_CACHE_MAX_MB", "512")) * 1024 * 1024),
+)
+
+
+def get_tile_cache() -> TileCache:
+    return _tile_cache
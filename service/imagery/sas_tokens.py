@@ -0,0 +1,203 @@
+from __future__ import annotations
+
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, Optional, Set, Tuple
+from urllib.parse import urlparse
+
+from ..metrics import SAS_TOKEN_REQUESTS
+
+SAS_TOKEN_URL = os.getenv("SAS_TOKEN_URL", "https://planetarycomputer.microsoft.com/api/sas/v1/token")
+# Hosts whose asset hrefs need a token; anything else is passed through unsigned.
+SAS_SIGNED_HOSTS = tuple(
+    host.strip() for host in os.getenv("SAS_SIGNED_HOSTS", ".blob.core.windows.net").split(",") if host.strip()
+)
+# Tokens are refreshed this many seconds before they expire.
+SAS_REFRESH_MARGIN = float(os.getenv("SAS_REFRESH_MARGIN", "600"))
+
+
+class SasToken:
+    __slots__ = ("token", "expiry", "refresh_at")
+
+    def __init__(self, token: str, expiry: float) -> None:
+        self.token = token
+        self.expiry = expiry  # epoch seconds
+        self.refresh_at = expiry
+
+
+def _parse_expiry(value: str) -> float:
+    return datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
+
+
+def fetch_planetary_computer_token(collection: str) -> SasToken:
+    """Ask the Planetary Computer SAS endpoint for a read token covering ``collection``."""
+    import requests
+
+    headers = {}
+    subscription_key = os.getenv("PC_SDK_SUBSCRIPTION_KEY")
+    if subscription_key:
+        headers["Ocp-Apim-Subscription-Key"] = subscription_key
+    response = requests.get(f"{SAS_TOKEN_URL.rstrip('/')}/{collection}", headers=headers, timeout=30)
+    response.raise_for_status()
+    payload = response.json()
+    return SasToken(payload["token"], _parse_expiry(payload["msft:expiry"]))
+
+
+class StaticTokenFetcher:
+    """Hands out a fixed token valid for ``ttl`` seconds, counting the calls; for tests and offline runs."""
+
+    def __init__(self, token: str = "st=stand-in&sig=stand-in", ttl: float = 3600.0) -> None:
+        self.token = token
+        self.ttl = ttl
+        self.calls: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, collection: str) -> SasToken:
+        with self._lock:
+            self.calls[collection] = self.calls.get(collection, 0) + 1
+        return SasToken(self.token, time.time() + self.ttl)
+
+
+class SasTokenManager:
+    """Caches one SAS token per collection and signs asset hrefs locally.
+
+    A cached token is used until ``refresh_margin`` seconds before expiry, or
+    half way through its life for short-lived tokens. From then on the old
+    token is still handed out while a background thread fetches the next one.
+    Only a missing or expired token makes the caller wait, and concurrent
+    callers for one collection share that single fetch.
+    """
+
+    def __init__(
+        self,
+        fetch: Callable[[str], SasToken] = fetch_planetary_computer_token,
+        refresh_margin: float = SAS_REFRESH_MARGIN,
+        signed_hosts: Tuple[str, ...] = SAS_SIGNED_HOSTS,
+    ) -> None:
+        self.refresh_margin = refresh_margin
+        self.signed_hosts = signed_hosts
+        self._fetch = fetch
+        self._tokens: Dict[str, SasToken] = {}
+        self._refreshing: Set[str] = set()
+        self._fetch_locks: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+        self._signed_netlocs: Dict[str, bool] = {}
+
+    def _fetch_lock(self, collection: str) -> threading.Lock:
+        with self._lock:
+            return self._fetch_locks.setdefault(collection, threading.Lock())
+
+    def _refresh(self, collection: str, background: bool) -> Optional[SasToken]:
+        try:
+            token = self._fetch(collection)
+        except Exception as e:
+            SAS_TOKEN_REQUESTS.inc(collection=collection, outcome="error")
+            if not background:
+                raise
+            print(f"Background SAS token refresh for {collection} failed: {e}")
+            return None
+        finally:
+            if background:
+                with self._lock:
+                    self._refreshing.discard(collection)
+        SAS_TOKEN_REQUESTS.inc(collection=collection, outcome="ok")
+        # Short-lived tokens are refreshed half way through rather than right away.
+        now = time.time()
+        token.refresh_at = max(token.expiry - self.refresh_margin, now + (token.expiry - now) / 2)
+        # A plain dict assignment, so readers never need the lock.
+        self._tokens[collection] = token
+        return token
+
+    def _refresh_in_background(self, collection: str) -> None:
+        with self._lock:
+            if collection in self._refreshing:
+                return
+            self._refreshing.add(collection)
+        threading.Thread(
+            target=self._refresh, args=(collection, True), name=f"sas-refresh-{collection}", daemon=True
+        ).start()
+
+    def token(self, collection: str) -> str:
+        cached = self._tokens.get(collection)
+        now = time.time()
+        if cached is not None and now < cached.refresh_at:
+            return cached.token
+        if cached is not None and now < cached.expiry:
+            self._refresh_in_background(collection)
+            return cached.token
+
+        with self._fetch_lock(collection):
+            cached = self._tokens.get(collection)
+            if cached is not None and time.time() < cached.expiry:
+                return cached.token
+            return self._refresh(collection, background=False).token
+
+    def needs_signing(self, href: str) -> bool:
+        base = href.split("?", 1)[0]
+        netloc = base.split("/", 3)[2] if "://" in base else ""
+        signed = self._signed_netlocs.get(netloc)
+        if signed is None:
+            host = urlparse(base).hostname or ""
+            signed = self._signed_netlocs[netloc] = any(
+                host == pattern.lstrip(".") or host.endswith(pattern) for pattern in self.signed_hosts
+            )
+        return signed
+
+    def sign_href(self, href: str, collection: str) -> str:
+        """``href`` with the current token of ``collection`` in place of any query string."""
+        if not self.needs_signing(href):
+            return href
+        cached = self._tokens.get(collection)
+        if cached is not None and time.time() < cached.refresh_at:
+            token = cached.token
+        else:
+            token = self.token(collection)
+        return href.split("?", 1)[0] + "?" + token
+
+    def sign_item(self, item) -> None:
+        collection = item.collection_id
+        if collection is None:
+            return
+        for asset in item.assets.values():
+            asset.href = self.sign_href(asset.href, collection)
+
+    def sign_dict(self, item: Dict[str, Any]) -> None:
+        collection = item.get("collection")
+        if collection is None:
+            return
+        for asset in item.get("assets", {}).values():
+            asset["href"] = self.sign_href(asset["href"], collection)
+
+    def sign_inplace(self, obj) -> None:
+        """Sign a pystac Item, ItemCollection or raw item / feature collection; usable as a STAC client modifier."""
+        if isinstance(obj, dict):
+            if "features" in obj:
+                for feature in obj["features"]:
+                    self.sign_dict(feature)
+            else:
+                self.sign_dict(obj)
+        elif hasattr(obj, "collection_id") and hasattr(obj, "assets"):
+            self.sign_item(obj)
+        elif isinstance(getattr(obj, "items", None), list):
+            for item in obj.items:
+                self.sign_item(item)
+
+
+_manager: Optional[SasTokenManager] = None
+_manager_lock = threading.Lock()
+
+
+def set_sas_token_manager(manager: SasTokenManager) -> None:
+    global _manager
+    with _manager_lock:
+        _manager = manager
+
+
+def get_sas_token_manager() -> SasTokenManager:
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            _manager = SasTokenManager()
+        return _manager
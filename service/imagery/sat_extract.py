@@ -1,35 +1,71 @@
+import io
 import os
+import threading
 from datetime import datetime, timedelta
 
-import matplotlib
-matplotlib.use("Agg")
-import matplotlib.pyplot as plt
 import numpy as np
-import odc.stac
-import planetary_computer as pc
-import rasterio
-import requests
-import tempfile
-import xarray as xr
-from geopy.geocoders import Nominatim
 from typing import Optional, Tuple
 
-from pystac_client import Client
-from rasterio.errors import RasterioIOError
-from rasterio.session import AWSSession
-from rasterio.windows import from_bounds
-from rasterio.warp import transform_bounds
-
+from ..metrics import BYTES_READ, timed
+from .cog_reader import get_cog_reader
+from .chunked import load_heat_chunked, load_ndvi_chunked, overview, use_chunked
+from .composite import COMPOSITE_MODE, composite_scenes
+from .conversions import dn_to_celsius, dn_to_scaled, ndvi_from_reflectance, thermal_constants
+from .sas_tokens import get_sas_token_manager
 from .session_store import store_session_data
 
-catalog = Client.open(
-    "https://planetarycomputer.microsoft.com/api/stac/v1",
-    modifier=pc.sign_inplace
-)
+STAC_API_URL = os.getenv("STAC_API_URL", "https://planetarycomputer.microsoft.com/api/stac/v1")
+STAC_POOL_SIZE = int(os.getenv("STAC_POOL_SIZE", "16"))
+NOMINATIM_DOMAIN = os.getenv("NOMINATIM_DOMAIN", "nominatim.openstreetmap.org")
+NOMINATIM_SCHEME = os.getenv("NOMINATIM_SCHEME", "https")
+
+# Heavy clients are created on first use so importing the service needs neither network nor their imports.
+_catalog = None
+_geolocator = None
+_clients_lock = threading.Lock()
+
+
+def get_catalog():
+    """The shared STAC client, opened on first use; its HTTP session keeps up to ``STAC_POOL_SIZE`` connections."""
+    global _catalog
+    with _clients_lock:
+        if _catalog is None:
+            from pystac_client import Client
+            from pystac_client.stac_api_io import StacApiIO
+            from requests.adapters import HTTPAdapter
+            from urllib3.util.retry import Retry
+
+            stac_io = StacApiIO(max_retries=None)
+            adapter = HTTPAdapter(
+                pool_connections=STAC_POOL_SIZE,
+                pool_maxsize=STAC_POOL_SIZE,
+                max_retries=Retry(total=5, backoff_factor=0.5, status_forcelist=(429, 502, 503, 504), allowed_methods=None),
+            )
+            stac_io.session.mount("http://", adapter)
+            stac_io.session.mount("https://", adapter)
+            _catalog = Client.open(STAC_API_URL, modifier=get_sas_token_manager().sign_inplace, stac_io=stac_io)
+        return _catalog
+
+
+def set_catalog(catalog) -> None:
+    global _catalog
+    with _clients_lock:
+        _catalog = catalog
+
+
+def get_geolocator():
+    global _geolocator
+    with _clients_lock:
+        if _geolocator is None:
+            from geopy.geocoders import Nominatim
+
+            _geolocator = Nominatim(user_agent="city_bbox_lookup", timeout=None, domain=NOMINATIM_DOMAIN, scheme=NOMINATIM_SCHEME)
+        return _geolocator
 
-geolocator = Nominatim(user_agent="city_bbox_lookup", timeout=None)
+
+@timed("geocode")
 def geocode_city(city):
-    location = geolocator.geocode(city, exactly_one=True)
+    location = get_geolocator().geocode(city, exactly_one=True)
 
     # Extract bounding box (min_lat, max_lat, min_lon, max_lon)
     bbox = location.raw["boundingbox"]
@@ -39,12 +75,13 @@ def geocode_city(city):
     return lon_min, lat_min, lon_max, lat_max
 
 
+@timed("stac_search")
 def search_landsat_items(date, bbox):
     target_date = datetime.strptime(date, "%Y-%m-%d")
     start_date = str(target_date - timedelta(days=0)).split(" ")[0]
     end_date = str(target_date + timedelta(days=3000)).split(" ")[0]
 
-    search = catalog.search(
+    search = get_catalog().search(
         collections=["landsat-c2-l2"],
         bbox=bbox,
         datetime=f"{start_date}/{end_date}",
@@ -60,42 +97,28 @@ def search_landsat_items(date, bbox):
     return items
 
 
+@timed("cog_read")
 def crop_asset(asset_href, lon_min, lat_min, lon_max, lat_max, verbose=True):
-    try:
-        with rasterio.open(asset_href) as src:
-            if verbose:
-                print("Loading data...")
-
-            bbox_src = transform_bounds(
-                "EPSG:4326",
-                src.crs,
-                lon_min,
-                lat_min,
-                lon_max,
-                lat_max,
-                densify_pts=21,
-            )
+    from rasterio.errors import RasterioIOError
 
-            window = from_bounds(*bbox_src, transform=src.transform)
-            window = window.round_offsets().round_lengths()
-
-            data = src.read(1, window=window).astype(float)
-            profile = src.profile
-            profile.update(
-                {
-                    "height": data.shape[0],
-                    "width": data.shape[1],
-                    "transform": src.window_transform(window),
-                }
-            )
+    if verbose:
+        print("Loading data...")
+    try:
+        data, profile = get_cog_reader().read(asset_href, (lon_min, lat_min, lon_max, lat_max))
     except RasterioIOError as exc:
         if verbose:
             print(f"Failed to open asset {asset_href}: {exc}")
         return None, None
 
+    BYTES_READ.inc(data.nbytes, source="cog")
     return data, profile
 
-def load_band(item, band_substring, bbox, apply_scale=False, nodata_value=0, verbose=True):
+def load_band(item, band_substring, bbox, apply_scale=False, nodata_value=0, verbose=True, celsius=False):
+    """Crop one band of ``item`` to ``bbox`` as float32 with NaN for nodata.
+
+    ``apply_scale`` applies the asset's scale and offset; ``celsius`` converts
+    thermal DNs straight to degrees Celsius instead.
+    """
     lon_min, lat_min, lon_max, lat_max = bbox
     asset = next(
         (asset for key, asset in item.assets.items() if band_substring in key), None
@@ -104,76 +127,84 @@ def load_band(item, band_substring, bbox, apply_scale=False, nodata_value=0, ver
     if asset is None:
         return None, None, None
 
-    signed_asset = pc.sign(asset)
-    data, profile = crop_asset(signed_asset.href, lon_min, lat_min, lon_max, lat_max, verbose=verbose)
+    href = get_sas_token_manager().sign_href(asset.href, item.collection_id)
+    data, profile = crop_asset(href, lon_min, lat_min, lon_max, lat_max, verbose=verbose)
 
     if data is None or profile is None:
         return None, None, None
 
+    band_info = asset.extra_fields.get("raster:bands", [{}])
     inferred_nodata = nodata_value
     if inferred_nodata is None:
         inferred_nodata = profile.get("nodata")
         if inferred_nodata is None:
-            band_info = asset.extra_fields.get("raster:bands", [{}])
             inferred_nodata = band_info[0].get("nodata")
 
-    if inferred_nodata is not None:
-        data = np.where(np.isclose(data, inferred_nodata), np.nan, data)
-
-    if apply_scale:
-        band_info = asset.extra_fields.get("raster:bands", [{}])
-        scale = band_info[0].get("scale")
-        offset = band_info[0].get("offset")
-        if scale is not None:
-            data = data * scale
-        if offset is not None:
-            data = data + offset
+    if celsius:
+        data = convert_to_celsius(asset, data, nodata=inferred_nodata)
+    elif apply_scale:
+        data = dn_to_scaled(data, band_info[0].get("scale"), band_info[0].get("offset"), nodata=inferred_nodata)
+    else:
+        data = dn_to_scaled(data, nodata=inferred_nodata)
 
     return data, profile, asset
 
 
-def _extract_thermal_constants(asset):
-    band_info = asset.extra_fields.get("raster:bands", [{}])
-    band_meta = band_info[0] if band_info else {}
-    scale = band_meta.get("scale")
-    offset = band_meta.get("offset")
-    k1 = (
-        band_meta.get("thermal:K1")
-        or band_meta.get("therm:K1")
-        or band_meta.get("k1_constant")
-    )
-    k2 = (
-        band_meta.get("thermal:K2")
-        or band_meta.get("therm:K2")
-        or band_meta.get("k2_constant")
-    )
-    return scale, offset, k1, k2
+@timed("celsius_conversion")
+def convert_to_celsius(asset, thermal_dn, nodata=None):
+    scale, offset, k1, k2 = thermal_constants(asset)
+    return dn_to_celsius(thermal_dn, scale, offset, k1, k2, nodata=nodata)
 
 
-def convert_to_celsius(asset, thermal_dn):
-    scale, offset, k1, k2 = _extract_thermal_constants(asset)
+@timed("render_png")
+def _render_png(array: np.ndarray, cmap: str, vmin: float, vmax: float) -> bytes:
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
 
-    radiance = thermal_dn.astype(float)
+    fig, ax = plt.subplots(figsize=(10, 8))
+    ax.imshow(array, cmap=cmap, vmin=vmin, vmax=vmax)
+    ax.axis("off")
 
-    if scale is not None:
-        radiance = radiance * scale
-    if offset is not None:
-        radiance = radiance + offset
+    buffer = io.BytesIO()
+    fig.savefig(
+        buffer,
+        format="png",
+        bbox_inches="tight",
+        pad_inches=0,
+    )
+    plt.close(fig)
+    return buffer.getvalue()
 
-    with np.errstate(divide="ignore", invalid="ignore"):
-        if k1 and k2 and np.any(radiance > 0):
-            adjusted = np.where(radiance > 0, radiance, np.nan)
-            temp_kelvin = k2 / np.log((k1 / adjusted) + 1)
-        else:
-            temp_kelvin = radiance
 
-    temp_celsius = temp_kelvin - 273.15
-    temp_celsius = np.where(np.isfinite(temp_celsius), temp_celsius, np.nan)
+def _heat_scene(item, bbox, chunked):
+    if chunked:
+        thermal_c, _, profile, _ = load_heat_chunked(item, bbox)
+    else:
+        thermal_c, profile, _ = load_band(item, "lwir11", bbox, celsius=True)
+    return thermal_c, profile
 
-    return temp_celsius
+
+def _ndvi_scene(item, bbox, chunked):
+    if chunked:
+        ndvi, _, profile = load_ndvi_chunked(item, bbox)
+        return ndvi, profile
+    red, profile, _ = load_band(item, "red", bbox, apply_scale=True, nodata_value=None)
+    nir, _, _ = load_band(item, "nir08", bbox, apply_scale=True, nodata_value=None)
+    if red is None or nir is None:
+        return None, None
+    return ndvi_from_reflectance(red, nir), profile
+
+
+def _load_composite(items, bbox, data_type, load_scene, mode, session_id):
+    data, asset_date = composite_scenes(items, load_scene, mode=mode)
+    if data is None:
+        return None, None, None
+    store_session_data(session_id, data_type, data, asset_date, bbox)
+    return data, asset_date, bbox
 
 
-def get_heat_map(date, city, session_id: Optional[str] = None):
+def load_heat_map(date, city, session_id: Optional[str] = None, composite: Optional[str] = None):
     bbox = geocode_city(city)
     items = search_landsat_items(date, bbox)
 
@@ -181,17 +212,24 @@ def get_heat_map(date, city, session_id: Optional[str] = None):
         print("No items found")
         return None, None, None
 
-    best_image_bytes, best_asset_date, best_bbox = None, None, None
+    chunked = use_chunked(bbox)
+    mode = composite or COMPOSITE_MODE
+    if mode != "off":
+        return _load_composite(items, bbox, "heat_map", lambda item: _heat_scene(item, bbox, chunked), mode, session_id)
+
+    best_map, best_asset_date, best_bbox = None, None, None
     min_missing = float('inf')
 
     for item in items:
-        thermal_dn, profile, asset = load_band(item, "lwir11", bbox, apply_scale=False)
-
-        if thermal_dn is None:
-            continue
-
-        thermal_c = convert_to_celsius(asset, thermal_dn)
-        missing_pixels = int(np.isnan(thermal_c).sum())
+        if chunked:
+            thermal_c, missing_pixels, profile, asset = load_heat_chunked(item, bbox)
+            if thermal_c is None:
+                continue
+        else:
+            thermal_c, profile, asset = load_band(item, "lwir11", bbox, celsius=True)
+            if thermal_c is None:
+                continue
+            missing_pixels = int(np.isnan(thermal_c).sum())
 
         if missing_pixels < min_missing:
             min_missing = missing_pixels
@@ -202,67 +240,66 @@ def get_heat_map(date, city, session_id: Optional[str] = None):
 
         store_session_data(session_id, "heat_map", thermal_c, asset_date, bbox)
 
-        fig, ax = plt.subplots(figsize=(10, 8))
-        ax.imshow(thermal_c, cmap="inferno", vmin=-10, vmax=40)
-        ax.axis("off")
+        best_map = thermal_c
+        best_asset_date = asset_date
+        best_bbox = bbox
 
-        output_path = f"heat_map_{city}_{asset_date}.png"
-        fig.savefig(
-            output_path,
-            bbox_inches="tight",
-            pad_inches=0,
-        )
-        plt.close(fig)
+        if missing_pixels == 0:
+            break
 
-        with open(output_path, "rb") as file:
-            image_bytes = file.read()
+    return best_map, best_asset_date, best_bbox
 
-        os.remove(output_path)
 
-        best_image_bytes = image_bytes
-        best_asset_date = asset_date
-        best_bbox = bbox
+def get_heat_map(date, city, session_id: Optional[str] = None, composite: Optional[str] = None):
+    thermal_c, asset_date, bbox = load_heat_map(date, city, session_id=session_id, composite=composite)
 
-        if missing_pixels == 0:
-            return image_bytes, asset_date, bbox
+    if thermal_c is None:
+        return None, None, None
 
-    return best_image_bytes, best_asset_date, best_bbox
+    if use_chunked(shape=thermal_c.shape):
+        thermal_c = overview(thermal_c)
+    return _render_png(thermal_c, "inferno", -10, 40), asset_date, bbox
 
 
-def get_ndvi_map(date, city, session_id: Optional[str] = None):
+def load_ndvi_map(date, city, session_id: Optional[str] = None, composite: Optional[str] = None):
     bbox = geocode_city(city)
     items = search_landsat_items(date, bbox)
 
-    best_image_bytes, best_asset_date, best_bbox = None, None, None
+    best_map, best_asset_date, best_bbox = None, None, None
     min_missing = float('inf')
 
     if len(items) == 0:
         print("No items found")
         return None, None, None
 
+    chunked = use_chunked(bbox)
+    mode = composite or COMPOSITE_MODE
+    if mode != "off":
+        return _load_composite(items, bbox, "ndvi_map", lambda item: _ndvi_scene(item, bbox, chunked), mode, session_id)
+
     for item in items:
-        red, profile_red, red_asset = load_band(
-            item, "red", bbox, apply_scale=True, nodata_value=None
-        )
-        nir, profile_nir, nir_asset = load_band(
-            item, "nir08", bbox, apply_scale=True, nodata_value=None
-        )
-
-        if red is None or nir is None:
-            continue
+        if chunked:
+            ndvi, missing_pixels, profile = load_ndvi_chunked(item, bbox)
+            if ndvi is None:
+                continue
+        else:
+            red, profile_red, red_asset = load_band(
+                item, "red", bbox, apply_scale=True, nodata_value=None
+            )
+            nir, profile_nir, nir_asset = load_band(
+                item, "nir08", bbox, apply_scale=True, nodata_value=None
+            )
 
-        missing_pixels = int(np.isnan(red).sum() + np.isnan(nir).sum())
+            if red is None or nir is None:
+                continue
 
-        if missing_pixels > 0 and missing_pixels >= min_missing:
-            continue
+            missing_pixels = int(np.isnan(red).sum() + np.isnan(nir).sum())
 
-        ndvi_denominator = nir + red
-        mask = np.isclose(ndvi_denominator, 0) | np.isnan(nir) | np.isnan(red)
-        ndvi = np.empty_like(nir, dtype=float)
-        ndvi[:] = np.nan
-        ndvi[~mask] = (nir[~mask] - red[~mask]) / ndvi_denominator[~mask]
+            if missing_pixels > 0 and missing_pixels >= min_missing:
+                continue
 
-        missing_pixels = int(np.isnan(ndvi).sum())
+            ndvi = ndvi_from_reflectance(red, nir)
+            missing_pixels = int(np.isnan(ndvi).sum())
 
         if missing_pixels >= min_missing:
             continue
@@ -273,27 +310,22 @@ def get_ndvi_map(date, city, session_id: Optional[str] = None):
 
         store_session_data(session_id, "ndvi_map", ndvi, asset_date, bbox)
 
-        fig, ax = plt.subplots(figsize=(10, 8))
-        ax.imshow(ndvi, cmap="RdYlGn", vmin=-1, vmax=1)
-        ax.axis("off")
-        output_path = f"ndvi_map_{city}_{asset_date}.png"
-        fig.savefig(
-            output_path,
-            bbox_inches="tight",
-            pad_inches=0,
-        )
-        plt.close(fig)
-
-        with open(output_path, "rb") as file:
-            image_bytes = file.read()
-
-        os.remove(output_path)
-
-        best_image_bytes = image_bytes
+        best_map = ndvi
         best_asset_date = asset_date
         best_bbox = bbox
 
         if missing_pixels == 0:
-            return image_bytes, asset_date, bbox
+            break
+
+    return best_map, best_asset_date, best_bbox
+
+
+def get_ndvi_map(date, city, session_id: Optional[str] = None, composite: Optional[str] = None):
+    ndvi, asset_date, bbox = load_ndvi_map(date, city, session_id=session_id, composite=composite)
+
+    if ndvi is None:
+        return None, None, None
 
-    return best_image_bytes, best_asset_date, best_bbox
+    if use_chunked(shape=ndvi.shape):
+        ndvi = overview(ndvi)
+    return _render_png(ndvi, "RdYlGn", -1, 1), asset_date, bbox
@@ -0,0 +1,441 @@
+from __future__ import annotations
+
+import argparse
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date as Date
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+
+from ..metrics import SCENE_STATS_INGESTED, timed
+from .composite import item_date
+from .conversions import ndvi_from_reflectance
+
+DEFAULT_STATS_PATH = Path(__file__).resolve().parent.parent / "data" / "scene_stats.sqlite"
+DEFAULT_CITIES = "Brampton, ON, Canada;Mississauga, ON, Canada;Toronto, ON, Canada"
+HEAT_PERCENTILES = (10, 50, 90)
+
+# Rows in these states are not fetched again; "error" rows are retried on the next pass.
+DONE_STATUSES = ("ok", "rejected")
+
+STAT_COLUMNS = (
+    "missing_fraction",
+    "heat_mean",
+    "heat_p10",
+    "heat_p50",
+    "heat_p90",
+    "heat_in_city_mean",
+    "heat_out_city_mean",
+    "ndvi_mean",
+    "ndvi_in_city_mean",
+    "ndvi_out_city_mean",
+)
+COLUMNS = (
+    "city",
+    "item_id",
+    "asset_date",
+    "vegetation_phase",
+    "cloud_cover",
+    *STAT_COLUMNS,
+    "status",
+    "error",
+    "ingested_at",
+)
+
+_SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS scene_stats (
+    city TEXT NOT NULL,
+    item_id TEXT NOT NULL,
+    asset_date TEXT NOT NULL,
+    vegetation_phase TEXT,
+    cloud_cover REAL,
+    {", ".join(f"{column} REAL" for column in STAT_COLUMNS)},
+    status TEXT NOT NULL,
+    error TEXT,
+    ingested_at TEXT NOT NULL,
+    PRIMARY KEY (city, item_id)
+);
+CREATE INDEX IF NOT EXISTS scene_stats_city_date ON scene_stats (city, asset_date);
+"""
+
+# Per-period aggregates; the heat island is the in-city minus out-of-city mean.
+_AGGREGATES = """
+    COUNT(*) AS scenes,
+    AVG(heat_mean) AS heat_mean,
+    AVG(heat_p90) AS heat_p90,
+    AVG(heat_in_city_mean) AS heat_in_city_mean,
+    AVG(heat_out_city_mean) AS heat_out_city_mean,
+    AVG(heat_in_city_mean - heat_out_city_mean) AS heat_island,
+    AVG(ndvi_mean) AS ndvi_mean,
+    AVG(ndvi_in_city_mean) AS ndvi_in_city_mean,
+    AVG(cloud_cover) AS cloud_cover
+"""
+PERIODS = {"year": 4, "month": 7}
+
+
+def _masked_mean(values: np.ndarray, mask: Optional[np.ndarray] = None) -> Optional[float]:
+    valid = ~np.isnan(values)
+    if mask is not None:
+        valid &= mask
+    count = np.count_nonzero(valid)
+    return float(values[valid].sum(dtype=np.float64) / count) if count else None
+
+
+def summarize_scene(heat: np.ndarray, ndvi: np.ndarray, mask: Optional[np.ndarray] = None) -> Dict[str, Optional[float]]:
+    """Whole-bbox and in/out-of-city summaries of one scene; in/out stay None without a matching mask."""
+    valid_heat = heat[~np.isnan(heat)]
+    stats: Dict[str, Optional[float]] = {column: None for column in STAT_COLUMNS}
+    stats["missing_fraction"] = 1.0 - valid_heat.size / heat.size if heat.size else 1.0
+    if valid_heat.size:
+        stats["heat_mean"] = float(valid_heat.mean(dtype=np.float64))
+        for percentile, value in zip(HEAT_PERCENTILES, np.percentile(valid_heat, HEAT_PERCENTILES)):
+            stats[f"heat_p{percentile}"] = float(value)
+    stats["ndvi_mean"] = _masked_mean(ndvi)
+
+    if mask is not None and mask.shape == heat.shape == ndvi.shape:
+        stats["heat_in_city_mean"] = _masked_mean(heat, mask)
+        stats["heat_out_city_mean"] = _masked_mean(heat, ~mask)
+        stats["ndvi_in_city_mean"] = _masked_mean(ndvi, mask)
+        stats["ndvi_out_city_mean"] = _masked_mean(ndvi, ~mask)
+    return stats
+
+
+def linear_trend(dates: Sequence[str], values: Sequence[Optional[float]]) -> Optional[Dict[str, float]]:
+    """Least-squares change per year of ``values`` over ISO ``dates``, ignoring missing values."""
+    points = [
+        (datetime.strptime(day, "%Y-%m-%d").toordinal() / 365.25, value)
+        for day, value in zip(dates, values)
+        if value is not None
+    ]
+    if len(points) < 2:
+        return None
+    years, series = np.array(points, dtype=np.float64).T
+    if np.ptp(years) == 0:
+        return None
+    slope, intercept = np.polyfit(years, series, 1)
+    return {"per_year": float(slope), "total_change": float(slope * np.ptp(years)), "scenes": len(points)}
+
+
+class SceneStatsStore:
+    """SQLite index of per-scene heat and NDVI statistics, one row per (city, item).
+
+    A single connection is shared behind a lock; every query reads a handful of
+    rows or aggregates through the (city, asset_date) index.
+    """
+
+    def __init__(self, path: Path = DEFAULT_STATS_PATH) -> None:
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(_SCHEMA)
+
+    def upsert(self, record: Dict[str, Any]) -> None:
+        row = {column: record.get(column) for column in COLUMNS}
+        row["ingested_at"] = row["ingested_at"] or time.strftime("%Y-%m-%dT%H:%M:%S")
+        placeholders = ", ".join(f":{column}" for column in COLUMNS)
+        with self._lock, self._conn:
+            self._conn.execute(f"INSERT OR REPLACE INTO scene_stats ({', '.join(COLUMNS)}) VALUES ({placeholders})", row)
+
+    def done_items(self, city: str) -> Set[str]:
+        marks = ", ".join("?" for _ in DONE_STATUSES)
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT item_id FROM scene_stats WHERE city = ? AND status IN ({marks})", (city, *DONE_STATUSES)
+            ).fetchall()
+        return {row["item_id"] for row in rows}
+
+    def resolve_city(self, name: str) -> Optional[str]:
+        """The indexed city called ``name``, matching case-insensitively or by the part before the first comma."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT city FROM scene_stats WHERE lower(city) = lower(?) OR lower(city) LIKE lower(?) || ',%' "
+                "GROUP BY city ORDER BY lower(city) = lower(?) DESC, COUNT(*) DESC LIMIT 1",
+                (name.strip(), name.strip(), name.strip()),
+            ).fetchone()
+        return row["city"] if row else None
+
+    def _filters(
+        self,
+        city: str,
+        start: Optional[str],
+        end: Optional[str],
+        phase: Optional[str],
+        max_cloud_cover: Optional[float],
+        max_missing: Optional[float],
+    ) -> Tuple[str, List[Any]]:
+        clauses, params = ["city = ?", "status = 'ok'"], [city]
+        for clause, value in (
+            ("asset_date >= ?", start),
+            ("asset_date <= ?", end),
+            ("vegetation_phase = ?", phase),
+            ("cloud_cover <= ?", max_cloud_cover),
+            ("missing_fraction <= ?", max_missing),
+        ):
+            if value is not None:
+                clauses.append(clause)
+                params.append(value)
+        return " AND ".join(clauses), params
+
+    def scenes(self, city: str, start=None, end=None, phase=None, max_cloud_cover=None, max_missing=None) -> List[Dict[str, Any]]:
+        where, params = self._filters(city, start, end, phase, max_cloud_cover, max_missing)
+        columns = ", ".join(column for column in COLUMNS if column not in ("city", "status", "error", "ingested_at"))
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {columns} FROM scene_stats WHERE {where} ORDER BY asset_date, item_id", params
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def aggregate(
+        self, city: str, period: str = "year", start=None, end=None, phase=None, max_cloud_cover=None, max_missing=None
+    ) -> List[Dict[str, Any]]:
+        if period not in PERIODS:
+            raise ValueError(f"Unsupported period '{period}', expected one of {tuple(PERIODS)}")
+        where, params = self._filters(city, start, end, phase, max_cloud_cover, max_missing)
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT substr(asset_date, 1, {PERIODS[period]}) AS period, {_AGGREGATES} "
+                f"FROM scene_stats WHERE {where} GROUP BY period ORDER BY period",
+                params,
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def cities(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT city, COUNT(*) AS scenes, MIN(asset_date) AS first_date, MAX(asset_date) AS last_date "
+                "FROM scene_stats WHERE status = 'ok' GROUP BY city ORDER BY city"
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def counts(self) -> Dict[str, int]:
+        with self._lock:
+            rows = self._conn.execute("SELECT status, COUNT(*) AS n FROM scene_stats GROUP BY status").fetchall()
+        return {row["status"]: row["n"] for row in rows}
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class CityMasks:
+    """City boundary masks per (city, bbox, shape), fetched once; None when the boundary lookup fails."""
+
+    def __init__(self) -> None:
+        self._masks: Dict[Tuple, Optional[np.ndarray]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, city: str, bbox, shape: Tuple[int, int]) -> Optional[np.ndarray]:
+        from .score_calculation import get_city_mask
+
+        key = (city, tuple(bbox), tuple(shape))
+        with self._lock:
+            if key in self._masks:
+                return self._masks[key]
+            try:
+                mask = get_city_mask(city, bbox, shape)
+            except Exception as e:
+                print(f"No city mask for {city}: {e}")
+                mask = None
+            self._masks[key] = mask
+            return mask
+
+
+def scene_record(city: str, item, vegetation_phase: Optional[str] = None) -> Dict[str, Any]:
+    return {
+        "city": city,
+        "item_id": item.id,
+        "asset_date": item_date(item),
+        "vegetation_phase": vegetation_phase,
+        "cloud_cover": item.properties.get("eo:cloud_cover"),
+    }
+
+
+def record_scene(
+    store: SceneStatsStore,
+    city: str,
+    item,
+    bbox,
+    heat: np.ndarray,
+    ndvi: np.ndarray,
+    masks: CityMasks,
+    vegetation_phase: Optional[str] = None,
+) -> str:
+    record = scene_record(city, item, vegetation_phase)
+    record.update(summarize_scene(heat, ndvi, masks.get(city, bbox, heat.shape)))
+    record["status"] = "ok" if record["heat_mean"] is not None else "rejected"
+    store.upsert(record)
+    SCENE_STATS_INGESTED.inc(status=record["status"])
+    return record["status"]
+
+
+class SceneStatsIngester:
+    """Keeps the store filled from a background thread.
+
+    Every ``interval`` seconds each city is searched again and items not yet
+    in the store are read, summarized and recorded, ``workers`` at a time.
+    """
+
+    def __init__(
+        self,
+        store: SceneStatsStore,
+        cities: Sequence[str],
+        start: str = "2015-01-01",
+        end: Optional[str] = None,
+        max_cloud_cover: float = 20,
+        interval: float = 24 * 3600,
+        workers: int = 4,
+    ) -> None:
+        self.store = store
+        self.cities = list(dict.fromkeys(cities))
+        self.start_date = start
+        self.end_date = end
+        self.max_cloud_cover = max_cloud_cover
+        self.interval = interval
+        self.workers = workers
+        self.masks = CityMasks()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="scene-stats-ingester", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            self.ingest_all()
+            self._stop.wait(self.interval)
+
+    def ingest_all(self) -> int:
+        total = 0
+        for city in self.cities:
+            if self._stop.is_set():
+                break
+            try:
+                total += self.ingest_city(city)
+            except Exception as e:
+                print(f"Scene stats ingestion for {city} failed: {e}")
+        return total
+
+    @timed("scene_stats_ingest")
+    def ingest_city(self, city: str) -> int:
+        from ..simulation.data_generation import search_city_items
+
+        end = self.end_date or Date.today().isoformat()
+        bbox, items = search_city_items(city, self.start_date, end, self.max_cloud_cover)
+        done = self.store.done_items(city)
+        pending = [item for item in items if item.id not in done]
+        if not pending:
+            return 0
+
+        print(f"Indexing {len(pending)} scenes for {city}")
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="scene-stats") as pool:
+            statuses = list(pool.map(lambda item: self.ingest_item(city, bbox, item), pending))
+        print(f"Indexed {statuses.count('ok')} of {len(pending)} scenes for {city}")
+        return len(pending)
+
+    def ingest_item(self, city: str, bbox, item) -> str:
+        from ..simulation.data_generation import get_vegetation_phase
+        from .sat_extract import load_band
+
+        if self._stop.is_set():
+            return "skipped"
+        phase = get_vegetation_phase(int(item_date(item).split("-")[1]))
+        try:
+            heat, _, _ = load_band(item, "lwir11", bbox, verbose=False, celsius=True)
+            red, _, _ = load_band(item, "red", bbox, apply_scale=True, nodata_value=None, verbose=False)
+            nir, _, _ = load_band(item, "nir08", bbox, apply_scale=True, nodata_value=None, verbose=False)
+            if heat is None or red is None or nir is None or red.shape != heat.shape or nir.shape != heat.shape:
+                record = {**scene_record(city, item, phase), "status": "rejected"}
+            else:
+                return record_scene(self.store, city, item, bbox, heat, ndvi_from_reflectance(red, nir), self.masks, phase)
+        except Exception as e:
+            record = {**scene_record(city, item, phase), "status": "error", "error": repr(e)}
+        self.store.upsert(record)
+        SCENE_STATS_INGESTED.inc(status=record["status"])
+        return record["status"]
+
+
+_store: Optional[SceneStatsStore] = None
+_ingester: Optional[SceneStatsIngester] = None
+_lock = threading.Lock()
+
+
+def set_scene_stats_store(store: SceneStatsStore) -> None:
+    global _store
+    with _lock:
+        _store = store
+
+
+def get_scene_stats_store() -> SceneStatsStore:
+    global _store
+    with _lock:
+        if _store is None:
+            _store = SceneStatsStore(Path(os.getenv("SCENE_STATS_PATH", str(DEFAULT_STATS_PATH))))
+        return _store
+
+
+def ingester_from_env() -> SceneStatsIngester:
+    return SceneStatsIngester(
+        get_scene_stats_store(),
+        [city.strip() for city in os.getenv("SCENE_STATS_CITIES", DEFAULT_CITIES).split(";") if city.strip()],
+        start=os.getenv("SCENE_STATS_START", "2015-01-01"),
+        end=os.getenv("SCENE_STATS_END") or None,
+        max_cloud_cover=float(os.getenv("SCENE_STATS_MAX_CLOUD", "20")),
+        interval=float(os.getenv("SCENE_STATS_INTERVAL", str(24 * 3600))),
+        workers=int(os.getenv("SCENE_STATS_WORKERS", "4")),
+    )
+
+
+def start_scene_stats_ingester() -> Optional[SceneStatsIngester]:
+    """Start the background ingester once per process when SCENE_STATS_INGEST is set."""
+    global _ingester
+    if (os.getenv("SCENE_STATS_INGEST") or "").strip().lower() not in ("1", "true", "yes", "on"):
+        return None
+    ingester = ingester_from_env()
+    with _lock:
+        if _ingester is None:
+            _ingester = ingester
+            _ingester.start()
+            print(f"Scene stats ingestion started for {_ingester.cities}")
+        return _ingester
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Index per-scene heat and NDVI statistics for time-series queries.")
+    parser.add_argument("--city", action="append", dest="cities", help="City to index (repeatable). Defaults to SCENE_STATS_CITIES.")
+    parser.add_argument("--start", default=os.getenv("SCENE_STATS_START", "2015-01-01"), help="Start of the acquisition date range.")
+    parser.add_argument("--end", default=None, help="End of the acquisition date range. Defaults to today.")
+    parser.add_argument("--max-cloud-cover", type=float, default=20, help="Maximum scene cloud cover in percent.")
+    parser.add_argument("--workers", type=int, default=4, help="Number of scenes read concurrently.")
+    args = parser.parse_args(argv)
+
+    ingester = ingester_from_env()
+    ingester.cities = args.cities or ingester.cities
+    ingester.start_date, ingester.end_date = args.start, args.end
+    ingester.max_cloud_cover, ingester.workers = args.max_cloud_cover, args.workers
+    started = time.perf_counter()
+    ingester.ingest_all()
+    print(f"Done in {time.perf_counter() - started:.1f}s: {ingester.store.counts()}")
+
+
+if __name__ == "__main__":
+    main()
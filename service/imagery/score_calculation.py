@@ -1,16 +1,17 @@
+from __future__ import annotations
+
 import numpy as np
-import osmnx as ox
-import geopandas as gpd
-import matplotlib.pyplot as plt
-from shapely.geometry import Polygon, MultiPolygon
-from rasterio.features import rasterize
-from rasterio.transform import from_bounds
-from typing import Tuple
-
-import requests
+from typing import TYPE_CHECKING, Optional, Tuple
+
 import json
 import os
 
+from ..metrics import timed
+from .chunked import as_chunked, gather, use_chunked
+
+if TYPE_CHECKING:
+    from shapely.geometry import MultiPolygon, Polygon
+
 def calculate_city_score_with_explanation(
     city_name,
     city_area,
@@ -143,9 +144,13 @@ def calculate_city_score_with_explanation(
 
     return score, explanation
 
+CITY_DATA_URL = os.getenv("CITY_DATA_URL", "https://api.api-ninjas.com/v1/city")
+
 def get_city_opendata(city):
+    import requests
+
     city = city.split(',')[0]
-    url = f"https://api.api-ninjas.com/v1/city?name={city}"
+    url = f"{CITY_DATA_URL}?name={city}"
     res = requests.get(
         url,
         headers={
@@ -162,6 +167,10 @@ def create_city_mask(
     output_path: str,
 ) -> np.ndarray:
     """Rasterize a city boundary geometry to a mask and save it as an image."""
+    from rasterio.features import rasterize
+    from rasterio.transform import from_bounds
+    from shapely.geometry import MultiPolygon
+
     lon_min, lat_min, lon_max, lat_max = bbox
     height, width = shape
 
@@ -183,61 +192,91 @@ def create_city_mask(
 
     return mask.astype(bool)
 
-def calculate_score(heat_map: np.ndarray, ndvi_map: np.ndarray, bbox: Tuple[float, float, float, float], city: str) -> int:
+@timed("city_boundary")
+def get_city_boundary(city: str) -> Optional[Polygon | MultiPolygon]:
+    # osmnx pulls in geopandas and networkx; only score and planning requests pay for it.
+    import osmnx as ox
+
     point = ox.geocode(city)
     tags = {'boundary': 'administrative', 'admin_level': ['6', '7', '8', '9']}
     features = ox.features_from_point(point, tags=tags, dist=5000)
 
-    shape = heat_map.shape
-
     city_boundary_gdf = features[
         ((features.geometry.type == 'Polygon') | (features.geometry.type == 'MultiPolygon')) &
         (features['name'].str.contains(city.split(',')[0], case=False, na=False))
     ]
-    
+
     if city_boundary_gdf.empty:
         print(f"Could not find administrative boundary for {city}.")
         return None
 
-    geometry = city_boundary_gdf.iloc[0].geometry
-    mask = create_city_mask(geometry, bbox, shape, f"{city.replace(',', '_')}_mask.png")
+    return city_boundary_gdf.iloc[0].geometry
+
+def get_city_mask(city: str, bbox: Tuple[float, float, float, float], shape: Tuple[int, int]) -> Optional[np.ndarray]:
+    geometry = get_city_boundary(city)
+    if geometry is None:
+        return None
+    return create_city_mask(geometry, bbox, shape, f"{city.replace(',', '_')}_mask.png")
+
+def _masked_sum_count(values, mask):
+    valid = mask & ~np.isnan(values)
+    return np.where(valid, values, 0).sum(dtype=np.float64), valid.sum()
 
-    def save_masked_image(data: np.ndarray, title: str, path: str, cmap: str = "inferno") -> None:
-        plt.figure(figsize=(6, 6))
-        plt.imshow(data, cmap=cmap)
-        plt.title(title)
-        plt.axis("off")
-        plt.tight_layout(pad=0)
-        plt.savefig(path, bbox_inches="tight", pad_inches=0)
-        plt.close()
 
-    heat_map_in_city = np.where(mask, heat_map, np.nan)
-    ndvi_map_in_city = np.where(mask, ndvi_map, np.nan)
-    heat_map_out_of_city = np.where(~mask, heat_map, np.nan)
-    ndvi_map_out_of_city = np.where(~mask, ndvi_map, np.nan)
+def _mean(total, count) -> float:
+    return float(total / count) if count else float("nan")
 
-    vegetation_threshold = 0.2
-    vegetation_map_in_city = np.where(ndvi_map_in_city > vegetation_threshold, ndvi_map_in_city, np.nan)
 
-    heat_values_in_city = heat_map[mask]
-    if heat_values_in_city.size:
-        min_heat_in_city = float(np.nanmin(heat_values_in_city))
-        max_heat_in_city = float(np.nanmax(heat_values_in_city))
+@timed("calculate_score")
+def calculate_score(heat_map: np.ndarray, ndvi_map: np.ndarray, bbox: Tuple[float, float, float, float], city: str) -> int:
+    shape = heat_map.shape
+
+    mask = get_city_mask(city, bbox, shape)
+    if mask is None:
+        return None
+
+    # Every statistic is a reduction, so large maps are reduced chunk by chunk in parallel.
+    if use_chunked(shape=shape):
+        heat_map, ndvi_map, mask = as_chunked(heat_map, ndvi_map, mask)
+
+    heat_valid_in_city = mask & ~np.isnan(heat_map)
+    min_heat_in_city, max_heat_in_city = gather(
+        np.where(heat_valid_in_city, heat_map, np.inf).min(),
+        np.where(heat_valid_in_city, heat_map, -np.inf).max(),
+    )
+    if np.isfinite(min_heat_in_city):
         heat_threshold = (max_heat_in_city + min_heat_in_city) / 1.75
-        hot_spots = np.where(mask & (heat_map > heat_threshold), heat_map, np.nan)
     else:
         heat_threshold = float("nan")
-        hot_spots = np.full_like(heat_map, np.nan)
+
+    vegetation_threshold = 0.2
+    (
+        city_pixels,
+        hot_pixels,
+        vegetation_pixels,
+        heat_in_sum, heat_in_count,
+        ndvi_in_sum, ndvi_in_count,
+        heat_out_sum, heat_out_count,
+        ndvi_out_sum, ndvi_out_count,
+    ) = gather(
+        mask.sum(),
+        np.count_nonzero(mask & (heat_map > heat_threshold)),
+        np.count_nonzero(mask & (ndvi_map > vegetation_threshold)),
+        *_masked_sum_count(heat_map, mask),
+        *_masked_sum_count(ndvi_map, mask),
+        *_masked_sum_count(heat_map, ~mask),
+        *_masked_sum_count(ndvi_map, ~mask),
+    )
 
     city_data = get_city_opendata(city)
 
-    heat_map_in_city_mean = np.nanmean(heat_map_in_city)
-    ndvi_map_in_city_mean = np.nanmean(ndvi_map_in_city)
-    heat_map_out_of_city_mean = np.nanmean(heat_map_out_of_city)
-    ndvi_map_out_of_city_mean = np.nanmean(ndvi_map_out_of_city)
-    hot_surface_area = np.count_nonzero(~np.isnan(hot_spots)) * (30*30) / 1000000 # m^2 to km^2
-    vegetation_surface_area = np.count_nonzero(~np.isnan(vegetation_map_in_city)) * (30*30) / 1000000 # m^2 to km^2
-    city_area = mask.sum() * (30*30) / 1000000 # m^2 to km^2
+    heat_map_in_city_mean = _mean(heat_in_sum, heat_in_count)
+    ndvi_map_in_city_mean = _mean(ndvi_in_sum, ndvi_in_count)
+    heat_map_out_of_city_mean = _mean(heat_out_sum, heat_out_count)
+    ndvi_map_out_of_city_mean = _mean(ndvi_out_sum, ndvi_out_count)
+    hot_surface_area = hot_pixels * (30*30) / 1000000 # m^2 to km^2
+    vegetation_surface_area = vegetation_pixels * (30*30) / 1000000 # m^2 to km^2
+    city_area = city_pixels * (30*30) / 1000000 # m^2 to km^2
     city_population = 0
     if city_data:
         city_population = city_data[0]["population"]
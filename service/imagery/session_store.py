@@ -1,14 +1,23 @@
 from __future__ import annotations
 
+import itertools
 import threading
 from typing import Any, Dict, Optional, Tuple
 
 import numpy as np
 
+from ..metrics import count_cache
+from ..simulation.result_cache import raster_fingerprint
+
+# Shared by every store so a revision identifies one raster for the life of the process,
+# even across stores; caches outside the store key on it.
+_revisions = itertools.count(1)
+
 
 class InMemorySessionDataStore:
     def __init__(self) -> None:
         self._data: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        self._derived: Dict[str, Dict[str, Tuple[Any, Any]]] = {}
         self._lock = threading.Lock()
 
     def store(
@@ -19,11 +28,16 @@ class InMemorySessionDataStore:
         asset_date: str,
         bbox: Tuple[float, float, float, float],
     ) -> None:
+        data = np.array(data_array, copy=True)
+        # Hashed once here so caches keyed on the content never rehash the raster per request.
+        fingerprint = raster_fingerprint(data)
         with self._lock:
             self._data.setdefault(session_id, {})[data_type] = {
-                "data": np.array(data_array, copy=True),
+                "data": data,
                 "asset_date": asset_date,
                 "bbox": bbox,
+                "revision": next(_revisions),
+                "fingerprint": fingerprint,
             }
 
     def get(self, session_id: str) -> Optional[Dict[str, Dict[str, Any]]]:
@@ -36,13 +50,40 @@ class InMemorySessionDataStore:
                     "data": np.array(value["data"], copy=True),
                     "asset_date": value["asset_date"],
                     "bbox": value["bbox"],
+                    "revision": value["revision"],
+                    "fingerprint": value["fingerprint"],
                 }
                 for key, value in session_data.items()
             }
 
+    def get_entry(self, session_id: str, data_type: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._data.get(session_id, {}).get(data_type)
+            if entry is None:
+                return None
+            return {**entry, "data": np.array(entry["data"], copy=True)}
+
+    def get_revision(self, session_id: str, data_type: str) -> Optional[int]:
+        with self._lock:
+            entry = self._data.get(session_id, {}).get(data_type)
+            return None if entry is None else entry["revision"]
+
+    def get_derived(self, session_id: str, name: str, version: Any) -> Optional[Any]:
+        """Return a value computed from this session's rasters if it was stored for ``version``."""
+        with self._lock:
+            cached = self._derived.get(session_id, {}).get(name)
+            if cached is None or cached[0] != version:
+                return None
+            return cached[1]
+
+    def store_derived(self, session_id: str, name: str, version: Any, value: Any) -> None:
+        with self._lock:
+            self._derived.setdefault(session_id, {})[name] = (version, value)
+
     def clear(self) -> None:
         with self._lock:
             self._data.clear()
+            self._derived.clear()
 
 
 _store: InMemorySessionDataStore = InMemorySessionDataStore()
@@ -73,3 +114,20 @@ def store_session_data(
 def get_session_data(session_id: str) -> Optional[Dict[str, Dict[str, Any]]]:
     return _store.get(session_id)
 
+
+def get_session_entry(session_id: str, data_type: str) -> Optional[Dict[str, Any]]:
+    return _store.get_entry(session_id, data_type)
+
+
+def get_session_revision(session_id: str, data_type: str) -> Optional[int]:
+    return _store.get_revision(session_id, data_type)
+
+
+def get_derived_data(session_id: str, name: str, version: Any) -> Optional[Any]:
+    value = _store.get_derived(session_id, name, version)
+    count_cache(name, value is not None)
+    return value
+
+
+def store_derived_data(session_id: str, name: str, version: Any, value: Any) -> None:
+    _store.store_derived(session_id, name, version, value)
@@ -0,0 +1,327 @@
+from __future__ import annotations
+
+import heapq
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import cv2
+import numpy as np
+
+from ..metrics import timed
+from .session_store import get_derived_data, get_session_entry, get_session_revision, store_derived_data
+
+BLUR_KERNEL = (9, 9)
+MORPH_KERNEL_SIZE = 7
+# Refinement windows extend this far past their candidate, so the candidate's own components never touch the edge.
+WINDOW_MARGIN = 1
+PIXEL_AREA_KM2 = 30 * 30 / 1_000_000  # Landsat 30 m pixels
+
+
+def _normalize(array: np.ndarray) -> np.ndarray:
+    normalized = np.array(array, dtype=np.float32)
+    low, high = np.nanmin(normalized), np.nanmax(normalized)
+    normalized -= low
+    normalized *= np.float32(1.0 / (high - low + 1e-6))
+    return np.clip(normalized, 0, 1, out=normalized)
+
+
+@timed("weak_spot_score")
+def compute_score_map(heat_map: np.ndarray, ndvi_map: np.ndarray) -> np.ndarray:
+    score_map = _normalize(heat_map)
+    ndvi_norm = _normalize(ndvi_map)
+    np.subtract(1.0, ndvi_norm, out=ndvi_norm)
+    score_map *= ndvi_norm
+    return cv2.GaussianBlur(score_map, BLUR_KERNEL, 0)
+
+
+def percentile_threshold(
+    score_map: np.ndarray, percentile: float = 95.0, region: Optional[np.ndarray] = None
+) -> Optional[float]:
+    """Linear-interpolated percentile of the finite scores using a partial sort."""
+    valid = np.isfinite(score_map)
+    if region is not None:
+        valid &= region
+    valid_scores = score_map[valid]
+    if valid_scores.size == 0:
+        return None
+
+    position = (valid_scores.size - 1) * percentile / 100.0
+    lower = int(np.floor(position))
+    upper = min(lower + 1, valid_scores.size - 1)
+    partitioned = np.partition(valid_scores, [lower, upper])
+    low_value, high_value = float(partitioned[lower]), float(partitioned[upper])
+    return low_value + (high_value - low_value) * (position - lower)
+
+
+def _morphology(binary: np.ndarray, kernel_size: int) -> np.ndarray:
+    kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (kernel_size, kernel_size))
+    binary = cv2.morphologyEx(binary, cv2.MORPH_OPEN, kernel, iterations=1)
+    return cv2.morphologyEx(binary, cv2.MORPH_DILATE, kernel, iterations=2)
+
+
+def _block_any(binary: np.ndarray, factor: int) -> np.ndarray:
+    rows, cols = binary.shape
+    pad_rows, pad_cols = -rows % factor, -cols % factor
+    if pad_rows or pad_cols:
+        binary = cv2.copyMakeBorder(binary, 0, pad_rows, 0, pad_cols, cv2.BORDER_CONSTANT, value=0)
+    coarse_size = ((cols + pad_cols) // factor, (rows + pad_rows) // factor)
+    return (cv2.resize(binary * 255, coarse_size, interpolation=cv2.INTER_AREA) > 0).astype(np.uint8)
+
+
+def pyramid_factor(shape: Tuple[int, int]) -> int:
+    largest = max(shape)
+    if largest >= 2048:
+        return 4
+    if largest >= 1024:
+        return 2
+    return 1
+
+
+def region_mask(
+    shape: Tuple[int, int],
+    bbox: Tuple[float, float, float, float],
+    sub_bbox: Optional[Tuple[float, float, float, float]] = None,
+    polygon: Optional[Sequence[Tuple[float, float]]] = None,
+) -> Optional[np.ndarray]:
+    """Rasterize an optional sub-bbox and/or (lon, lat) polygon onto the scene grid."""
+    if sub_bbox is None and polygon is None:
+        return None
+
+    lon_min, lat_min, lon_max, lat_max = bbox
+    rows, cols = shape
+
+    def to_pixels(lon, lat):
+        col = (np.asarray(lon, dtype=float) - lon_min) / (lon_max - lon_min) * cols
+        row = (lat_max - np.asarray(lat, dtype=float)) / (lat_max - lat_min) * rows
+        return col, row
+
+    mask = np.ones(shape, dtype=np.uint8)
+
+    if sub_bbox is not None:
+        (c0, c1), (r1, r0) = to_pixels(
+            [sub_bbox[0], sub_bbox[2]], [sub_bbox[1], sub_bbox[3]]
+        )
+        box = np.zeros(shape, dtype=np.uint8)
+        box[max(0, int(np.floor(r0))) : max(0, int(np.ceil(r1))), max(0, int(np.floor(c0))) : max(0, int(np.ceil(c1)))] = 1
+        mask &= box
+
+    if polygon is not None:
+        lons, lats = zip(*polygon)
+        cols_px, rows_px = to_pixels(lons, lats)
+        points = np.round(np.stack([cols_px, rows_px], axis=1)).astype(np.int32)
+        filled = np.zeros(shape, dtype=np.uint8)
+        cv2.fillPoly(filled, [points], 1)
+        mask &= filled
+
+    return mask.astype(bool)
+
+
+def _component_stats(
+    labels: np.ndarray,
+    num_labels: int,
+    score_map: np.ndarray,
+    heat_map: np.ndarray,
+    ndvi_map: np.ndarray,
+) -> Dict[str, np.ndarray]:
+    """Per-label pixel count, mean score, mean heat and mean NDVI from one bincount pass."""
+    labels = labels.ravel()
+    foreground = np.flatnonzero(labels)
+    index = labels[foreground]
+    stats = {"pixels": np.bincount(index, minlength=num_labels)}
+
+    for name, values in (("score", score_map), ("heat", heat_map), ("ndvi", ndvi_map)):
+        values = values.ravel()[foreground]
+        finite = np.isfinite(values)
+        sums = np.bincount(index, weights=np.where(finite, values, 0.0), minlength=num_labels)
+        counts = np.bincount(index, weights=finite, minlength=num_labels)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            stats[f"mean_{name}"] = sums / counts
+
+    return stats
+
+
+def _cluster(
+    label: int,
+    stats: np.ndarray,
+    centroids: np.ndarray,
+    component_stats: Dict[str, np.ndarray],
+    offset: Tuple[int, int],
+) -> Dict[str, Any]:
+    pixels = int(component_stats["pixels"][label])
+    area_km2 = pixels * PIXEL_AREA_KM2
+    mean_score = float(component_stats["mean_score"][label])
+    return {
+        "cx": float(centroids[label][0]) + offset[0],
+        "cy": float(centroids[label][1]) + offset[1],
+        "key": (int(stats[label, 0]) + offset[0], int(stats[label, 1]) + offset[1], int(stats[label, 2]), int(stats[label, 3])),
+        "pixels": pixels,
+        "area_km2": area_km2,
+        "mean_score": mean_score,
+        "mean_heat": float(component_stats["mean_heat"][label]),
+        "mean_ndvi": float(component_stats["mean_ndvi"][label]),
+        "priority": mean_score * area_km2,
+    }
+
+
+def _full_resolution_clusters(
+    binary: np.ndarray,
+    score_map: np.ndarray,
+    heat_map: np.ndarray,
+    ndvi_map: np.ndarray,
+    offset: Tuple[int, int] = (0, 0),
+) -> Iterator[Dict[str, Any]]:
+    num_labels, labels, stats, centroids = cv2.connectedComponentsWithStats(binary, connectivity=8)
+    component_stats = _component_stats(labels, num_labels, score_map, heat_map, ndvi_map)
+
+    for label in range(1, num_labels):
+        yield _cluster(label, stats, centroids, component_stats, offset)
+
+
+def _pyramid_clusters(
+    binary: np.ndarray,
+    score_map: np.ndarray,
+    heat_map: np.ndarray,
+    ndvi_map: np.ndarray,
+    factor: int,
+    min_area: int,
+) -> Iterator[Dict[str, Any]]:
+    rows, cols = binary.shape
+
+    # ``binary`` is already cleaned at full resolution, so the blocks of each of
+    # its components form one connected coarse candidate that contains it whole.
+    coarse = _block_any(binary, factor)
+    num_labels, _, coarse_stats, _ = cv2.connectedComponentsWithStats(coarse, connectivity=8)
+
+    seen = set()
+    for label in range(1, num_labels):
+        if coarse_stats[label, cv2.CC_STAT_AREA] * factor * factor < min_area:
+            continue
+
+        x, y, w, h = (int(v) * factor for v in coarse_stats[label, :4])
+        x0, y0 = max(0, x - WINDOW_MARGIN), max(0, y - WINDOW_MARGIN)
+        x1, y1 = min(cols, x + w + WINDOW_MARGIN), min(rows, y + h + WINDOW_MARGIN)
+        window = (slice(y0, y1), slice(x0, x1))
+
+        clusters = _full_resolution_clusters(
+            binary[window], score_map[window], heat_map[window], ndvi_map[window], offset=(x0, y0)
+        )
+        for cluster in clusters:
+            sx, sy, sw, sh = cluster["key"]
+            clipped = (
+                (sx == x0 and x0 > 0)
+                or (sy == y0 and y0 > 0)
+                or (sx + sw == x1 and x1 < cols)
+                or (sy + sh == y1 and y1 < rows)
+            )
+            # Every piece of a component cut by the window touches its edge; such components
+            # belong to a neighbouring candidate whose own window contains them whole.
+            if clipped or cluster["key"] in seen:
+                continue
+            seen.add(cluster["key"])
+            yield cluster
+
+
+def iter_clusters(
+    score_map: np.ndarray,
+    heat_map: np.ndarray,
+    ndvi_map: np.ndarray,
+    threshold: float,
+    bbox: Tuple[float, float, float, float],
+    min_area: int = 100,
+    region: Optional[np.ndarray] = None,
+    factor: Optional[int] = None,
+) -> Iterator[Dict[str, Any]]:
+    """Yield weak-spot clusters with per-cluster stats as they are found."""
+    factor = pyramid_factor(score_map.shape) if factor is None else factor
+    binary = (score_map >= threshold).astype(np.uint8)
+    if region is not None:
+        binary &= region.astype(np.uint8)
+    # Cleaned once over the whole scene so the pyramid path labels exactly the same components.
+    binary = _morphology(binary, MORPH_KERNEL_SIZE)
+
+    if factor > 1:
+        clusters = _pyramid_clusters(binary, score_map, heat_map, ndvi_map, factor, min_area)
+    else:
+        clusters = _full_resolution_clusters(binary, score_map, heat_map, ndvi_map)
+
+    lon_min, lat_min, lon_max, lat_max = bbox
+    h, w = score_map.shape
+
+    for cluster in clusters:
+        if cluster["pixels"] < min_area:
+            continue
+        yield {
+            "lat": float(lat_max - (cluster["cy"] / h) * (lat_max - lat_min)),
+            "lon": float(lon_min + (cluster["cx"] / w) * (lon_max - lon_min)),
+            "pixels": cluster["pixels"],
+            "area_km2": cluster["area_km2"],
+            "mean_score": cluster["mean_score"],
+            "mean_heat": _json_float(cluster["mean_heat"]),
+            "mean_ndvi": _json_float(cluster["mean_ndvi"]),
+            "priority": cluster["priority"],
+        }
+
+
+def _json_float(value: float) -> Optional[float]:
+    return float(value) if np.isfinite(value) else None
+
+
+def rank_clusters(clusters: Iterable[Dict[str, Any]], top_k: Optional[int] = None) -> List[Dict[str, Any]]:
+    """Clusters by descending priority; with ``top_k`` only a heap of the best ``top_k`` is kept while consuming."""
+    if top_k is None:
+        return sorted(clusters, key=lambda cluster: cluster["priority"], reverse=True)
+    return heapq.nlargest(top_k, clusters, key=lambda cluster: cluster["priority"])
+
+
+@timed("weak_spot_clusters")
+def find_clusters(
+    score_map: np.ndarray,
+    heat_map: np.ndarray,
+    ndvi_map: np.ndarray,
+    threshold: float,
+    bbox: Tuple[float, float, float, float],
+    min_area: int = 100,
+    top_k: Optional[int] = None,
+    region: Optional[np.ndarray] = None,
+    factor: Optional[int] = None,
+) -> List[Dict[str, Any]]:
+    return rank_clusters(
+        iter_clusters(score_map, heat_map, ndvi_map, threshold, bbox, min_area, region, factor),
+        top_k,
+    )
+
+
+def get_scored_scene(session_id: str) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+    """Return the session's score map and float32 rasters, computing them once per revision.
+
+    On failure the scene is None and the second element explains what is missing.
+    """
+    ndvi_type = "ndvi_map" if get_session_revision(session_id, "ndvi_map") is not None else "ndvi"
+    revisions = (get_session_revision(session_id, "heat_map"), get_session_revision(session_id, ndvi_type))
+
+    if revisions == (None, None):
+        return None, "Session data not found"
+    if revisions[0] is None:
+        return None, "Heat map not available"
+    if revisions[1] is None:
+        return None, "Vegetation map not available"
+
+    scene = get_derived_data(session_id, "weak_spot_scene", revisions)
+    if scene is not None:
+        return scene, None
+
+    heat_entry = get_session_entry(session_id, "heat_map")
+    ndvi_entry = get_session_entry(session_id, ndvi_type)
+    if heat_entry is None or ndvi_entry is None:
+        return None, "Session data not found"
+
+    score_map = compute_score_map(heat_entry["data"], ndvi_entry["data"])
+    scene = {
+        "score_map": score_map,
+        "heat_map": np.asarray(heat_entry["data"], dtype=np.float32),
+        "ndvi_map": np.asarray(ndvi_entry["data"], dtype=np.float32),
+        "bbox": heat_entry["bbox"],
+        "threshold": percentile_threshold(score_map, 95),
+        "revisions": revisions,
+    }
+    store_derived_data(session_id, "weak_spot_scene", revisions, scene)
+    return scene, None
@@ -11,14 +11,28 @@ if __package__ is None or __package__ == "":
     if str(project_root) not in sys.path:
         sys.path.insert(0, str(project_root))
     from service.routes.imagery_routes import imagery_bp
+    from service.routes.metrics_routes import metrics_bp
+    from service.imagery.array_codec import ARRAY_HEADERS
     from service.imagery.session_store import InMemorySessionDataStore, set_session_data_store
+    from service.profiling import init_profiling
+    from service.routes.profile_routes import profiles_bp
     from service.routes.simulate_routes import simulate_bp, weakspots_bp
     from service.routes.score_routes import score_bp
+    from service.routes.tile_routes import tiles_bp
+    from service.routes.timeseries_routes import timeseries_bp
+    from service.imagery.scene_stats import start_scene_stats_ingester
 else:
     from .routes.imagery_routes import imagery_bp
+    from .routes.metrics_routes import metrics_bp
+    from .imagery.array_codec import ARRAY_HEADERS
     from .imagery.session_store import InMemorySessionDataStore, set_session_data_store
+    from .profiling import init_profiling
+    from .routes.profile_routes import profiles_bp
     from .routes.score_routes import score_bp
-    from .routes.simulate_routes import simulate_bp
+    from .routes.simulate_routes import simulate_bp, weakspots_bp
+    from .routes.tile_routes import tiles_bp
+    from .routes.timeseries_routes import timeseries_bp
+    from .imagery.scene_stats import start_scene_stats_ingester
 
 
 def create_app() -> Flask:
@@ -26,7 +40,12 @@ def create_app() -> Flask:
     app.secret_key = os.getenv("FLASK_SECRET_KEY", "dev-secret")
 
     allowed_origins = os.getenv("CORS_ALLOWED_ORIGINS", "http://localhost:3000,http://localhost:3001,http://localhost:5173").split(",")
-    CORS(app, resources={r"/*": {"origins": allowed_origins}}, supports_credentials=True)
+    CORS(
+        app,
+        resources={r"/*": {"origins": allowed_origins}},
+        supports_credentials=True,
+        expose_headers=ARRAY_HEADERS,
+    )
 
     session_store = InMemorySessionDataStore()
     set_session_data_store(session_store)
@@ -36,6 +55,18 @@ def create_app() -> Flask:
     app.register_blueprint(simulate_bp)
     app.register_blueprint(weakspots_bp)
     app.register_blueprint(score_bp)
+    app.register_blueprint(tiles_bp)
+    app.register_blueprint(metrics_bp)
+    app.register_blueprint(timeseries_bp)
+
+    # Opt-in via SCENE_STATS_INGEST; /timeseries serves whatever is already indexed either way.
+    ingester = start_scene_stats_ingester()
+    if ingester is not None:
+        app.extensions["scene_stats_ingester"] = ingester
+
+    # Opt-in via PROFILING_ENABLED; nothing is hooked into the request path otherwise.
+    if init_profiling(app) is not None:
+        app.register_blueprint(profiles_bp)
 
     @app.before_request
     def ensure_session_id() -> None:
@@ -0,0 +1,272 @@
+from __future__ import annotations
+
+import bisect
+import contextlib
+import math
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+LabelValues = Tuple[str, ...]
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(zip(names, values))
+    if extra is not None:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(str(value))}"' for name, value in pairs) + "}"
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {sorted(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def samples(self) -> Iterable[str]:
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self.samples())
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> None:
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels: str) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0.0)
+
+    def samples(self) -> Iterable[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        for key, value in values:
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+
+
+class Gauge(_Metric):
+    """A value read at scrape time from ``fn`` or set explicitly."""
+
+    kind = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        fn: Optional[Callable[[], Dict[LabelValues, float]]] = None,
+    ) -> None:
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+        self._fn = fn
+
+    def set(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def set_function(self, fn: Callable[[], Dict[LabelValues, float]]) -> None:
+        self._fn = fn
+
+    def samples(self) -> Iterable[str]:
+        if self._fn is not None:
+            try:
+                values = sorted(self._fn().items())
+            except Exception as exc:
+                print(f"Gauge {self.name} failed: {exc}")
+                return
+        else:
+            with self._lock:
+                values = sorted(self._values.items())
+        for key, value in values:
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ) -> None:
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: non-cumulative bucket counts (last slot is +Inf), sum.
+        self._series: Dict[LabelValues, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = ([0] * (len(self.buckets) + 1), [0.0])
+            series[0][index] += 1
+            series[1][0] += value
+
+    def count(self, **labels: str) -> int:
+        with self._lock:
+            series = self._series.get(self._key(labels))
+            return sum(series[0]) if series else 0
+
+    def totals(self) -> Dict[LabelValues, Tuple[int, float]]:
+        """Observation count and sum per label set."""
+        with self._lock:
+            return {key: (sum(counts), total[0]) for key, (counts, total) in self._series.items()}
+
+    def samples(self) -> Iterable[str]:
+        with self._lock:
+            series = sorted((key, (list(counts), total[0])) for key, (counts, total) in self._series.items())
+        for key, (counts, total) in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, ("le", _format_value(bound)))
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            labels = _format_labels(self.labelnames, key)
+            yield f"{self.name}_sum{labels} {_format_value(total)}"
+            yield f"{self.name}_count{labels} {cumulative}"
+
+
+class Registry:
+    def __init__(self) -> None:
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, cls, name: str, *args, **kwargs) -> _Metric:
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, *args, **kwargs)
+            elif not isinstance(metric, cls):
+                raise ValueError(f"Metric {name} already registered as {metric.kind}")
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._get_or_create(Counter, name, documentation, labelnames)
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = (), fn=None) -> Gauge:
+        gauge = self._get_or_create(Gauge, name, documentation, labelnames)
+        if fn is not None:
+            gauge.set_function(fn)
+        return gauge
+
+    def histogram(
+        self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS
+    ) -> Histogram:
+        return self._get_or_create(Histogram, name, documentation, labelnames, buckets=buckets)
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda metric: metric.name)
+        lines: List[str] = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+_registry = Registry()
+
+
+def get_registry() -> Registry:
+    return _registry
+
+
+STAGE_SECONDS = _registry.histogram(
+    "heat_stage_duration_seconds", "Wall time spent in each processing stage.", ("stage",)
+)
+STAGE_ERRORS = _registry.counter("heat_stage_errors_total", "Stage calls that raised.", ("stage",))
+BYTES_READ = _registry.counter("heat_bytes_read_total", "Raster bytes read from remote assets.", ("source",))
+CACHE_REQUESTS = _registry.counter(
+    "heat_cache_requests_total", "Cache lookups by cache and result.", ("cache", "result")
+)
+TILES_INFERRED = _registry.counter("heat_tiles_inferred_total", "Tiles run through the U-Net.")
+COG_REQUESTS = _registry.counter(
+    "heat_cog_requests_total", "HTTP requests to COG assets by kind, estimated from the tile index.", ("kind",)
+)
+COG_FETCHED_BYTES = _registry.counter(
+    "heat_cog_fetched_bytes_total", "Compressed COG bytes fetched, estimated from the tile index."
+)
+COG_READ_REQUESTS = _registry.histogram(
+    "heat_cog_read_requests", "Range requests per asset window read, estimated from the tile index.", buckets=(0, 1, 2, 4, 8, 16, 32, 64, 128)
+)
+COG_READ_BYTES = _registry.histogram(
+    "heat_cog_read_fetched_bytes",
+    "Compressed bytes fetched per asset window read, estimated from the tile index.",
+    buckets=tuple(2.0 ** power for power in range(14, 31, 2)),
+)
+
+SAS_TOKEN_REQUESTS = _registry.counter(
+    "heat_sas_token_requests_total", "SAS token endpoint calls by collection and outcome.", ("collection", "outcome")
+)
+COMPOSITE_SCENES = _registry.histogram(
+    "heat_composite_scenes", "Scenes merged into each composite map.", ("mode",), buckets=(1, 2, 3, 4, 6, 8, 12)
+)
+SCENE_STATS_INGESTED = _registry.counter(
+    "heat_scene_stats_ingested_total", "Scenes summarized into the statistics index by outcome.", ("status",)
+)
+
+
+class timed(contextlib.ContextDecorator):
+    """Record the duration of a block or function call under ``stage``.
+
+    Usable as ``with timed("stage"):`` or as ``@timed("stage")``.
+    """
+
+    def __init__(self, stage: str) -> None:
+        self.stage = stage
+        self._start = 0.0
+
+    def _recreate_cm(self) -> "timed":
+        # Decorated functions may run concurrently; give every call its own start time.
+        return timed(self.stage)
+
+    def __enter__(self) -> "timed":
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        STAGE_SECONDS.observe(time.perf_counter() - self._start, stage=self.stage)
+        if exc_type is not None:
+            STAGE_ERRORS.inc(stage=self.stage)
+        return False
+
+
+def count_cache(cache: str, hit: bool) -> None:
+    CACHE_REQUESTS.inc(cache=cache, result="hit" if hit else "miss")
@@ -0,0 +1,186 @@
+from __future__ import annotations
+
+import cProfile
+import io
+import json
+import os
+import pstats
+import re
+import threading
+import time
+import tracemalloc
+import uuid
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from flask import Flask, Response, g, request
+
+from .metrics import STAGE_SECONDS
+
+DEFAULT_PROFILE_DIR = Path(__file__).resolve().parent / "profiles"
+DEFAULT_PROFILE_PATHS = "/imagery,/simulate,/weakspots,/score,/tiles"
+PROFILE_HEADER = "X-Profile"
+TOP_FUNCTIONS = 40
+PROFILE_SCOPE = (
+    "cProfile covers only the request thread until the view returns. Work on other threads, such as "
+    "model inference on the InferenceServer worker, shows up only in 'stages'. Stage totals are process-wide, "
+    "so concurrent requests add to them. Streamed bodies (NDJSON) are produced after the profile is saved "
+    "and appear in neither."
+)
+
+PROFILE_ID = re.compile(r"^[0-9]{8}T[0-9]{6}-[0-9a-f]{8}$")
+
+
+def _truthy(value: Optional[str]) -> bool:
+    return (value or "").strip().lower() in ("1", "true", "yes", "on")
+
+
+def _stage_diff(before, after) -> Dict[str, Dict[str, float]]:
+    """Calls and seconds per ``timed`` stage recorded between two totals snapshots, from any thread."""
+    stages = {}
+    for key, (count, total) in after.items():
+        previous_count, previous_total = before.get(key, (0, 0.0))
+        if count > previous_count:
+            stages[key[0]] = {"calls": count - previous_count, "seconds": total - previous_total}
+    return stages
+
+
+class RequestProfiler:
+    """Profiles single, explicitly flagged requests with cProfile and tracemalloc.
+
+    Only one request is profiled at a time because both tools are process-wide;
+    a flagged request arriving while another is being profiled runs unprofiled.
+    """
+
+    def __init__(self, directory: Path, paths: List[str], max_profiles: int = 50) -> None:
+        self.directory = Path(directory)
+        self.paths = [path for path in paths if path]
+        self.max_profiles = max_profiles
+        self._busy = threading.Lock()
+
+    def wants_profile(self) -> bool:
+        if not (_truthy(request.headers.get(PROFILE_HEADER)) or _truthy(request.args.get("profile"))):
+            return False
+        return any(request.path == path or request.path.startswith(path.rstrip("/") + "/") for path in self.paths)
+
+    def start(self) -> None:
+        if not self.wants_profile():
+            return
+        if not self._busy.acquire(blocking=False):
+            g.profile_skipped = True
+            return
+
+        started_tracemalloc = not tracemalloc.is_tracing()
+        if started_tracemalloc:
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+
+        profiler = cProfile.Profile()
+        g.profile = {
+            "id": f"{time.strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:8]}",
+            "profiler": profiler,
+            "started_tracemalloc": started_tracemalloc,
+            "start": time.perf_counter(),
+            "start_memory": tracemalloc.get_traced_memory()[0],
+            "start_stages": STAGE_SECONDS.totals(),
+        }
+        profiler.enable()
+
+    def finish(self, status: Optional[int] = None, error: Optional[BaseException] = None) -> Optional[str]:
+        state = g.pop("profile", None)
+        if state is None:
+            return None
+
+        try:
+            state["profiler"].disable()
+            elapsed = time.perf_counter() - state["start"]
+            current, peak = tracemalloc.get_traced_memory()
+            if state["started_tracemalloc"]:
+                tracemalloc.stop()
+        finally:
+            self._busy.release()
+
+        self._save(state["id"], state["profiler"], {
+            "id": state["id"],
+            "method": request.method,
+            "path": request.path,
+            "query": request.query_string.decode("utf-8", "replace"),
+            "status": status,
+            "error": repr(error) if error is not None else None,
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "duration_seconds": elapsed,
+            "peak_memory_bytes": max(peak - state["start_memory"], 0),
+            "retained_memory_bytes": current - state["start_memory"],
+            "stages": _stage_diff(state["start_stages"], STAGE_SECONDS.totals()),
+            "scope": PROFILE_SCOPE,
+        })
+        return state["id"]
+
+    def _save(self, profile_id: str, profiler: cProfile.Profile, summary: Dict[str, Any]) -> None:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        profiler.dump_stats(str(self.directory / f"{profile_id}.prof"))
+
+        report = io.StringIO()
+        pstats.Stats(profiler, stream=report).sort_stats("cumulative").print_stats(TOP_FUNCTIONS)
+        summary["top_functions"] = report.getvalue()
+        (self.directory / f"{profile_id}.json").write_text(json.dumps(summary, indent=2))
+        print(f"Saved profile {profile_id} for {summary['method']} {summary['path']} ({summary['duration_seconds']:.3f}s)")
+
+        self._prune()
+
+    def _prune(self) -> None:
+        summaries = sorted(self.directory.glob("*.json"))
+        for stale in summaries[: max(len(summaries) - self.max_profiles, 0)]:
+            stale.unlink(missing_ok=True)
+            stale.with_suffix(".prof").unlink(missing_ok=True)
+
+    def path_for(self, profile_id: str, suffix: str) -> Optional[Path]:
+        if not PROFILE_ID.match(profile_id):
+            return None
+        path = self.directory / f"{profile_id}{suffix}"
+        return path if path.exists() else None
+
+    def list_profiles(self) -> List[Dict[str, Any]]:
+        profiles = []
+        for path in sorted(self.directory.glob("*.json"), reverse=True):
+            try:
+                summary = json.loads(path.read_text())
+            except (OSError, json.JSONDecodeError):
+                continue
+            summary.pop("top_functions", None)
+            profiles.append(summary)
+        return profiles
+
+
+def init_profiling(app: Flask) -> Optional[RequestProfiler]:
+    """Enable per-request profiling when PROFILING_ENABLED is set; otherwise register nothing."""
+    if not _truthy(os.getenv("PROFILING_ENABLED")):
+        return None
+
+    profiler = RequestProfiler(
+        Path(os.getenv("PROFILING_DIR", str(DEFAULT_PROFILE_DIR))),
+        os.getenv("PROFILING_PATHS", DEFAULT_PROFILE_PATHS).split(","),
+        max_profiles=int(os.getenv("PROFILING_MAX_PROFILES", "50")),
+    )
+
+    @app.before_request
+    def start_profile() -> None:
+        profiler.start()
+
+    @app.after_request
+    def finish_profile(response: Response) -> Response:
+        profile_id = profiler.finish(status=response.status_code)
+        if profile_id:
+            response.headers["X-Profile-Id"] = profile_id
+        elif g.pop("profile_skipped", False):
+            response.headers["X-Profile-Skipped"] = "another request is being profiled"
+        return response
+
+    @app.teardown_request
+    def abort_profile(error: Optional[BaseException]) -> None:
+        # Only reached with a live profile when the request failed before after_request.
+        profiler.finish(status=500, error=error)
+
+    app.extensions["request_profiler"] = profiler
+    print(f"Request profiling enabled for {profiler.paths}, saving to {profiler.directory}")
+    return profiler
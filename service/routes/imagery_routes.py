@@ -1,15 +1,20 @@
 import base64
+import os
 from typing import Optional, Tuple
 
 from flask import Blueprint, jsonify, request, session
 
 from ..imagery import sat_extract
-from service.routes.simulate_routes import simulate_bp, weakspots_bp
+from ..imagery.array_codec import array_output_params, array_response, wants_array_output
+from ..imagery.composite import COMPOSITE_MODE, COMPOSITE_MODES
 import time
 
 
 imagery_bp = Blueprint("imagery", __name__, url_prefix="/imagery")
 
+# Extraction is retried only when it raises; a search that finds no usable scene is final.
+IMAGERY_ATTEMPTS = int(os.getenv("IMAGERY_ATTEMPTS", "3"))
+
 
 def _validate_query_params() -> Tuple[Optional[str], Optional[str]]:
     city = request.args.get("city")
@@ -21,6 +26,24 @@ def _validate_query_params() -> Tuple[Optional[str], Optional[str]]:
     return city, date
 
 
+def _composite_mode() -> str:
+    mode = request.args.get("composite", COMPOSITE_MODE).strip().lower()
+    if mode not in COMPOSITE_MODES:
+        raise ValueError(f"Unsupported composite mode '{mode}', expected one of {COMPOSITE_MODES}")
+    return mode
+
+
+def _extract_with_retry(extract, label: str, date: str, city: str, session_id: Optional[str], composite: str):
+    for attempt in range(IMAGERY_ATTEMPTS):
+        try:
+            return extract(date, city, session_id=session_id, composite=composite)
+        except Exception as e:
+            print(f"{label} map extraction failed (attempt {attempt + 1}/{IMAGERY_ATTEMPTS}): {e}")
+            if attempt + 1 < IMAGERY_ATTEMPTS:
+                time.sleep(attempt + 1)
+    return None, None, None
+
+
 def _build_response(
     image_bytes: bytes,
     image_date: str,
@@ -48,23 +71,24 @@ def get_ndvi():
 
     session_id = session.get("session_id")
 
+    as_array = wants_array_output()
     try:
-        image_bytes, image_date, bbox = sat_extract.get_ndvi_map(date, city, session_id=session_id)
-    except:
-        image_bytes, image_date, bbox = None, None, None
+        if as_array:
+            array_output_params()
+        composite = _composite_mode()
+    except ValueError as exc:
+        return jsonify({"error": str(exc)}), 400
+    extract = sat_extract.load_ndvi_map if as_array else sat_extract.get_ndvi_map
 
-    while image_bytes is None:
-        print("Retrying NDVI map extraction")
-        try:
-            image_bytes, image_date, bbox = sat_extract.get_ndvi_map(date, city, session_id=session_id)
-        except:
-            image_bytes, image_date, bbox = None, None, None
-        time.sleep(1)
+    image_data, image_date, bbox = _extract_with_retry(extract, "NDVI", date, city, session_id, composite)
 
-    if image_bytes is None:
+    if image_data is None:
         return jsonify({"error": "No valid NDVI imagery found"}), 404
 
-    return _build_response(image_bytes, image_date, bbox, session_id)
+    if as_array:
+        return array_response(image_data, bbox, image_date)
+
+    return _build_response(image_data, image_date, bbox, session_id)
 
 
 @imagery_bp.route("/heat", methods=["GET"])
@@ -76,21 +100,22 @@ def get_heat():
 
     session_id = session.get("session_id")
 
+    as_array = wants_array_output()
     try:
-        image_bytes, image_date, bbox = sat_extract.get_heat_map(date, city, session_id=session_id)
-    except:
-        image_bytes, image_date, bbox = None, None, None
+        if as_array:
+            array_output_params()
+        composite = _composite_mode()
+    except ValueError as exc:
+        return jsonify({"error": str(exc)}), 400
+    extract = sat_extract.load_heat_map if as_array else sat_extract.get_heat_map
 
-    while image_bytes is None:
-        print("Retrying heat map extraction")
-        try:
-            image_bytes, image_date, bbox = sat_extract.get_heat_map(date, city, session_id=session_id)
-        except:
-            image_bytes, image_date, bbox = None, None, None
-        time.sleep(1)
+    image_data, image_date, bbox = _extract_with_retry(extract, "heat", date, city, session_id, composite)
 
-    if image_bytes is None:
+    if image_data is None:
         return jsonify({"error": "No valid thermal imagery found"}), 404
 
-    return _build_response(image_bytes, image_date, bbox, session_id)
+    if as_array:
+        return array_response(image_data, bbox, image_date)
+
+    return _build_response(image_data, image_date, bbox, session_id)
 
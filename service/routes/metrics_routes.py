@@ -0,0 +1,39 @@
+from flask import Blueprint, Response
+
+from service.imagery.cog_reader import get_cog_reader
+from service.imagery.map_tiles import get_tile_cache
+from service.metrics import get_registry
+from service.simulation.inference_server import get_inference_server
+from service.simulation.result_cache import get_simulation_cache
+
+metrics_bp = Blueprint("metrics", __name__, url_prefix="/metrics")
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _inference_queue_depth():
+    return {(): float(get_inference_server().metrics()["queue_depth"])}
+
+
+def _cache_bytes():
+    tile_stats = get_tile_cache().stats()
+    return {
+        ("simulation",): float(get_simulation_cache().stats()["bytes"]),
+        ("tile",): float(tile_stats["bytes"]),
+        ("tile_pyramid",): float(tile_stats["pyramid_bytes"]),
+    }
+
+
+def _open_datasets():
+    return {(): float(get_cog_reader().stats()["datasets"])}
+
+
+registry = get_registry()
+registry.gauge("heat_inference_queue_depth", "Inference requests waiting for the model.", fn=_inference_queue_depth)
+registry.gauge("heat_cache_bytes", "Bytes held by in-process caches.", ("cache",), fn=_cache_bytes)
+registry.gauge("heat_cog_open_datasets", "Remote COG handles kept open by the reader.", fn=_open_datasets)
+
+
+@metrics_bp.route("", methods=["GET"], strict_slashes=False)
+def get_metrics():
+    return Response(registry.render(), content_type=PROMETHEUS_CONTENT_TYPE)
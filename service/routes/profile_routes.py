@@ -0,0 +1,29 @@
+from flask import Blueprint, Response, current_app, jsonify, send_file
+
+profiles_bp = Blueprint("profiles", __name__, url_prefix="/profiles")
+
+
+def _profiler():
+    return current_app.extensions["request_profiler"]
+
+
+@profiles_bp.route("", methods=["GET"], strict_slashes=False)
+def list_profiles():
+    return jsonify({"profiles": _profiler().list_profiles()}), 200
+
+
+@profiles_bp.route("/<profile_id>", methods=["GET"])
+def get_profile(profile_id: str):
+    path = _profiler().path_for(profile_id, ".json")
+    if path is None:
+        return jsonify({"error": "Profile not found"}), 404
+    return Response(path.read_text(), mimetype="application/json")
+
+
+@profiles_bp.route("/<profile_id>/raw", methods=["GET"])
+def get_profile_raw(profile_id: str):
+    """The pstats dump, loadable with ``pstats.Stats`` or snakeviz."""
+    path = _profiler().path_for(profile_id, ".prof")
+    if path is None:
+        return jsonify({"error": "Profile not found"}), 404
+    return send_file(path, mimetype="application/octet-stream", as_attachment=True, download_name=path.name)
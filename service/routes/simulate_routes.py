@@ -3,32 +3,30 @@ import io
 import json
 from typing import List, Optional, Tuple
 
-import matplotlib.pyplot as plt
 import numpy as np
-from flask import Blueprint, jsonify, request, session
-from matplotlib.colors import TwoSlopeNorm
-from pathlib import Path
-import time
-
-from service.imagery.session_store import get_session_data
-from service.simulation.model import build_unet, to_tensor
-import cv2
-from sklearn.cluster import KMeans
+from flask import Blueprint, Response, jsonify, request, session
+
+from service.imagery.array_codec import array_output_params, array_response, wants_array_output
+from service.imagery.score_calculation import get_city_mask
+from service.imagery.session_store import get_derived_data, get_session_data, store_derived_data, store_session_data
+from service.imagery.weak_spots import (
+    find_clusters,
+    get_scored_scene,
+    iter_clusters,
+    percentile_threshold,
+    rank_clusters,
+    region_mask,
+)
+from service.metrics import count_cache, timed
+from service.simulation.inference_server import get_inference_server
+from service.simulation.planner import plan_interventions
+from service.simulation.result_cache import get_simulation_cache, raster_version, simulation_cache_key
+from service.simulation.simulator import rasterize_interventions, simulate_heat_delta
 
 
 simulate_bp = Blueprint("simulate", __name__, url_prefix="/simulate")
 weakspots_bp = Blueprint("weakspots", __name__, url_prefix="/weakspots")
 
-weights_path = (
-    Path(__file__).resolve().parent.parent
-    / "simulation"
-    / "checkpoints"
-    / "epoch_06.weights.h5"
-)
-model = build_unet()
-model.load_weights(weights_path)
-print(f"Model loaded from {weights_path}")
-
 
 def _validate_query_params() -> Tuple[Optional[List[str]], Optional[List[float]], Optional[List[float]]]:
     payload = request.get_json(silent=True) or {}
@@ -60,6 +58,13 @@ def simulate():
     if point_types is None or point_latitudes is None or point_longitudes is None:
         return jsonify({"error": "Missing required query parameters: types, lats, lons"}), 400
 
+    as_array = wants_array_output()
+    if as_array:
+        try:
+            array_output_params()
+        except ValueError as exc:
+            return jsonify({"error": str(exc)}), 400
+
     session_id = session.get("session_id")
     if not session_id:
         return jsonify({"error": "Session ID not found"}), 400
@@ -77,155 +82,225 @@ def simulate():
     bbox = session_data["heat_map"]["bbox"]
     heat_shape = heat_map.shape
 
-    ndvi_delta = np.zeros(heat_shape, dtype=np.float32)
-    lon_min, lat_min, lon_max, lat_max = bbox
-
-    for point_type, point_latitude, point_longitude in zip(
-        point_types, point_latitudes, point_longitudes
-    ):
-        col = (point_longitude - lon_min) / (lon_max - lon_min) * heat_shape[1]
-        row = (lat_max - point_latitude) / (lat_max - lat_min) * heat_shape[0]
-
-        row = int(np.clip(row, 0, heat_shape[0] - 1))
-        col = int(np.clip(col, 0, heat_shape[1] - 1))
-
-        if point_type == "trees":
-            ndvi_delta[row, col] += 0.3
-        elif point_type == "shrubs":
-            ndvi_delta[row, col] += 0.15
-        elif point_type == "grass":
-            ndvi_delta[row, col] += 0.05
-        elif point_type == "buildings":
-            ndvi_delta[row, col] -= 0.3
-        elif point_type == "roads":
-            ndvi_delta[row, col] -= 0.15
-        elif point_type == "waterbodies":
-            ndvi_delta[row, col] -= 0.9
-
-        ndvi_delta[row, col] = np.clip(ndvi_delta[row, col], -2, 2)
-
-    tile_size = 128
-    stride = 64
-
-    padded_rows = int(np.ceil(ndvi_delta.shape[0] / stride) * stride + (tile_size - stride))
-    padded_cols = int(np.ceil(ndvi_delta.shape[1] / stride) * stride + (tile_size - stride))
-
-    padded_ndvi = np.zeros((padded_rows, padded_cols), dtype=np.float32)
-    padded_ndvi[: ndvi_delta.shape[0], : ndvi_delta.shape[1]] = ndvi_delta
-
-    heat_delta = np.zeros_like(padded_ndvi, dtype=np.float32)
-    heat_weights = np.zeros_like(padded_ndvi, dtype=np.float32)
-
-    timer = time.time()
-
-    for row in range(0, padded_rows - tile_size + 1, stride):
-        for col in range(0, padded_cols - tile_size + 1, stride):
-            if np.isnan(padded_ndvi[row : row + tile_size, col : col + tile_size]).all():
-                continue
-            ndvi_chunk = padded_ndvi[row : row + tile_size, col : col + tile_size]
-            chunk_tensor = to_tensor([{"ndvi_delta": ndvi_chunk}], "ndvi_delta")
-            predicted_chunk = model.predict(chunk_tensor, verbose=0)
-            predicted_chunk = np.squeeze(predicted_chunk, axis=(0, 3))
-
-            mean_non_zero_ndvi = np.mean(ndvi_chunk[ndvi_chunk != 0])
-            if mean_non_zero_ndvi > 0:
-                predicted_chunk = np.where(predicted_chunk < 0, predicted_chunk * 35, predicted_chunk)
-                predicted_chunk = np.where(predicted_chunk > 0, predicted_chunk * -8, predicted_chunk)
-                print(f"Adjusting vegetation growth: {mean_non_zero_ndvi}")
-            elif mean_non_zero_ndvi < -0.6:
-                print(f"Adjusting water: {mean_non_zero_ndvi}")
-                predicted_chunk = np.abs(predicted_chunk)*-20
-            elif mean_non_zero_ndvi < 0:
-                predicted_chunk = np.where(predicted_chunk > 0, predicted_chunk * 12, predicted_chunk)
-                print(f"Adjusting city: {mean_non_zero_ndvi}")
-
-            heat_delta[row : row + tile_size, col : col + tile_size] += predicted_chunk
-            heat_weights[row : row + tile_size, col : col + tile_size] += 1.0
-
-    print(f"Generation time: {time.time() - timer}")
-
-    heat_weights = np.where(heat_weights == 0, 1.0, heat_weights)
-    heat_delta = heat_delta / heat_weights
-    heat_delta = heat_delta[: ndvi_delta.shape[0], : ndvi_delta.shape[1]]
-
-    heat_min = float(np.nanmin(heat_delta))
-    heat_max = float(np.nanmax(heat_delta))
-
-    # heat_delta = np.where(heat_delta < 0, heat_delta * 35, heat_delta)
+    simulation_cache = get_simulation_cache()
+    cache_key = simulation_cache_key(
+        zip(point_types, point_latitudes, point_longitudes),
+        raster_version(heat_map, session_data["heat_map"].get("fingerprint")),
+        bbox,
+        get_inference_server().model_version,
+    )
+    cached = simulation_cache.get(cache_key)
+    count_cache("simulation", cached is not None)
+    if cached is not None:
+        heat_delta, image_bytes = cached
+        if as_array or image_bytes:
+            # Tiles of the simulated layer follow the latest simulation, cached or not.
+            new_heat_map = heat_map + heat_delta
+            store_session_data(session_id, "simulated_heat_map", new_heat_map, session_data["heat_map"]["asset_date"], bbox)
+        if as_array:
+            return array_response(new_heat_map, bbox)
+        if image_bytes:
+            return jsonify({"heat_map_image": base64.b64encode(image_bytes).decode("utf-8"), "bbox": bbox}), 200
+    else:
+        ndvi_delta = rasterize_interventions(zip(point_types, point_latitudes, point_longitudes), bbox, heat_shape)
+        heat_delta = simulate_heat_delta(ndvi_delta)
 
     new_heat_map = heat_map + heat_delta
+    store_session_data(session_id, "simulated_heat_map", new_heat_map, session_data["heat_map"]["asset_date"], bbox)
+
+    if as_array:
+        simulation_cache.put(cache_key, heat_delta, b"")
+        return array_response(new_heat_map, bbox)
 
-    heat_vmin = float(np.nanmin([np.nanmin(heat_map), np.nanmin(new_heat_map)]))
-    heat_vmax = float(np.nanmax([np.nanmax(heat_map), np.nanmax(new_heat_map)]))
+    with timed("render_png"):
+        import matplotlib
+        matplotlib.use("Agg")
+        import matplotlib.pyplot as plt
 
-    fig_heat, ax_heat = plt.subplots(figsize=(6, 5))
-    im_new = ax_heat.imshow(new_heat_map, cmap="inferno", vmin=-10, vmax=40)
-    ax_heat.axis("off")
+        fig_heat, ax_heat = plt.subplots(figsize=(6, 5))
+        im_new = ax_heat.imshow(new_heat_map, cmap="inferno", vmin=-10, vmax=40)
+        ax_heat.axis("off")
 
-    buffer = io.BytesIO()
-    plt.tight_layout(pad=0)
-    fig_heat.savefig(buffer, format="png", bbox_inches="tight", pad_inches=0)
-    plt.close(fig_heat)
+        buffer = io.BytesIO()
+        plt.tight_layout(pad=0)
+        fig_heat.savefig(buffer, format="png", bbox_inches="tight", pad_inches=0)
+        plt.close(fig_heat)
     buffer.seek(0)
-    heat_map_base64 = base64.b64encode(buffer.read()).decode("utf-8")
+    image_bytes = buffer.read()
+    simulation_cache.put(cache_key, heat_delta, image_bytes)
+    heat_map_base64 = base64.b64encode(image_bytes).decode("utf-8")
 
     return jsonify({"heat_map_image": heat_map_base64, "bbox": bbox}), 200
 
 
-@weakspots_bp.route("", methods=["GET"], strict_slashes=False)
-def find_weak_spots():
-    session_id = session.get("session_id")
-    if not session_id:
-        return jsonify({"error": "Session ID not found"}), 400
-
-    session_data = get_session_data(session_id)
-    if not session_data:
-        return jsonify({"error": "Session data not found"}), 400
-
-    heat_entry = session_data.get("heat_map")
-    ndvi_entry = session_data.get("ndvi_map") or session_data.get("ndvi")
+@simulate_bp.route("/metrics", methods=["GET"])
+def get_inference_metrics():
+    return jsonify({**get_inference_server().metrics(), "result_cache": get_simulation_cache().stats()}), 200
 
-    if not heat_entry or "data" not in heat_entry:
-        return jsonify({"error": "Heat map not available"}), 400
-    if not ndvi_entry or "data" not in ndvi_entry:
-        return jsonify({"error": "Vegetation map not available"}), 400
 
-    heat_map = heat_entry["data"]
-    ndvi_map = ndvi_entry["data"]
-    bbox = heat_entry["bbox"]
+def _plan_params():
+    payload = request.get_json(silent=True) or {}
+    intervention = str(payload.get("type", "trees")).strip()
+    budget = int(payload.get("count", 200))
+    step = int(payload.get("step", 10))
+    beam_width = int(payload.get("beam_width", 1))
+    max_sites = int(payload.get("max_sites", 20))
+    city = payload.get("city") or None
 
-    heat_norm = np.clip((heat_map - np.nanmin(heat_map)) / (np.nanmax(heat_map) - np.nanmin(heat_map) + 1e-6), 0, 1)
-    ndvi_norm = np.clip((ndvi_map - np.nanmin(ndvi_map)) / (np.nanmax(ndvi_map) - np.nanmin(ndvi_map) + 1e-6), 0, 1)
+    if not 1 <= budget <= 5000:
+        raise ValueError("count must be between 1 and 5000")
+    if step < 1 or beam_width < 1 or max_sites < 1:
+        raise ValueError("step, beam_width and max_sites must be at least 1")
+    if beam_width > 16 or max_sites > 100:
+        raise ValueError("beam_width must be at most 16 and max_sites at most 100")
 
-    score_map = heat_norm * (1.0 - ndvi_norm)
-    score_map = cv2.GaussianBlur(score_map.astype(np.float32), (9, 9), 0)
+    return intervention, budget, step, beam_width, max_sites, city
 
-    valid_scores = score_map[np.isfinite(score_map)]
-    if valid_scores.size == 0:
-        return jsonify({"clusters": [], "threshold": None}), 200
 
-    threshold = float(np.percentile(valid_scores, 95))
+@simulate_bp.route("/plan", methods=["POST"])
+def plan_simulation():
+    session_id = session.get("session_id")
+    if not session_id:
+        return jsonify({"error": "Session ID not found"}), 400
 
-    binary = (score_map >= threshold).astype(np.uint8)
-    kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (7, 7))
-    binary = cv2.morphologyEx(binary, cv2.MORPH_OPEN, kernel, iterations=1)
-    binary = cv2.morphologyEx(binary, cv2.MORPH_DILATE, kernel, iterations=2)
+    try:
+        intervention, budget, step, beam_width, max_sites, city = _plan_params()
+    except (TypeError, ValueError) as exc:
+        return jsonify({"error": f"Invalid plan parameters: {exc}"}), 400
+
+    scene, error = get_scored_scene(session_id)
+    if scene is None:
+        return jsonify({"error": error}), 400
+
+    bbox = scene["bbox"]
+    shape = scene["score_map"].shape
+
+    mask = None
+    if city:
+        mask = get_derived_data(session_id, "city_mask", (scene["revisions"][0], city))
+        if mask is None:
+            mask = get_city_mask(city, bbox, shape)
+            if mask is None:
+                return jsonify({"error": f"Could not find administrative boundary for {city}"}), 400
+            store_derived_data(session_id, "city_mask", (scene["revisions"][0], city), mask)
+
+    threshold = scene["threshold"] if mask is None else percentile_threshold(scene["score_map"], 95, mask)
+    if threshold is None:
+        return jsonify({"error": "No valid pixels inside the planning area"}), 400
+
+    clusters = find_clusters(
+        scene["score_map"], scene["heat_map"], scene["ndvi_map"], threshold, bbox, top_k=max_sites, region=mask
+    )
+    if not clusters:
+        return jsonify({"error": "No weak spots found to plan around"}), 400
 
-    num_labels, labels, stats, centroids = cv2.connectedComponentsWithStats(binary, connectivity=8)
+    try:
+        result = plan_interventions(
+            [(cluster["lat"], cluster["lon"]) for cluster in clusters],
+            bbox,
+            np.ones(shape, dtype=bool) if mask is None else mask,
+            intervention,
+            budget,
+            step,
+            beam_width,
+        )
+    except ValueError as exc:
+        return jsonify({"error": str(exc)}), 400
+
+    print(
+        f"Planned {result['placed']} {intervention} in {result['elapsed']:.2f}s "
+        f"({result['tiles_predicted']} of {result['tiles_evaluated']} tile evaluations predicted)"
+    )
+    return jsonify({**result, "bbox": bbox, "city": city}), 200
+
+
+def _parse_bbox(value: str) -> Tuple[float, float, float, float]:
+    parts = [float(v) for v in value.split(",")]
+    if len(parts) != 4 or parts[0] >= parts[2] or parts[1] >= parts[3]:
+        raise ValueError("bbox must be lon_min,lat_min,lon_max,lat_max")
+    return tuple(parts)
+
+
+def _parse_polygon(value: str) -> List[Tuple[float, float]]:
+    points = [(float(lon), float(lat)) for lon, lat in json.loads(value)]
+    if len(points) < 3:
+        raise ValueError("polygon needs at least three [lon, lat] points")
+    return points
+
+
+def _weak_spot_params():
+    args = request.args
+    percentile = float(args.get("percentile", 95))
+    min_area = int(args.get("min_area", 100))
+    top_k = int(args["top_k"]) if args.get("top_k") else None
+
+    if not 0 < percentile <= 100:
+        raise ValueError("percentile must be in (0, 100]")
+    if min_area < 1:
+        raise ValueError("min_area must be at least 1")
+    if top_k is not None and top_k < 1:
+        raise ValueError("top_k must be at least 1")
+
+    sub_bbox = _parse_bbox(args["bbox"]) if args.get("bbox") else None
+    polygon = _parse_polygon(args["polygon"]) if args.get("polygon") else None
+    return percentile, min_area, top_k, sub_bbox, polygon
+
+
+def _wants_ndjson() -> bool:
+    if request.args.get("stream", "").lower() in ("1", "true", "yes"):
+        return True
+    return request.accept_mimetypes.best == "application/x-ndjson"
 
-    lon_min, lat_min, lon_max, lat_max = bbox
-    h, w = heat_map.shape
 
-    centers = []
+@weakspots_bp.route("", methods=["GET"], strict_slashes=False)
+def find_weak_spots():
+    session_id = session.get("session_id")
+    if not session_id:
+        return jsonify({"error": "Session ID not found"}), 400
 
-    for label in range(1, num_labels):
-        area = stats[label, cv2.CC_STAT_AREA]
-        if area < 100:
-            continue
+    try:
+        percentile, min_area, top_k, sub_bbox, polygon = _weak_spot_params()
+    except (TypeError, ValueError, KeyError) as exc:
+        return jsonify({"error": f"Invalid weak spot parameters: {exc}"}), 400
+
+    scene, error = get_scored_scene(session_id)
+    if scene is None:
+        return jsonify({"error": error}), 400
+
+    score_map = scene["score_map"]
+    bbox = scene["bbox"]
+    region = region_mask(score_map.shape, bbox, sub_bbox, polygon)
+
+    if region is None and percentile == 95:
+        threshold = scene["threshold"]
+    else:
+        threshold = percentile_threshold(score_map, percentile, region)
+
+    if _wants_ndjson():
+        def generate():
+            yield json.dumps({"threshold": threshold}) + "\n"
+            if threshold is None:
+                return
+            clusters = iter_clusters(
+                score_map, scene["heat_map"], scene["ndvi_map"], threshold, bbox, min_area, region
+            )
+            # Worst spots first, as in the JSON response; ranking needs every cluster, so the
+            # stream starts once labelling is done and then sends one line per cluster.
+            for cluster in rank_clusters(clusters, top_k):
+                yield json.dumps(cluster) + "\n"
+
+        return Response(generate(), mimetype="application/x-ndjson")
+
+    if threshold is None:
+        return jsonify({"clusters": [], "threshold": None}), 200
 
-        cx, cy = centroids[label]
-        lon = lon_min + (cx / w) * (lon_max - lon_min)
-        lat = lat_max - (cy / h) * (lat_max - lat_min)
-        centers.append({"lat": float(lat), "lon": float(lon), "pixels": int(area)})
+    version = (scene["revisions"], percentile, min_area, top_k, sub_bbox, json.dumps(polygon))
+    result = get_derived_data(session_id, "weak_spots", version)
+    if result is None:
+        clusters = find_clusters(
+            score_map, scene["heat_map"], scene["ndvi_map"], threshold, bbox, min_area, top_k, region
+        )
+        result = {"clusters": clusters, "threshold": threshold}
+        store_derived_data(session_id, "weak_spots", version, result)
 
-    return jsonify({"clusters": centers, "threshold": threshold}), 200
+    return jsonify(result), 200
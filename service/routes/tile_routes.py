@@ -0,0 +1,54 @@
+import hashlib
+
+from flask import Blueprint, Response, jsonify, request
+
+from service.imagery.map_tiles import LAYERS, build_pyramid, encode_png, get_tile_cache, sample_tile
+from service.imagery.session_store import get_session_entry, get_session_revision
+from service.metrics import count_cache
+
+tiles_bp = Blueprint("tiles", __name__, url_prefix="/tiles")
+
+
+@tiles_bp.route("/<session_id>/<layer>/<int:z>/<int:x>/<int:y>.png", methods=["GET"])
+def get_tile(session_id: str, layer: str, z: int, x: int, y: int):
+    style = LAYERS.get(layer)
+    if style is None:
+        return jsonify({"error": f"Unknown layer '{layer}', expected one of {sorted(LAYERS)}"}), 404
+    if z < 0 or z > 24 or not (0 <= x < 2 ** z) or not (0 <= y < 2 ** z):
+        return jsonify({"error": "Tile coordinates out of range"}), 400
+
+    data_type = style["data_type"]
+    revision = get_session_revision(session_id, data_type)
+    if revision is None:
+        return jsonify({"error": "Layer not available for this session"}), 404
+
+    etag = hashlib.sha1(f"{session_id}/{layer}/{revision}/{z}/{x}/{y}".encode("utf-8")).hexdigest()
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+        response.set_etag(etag)
+        return response
+
+    cache = get_tile_cache()
+    tile_key = (session_id, layer, revision, z, x, y)
+    tile = cache.get_tile(tile_key)
+    count_cache("tile", tile is not None)
+
+    if tile is None:
+        pyramid_key = (session_id, data_type, revision)
+        cached = cache.get_pyramid(pyramid_key)
+        count_cache("tile_pyramid", cached is not None)
+        if cached is None:
+            entry = get_session_entry(session_id, data_type)
+            if entry is None or entry["revision"] != revision:
+                return jsonify({"error": "Layer changed while rendering, retry"}), 409
+            cached = (build_pyramid(entry["data"]), entry["bbox"])
+            cache.put_pyramid(pyramid_key, *cached)
+
+        pyramid, bbox = cached
+        tile = encode_png(sample_tile(pyramid, bbox, z, x, y), style["cmap"], style["vmin"], style["vmax"])
+        cache.put_tile(tile_key, tile)
+
+    response = Response(tile, mimetype="image/png")
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = "private, no-cache"
+    return response
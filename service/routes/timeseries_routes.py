@@ -0,0 +1,72 @@
+from typing import Optional
+
+from flask import Blueprint, jsonify, request
+
+from service.imagery.scene_stats import PERIODS, get_scene_stats_store, linear_trend
+
+timeseries_bp = Blueprint("timeseries", __name__, url_prefix="/timeseries")
+
+INTERVALS = ("none", *PERIODS)
+
+
+def _float_arg(name: str) -> Optional[float]:
+    value = request.args.get(name)
+    if value is None or value == "":
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        raise ValueError(f"Query parameter '{name}' must be a number")
+
+
+@timeseries_bp.route("", methods=["GET"], strict_slashes=False)
+def get_timeseries():
+    """Per-scene heat and NDVI statistics of a city from the scene index, with optional per-period means and a trend."""
+    city = request.args.get("city")
+    if not city:
+        return jsonify({"error": "Missing required query parameters: city"}), 400
+
+    interval = request.args.get("interval", "none").strip().lower()
+    if interval not in INTERVALS:
+        return jsonify({"error": f"Unsupported interval '{interval}', expected one of {INTERVALS}"}), 400
+    try:
+        filters = {
+            "start": request.args.get("start") or None,
+            "end": request.args.get("end") or None,
+            "phase": request.args.get("phase") or None,
+            "max_cloud_cover": _float_arg("max_cloud"),
+            "max_missing": _float_arg("max_missing"),
+        }
+    except ValueError as exc:
+        return jsonify({"error": str(exc)}), 400
+
+    store = get_scene_stats_store()
+    indexed_city = store.resolve_city(city)
+    if indexed_city is None:
+        return jsonify({"error": f"No indexed scenes for {city}"}), 404
+
+    scenes = store.scenes(indexed_city, **filters)
+    dates = [scene["asset_date"] for scene in scenes]
+    heat_island = [
+        None if scene["heat_in_city_mean"] is None or scene["heat_out_city_mean"] is None
+        else scene["heat_in_city_mean"] - scene["heat_out_city_mean"]
+        for scene in scenes
+    ]
+    response = {
+        "city": indexed_city,
+        "filters": filters,
+        "scenes": scenes,
+        "trend": {
+            "heat_mean": linear_trend(dates, [scene["heat_mean"] for scene in scenes]),
+            "heat_island": linear_trend(dates, heat_island),
+            "ndvi_mean": linear_trend(dates, [scene["ndvi_mean"] for scene in scenes]),
+        },
+    }
+    if interval != "none":
+        response["periods"] = store.aggregate(indexed_city, interval, **filters)
+    return jsonify(response), 200
+
+
+@timeseries_bp.route("/cities", methods=["GET"])
+def get_indexed_cities():
+    return jsonify({"cities": get_scene_stats_store().cities()}), 200
@@ -1,18 +1,22 @@
-import pickle
+import argparse
+import bisect
+import json
+import os
+import re
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import lru_cache
 from pathlib import Path
-from typing import Any, Dict, List, Set, Tuple
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
 
 import numpy as np
-import planetary_computer as pc
-from pystac_client import Client
+from numpy.lib.stride_tricks import sliding_window_view
 
-from service.imagery.sat_extract import convert_to_celsius, geocode_city, load_band
-
-catalog = Client.open(
-    "https://planetarycomputer.microsoft.com/api/stac/v1",
-    modifier=pc.sign_inplace
-)
+from service.imagery.conversions import ndvi_from_reflectance
+from service.imagery.sat_extract import geocode_city, get_catalog, load_band
+from service.imagery.scene_stats import CityMasks, SceneStatsStore, get_scene_stats_store, record_scene
+from service.simulation.sample_store import SHARD_SIZE, SampleStore, SampleWriter
 
 cities = [
     "Brampton, ON, Canada",
@@ -47,26 +51,231 @@ def get_vegetation_phase(month):
         return "senescence"
 
 DATA_DIR = Path(__file__).resolve().parent / "data"
-DATA_DIR.mkdir(parents=True, exist_ok=True)
-CHECKPOINT_PATH = DATA_DIR / "data_samples_checkpoint.pkl"
-FINAL_PATH = DATA_DIR / "data_samples.pkl"
-CHECKPOINT_INTERVAL = 100
-
-
-def load_existing_samples() -> List[Dict[str, Any]]:
-    existing_path = CHECKPOINT_PATH if CHECKPOINT_PATH.exists() else FINAL_PATH
-
-    if existing_path.exists():
-        print(f"Loading existing samples from {existing_path}")
-        with existing_path.open("rb") as f:
-            return pickle.load(f)
-    return []
+SCENES_DIRNAME = "scenes"
+MANIFEST_FILENAME = "manifest.jsonl"
+SAMPLES_DIRNAME = "samples"
+LEGACY_SAMPLES_FILENAME = "data_samples.pkl"
+
+CHUNK_SIZE = 128
+HALF_CHUNK = CHUNK_SIZE // 2
+MAX_MEAN_HEAT_DIFF = 2.5
+
+# Items in these states are never fetched again; "error" items are retried on the next run.
+DONE_STATUSES = ("ok", "rejected")
+
+
+class SceneManifest:
+    """Append-only JSON-lines record of every processed item, used to resume interrupted runs."""
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self._lock = threading.Lock()
+        self._records: Dict[str, Dict[str, Any]] = {}
+
+        if path.exists():
+            with path.open("r", encoding="utf-8") as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        # A run killed mid-write leaves a truncated last line.
+                        continue
+                    self._records[record["scene_id"]] = record
+
+    def is_done(self, scene_id: str) -> bool:
+        record = self._records.get(scene_id)
+        if record is None or record["status"] not in DONE_STATUSES:
+            return False
+        return record["status"] != "ok" or (self.path.parent / record["path"]).exists()
+
+    def add(self, record: Dict[str, Any]) -> None:
+        line = json.dumps(record) + "\n"
+        with self._lock:
+            with self.path.open("a", encoding="utf-8") as f:
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+            self._records[record["scene_id"]] = record
+
+    def scenes(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [record for record in self._records.values() if record["status"] == "ok"]
+
+    def counts(self) -> Dict[str, int]:
+        counts: Dict[str, int] = {}
+        with self._lock:
+            for record in self._records.values():
+                counts[record["status"]] = counts.get(record["status"], 0) + 1
+        return counts
+
+
+def scene_id(city: str, item_id: str) -> str:
+    """Items overlapping several cities are cropped once per city, so scenes are keyed by both."""
+    return f"{re.sub(r'[^A-Za-z0-9]+', '_', city).strip('_').lower()}__{item_id}"
+
+
+def geocode_with_retry(city: str, attempts: int = 5) -> Tuple[float, float, float, float]:
+    for attempt in range(attempts):
+        try:
+            return geocode_city(city)
+        except Exception as e:
+            print(f"Error geocoding city {city}: {e}")
+            time.sleep(1 + attempt)
+    raise RuntimeError(f"Could not geocode {city} after {attempts} attempts")
 
 
-def save_samples(samples: List[Dict[str, Any]], path: Path, label: str) -> None:
-    with path.open("wb") as f:
-        pickle.dump(samples, f)
-    print(f"[{label}] Saved {len(samples)} samples to {path}")
+def search_city_items(city: str, start: str, end: str, max_cloud_cover: float):
+    bbox = geocode_with_retry(city)
+    search = get_catalog().search(
+        collections=["landsat-c2-l2"],
+        bbox=bbox,
+        datetime=f"{start}/{end}",
+        query={
+            "eo:cloud_cover": {"lt": max_cloud_cover},
+        },
+    )
+    items = list(search.item_collection())
+    print(f"Found {len(items)} items for {city}")
+    return bbox, items
+
+
+def compute_scene(item, bbox, band_pool: ThreadPoolExecutor) -> Optional[Dict[str, Any]]:
+    """Fetch the red, NIR and thermal bands of one item concurrently and derive NDVI and LST."""
+    red_future = band_pool.submit(load_band, item, "red", bbox, apply_scale=True, nodata_value=None, verbose=False)
+    nir_future = band_pool.submit(load_band, item, "nir08", bbox, apply_scale=True, nodata_value=None, verbose=False)
+    heat_future = band_pool.submit(load_band, item, "lwir11", bbox, verbose=False, celsius=True)
+
+    red, _, _ = red_future.result()
+    nir, _, _ = nir_future.result()
+    heat_celsius, _, _ = heat_future.result()
+
+    if red is None or np.isnan(red).any():
+        return None
+    if nir is None or np.isnan(nir).any():
+        return None
+    if heat_celsius is None or np.isnan(heat_celsius).any():
+        return None
+
+    ndvi = np.clip(ndvi_from_reflectance(red, nir), -1.0, 1.0)
+
+    if np.isnan(ndvi).any():
+        return None
+
+    asset_date = item.properties["datetime"].split("T")[0]
+    asset_month = int(asset_date.split("-")[1])
+
+    return {
+        "ndvi": ndvi.astype(np.float32),
+        "heat": heat_celsius.astype(np.float32),
+        "mean_heat": float(np.nanmean(heat_celsius)),
+        "shape": list(ndvi.shape),
+        "asset_date": asset_date,
+        "vegetation_phase": get_vegetation_phase(asset_month),
+    }
+
+
+def write_scene(scenes_dir: Path, name: str, ndvi: np.ndarray, heat: np.ndarray) -> Path:
+    """Write a scene atomically so a crash never leaves a half-written file behind."""
+    path = scenes_dir / f"{name}.npz"
+    tmp_path = scenes_dir / f".{name}.npz.tmp"
+    with tmp_path.open("wb") as f:
+        np.savez(f, ndvi=ndvi, heat=heat)
+    os.replace(tmp_path, path)
+    return path
+
+
+def process_item(
+    city: str,
+    item,
+    bbox,
+    data_dir: Path,
+    manifest: SceneManifest,
+    band_pool: ThreadPoolExecutor,
+    stats_store: Optional[SceneStatsStore] = None,
+    masks: Optional[CityMasks] = None,
+) -> str:
+    record: Dict[str, Any] = {"scene_id": scene_id(city, item.id), "item_id": item.id, "city": city}
+    try:
+        scene = compute_scene(item, bbox, band_pool)
+        if scene is None:
+            record["status"] = "rejected"
+        else:
+            if stats_store is not None:
+                # The bands are already in memory, so the time-series index gets this scene for free.
+                record_scene(
+                    stats_store, city, item, bbox, scene["heat"], scene["ndvi"], masks or CityMasks(),
+                    scene["vegetation_phase"],
+                )
+            path = write_scene(data_dir / SCENES_DIRNAME, record["scene_id"], scene.pop("ndvi"), scene.pop("heat"))
+            record.update(scene)
+            record.update({"status": "ok", "path": str(path.relative_to(data_dir))})
+    except Exception as e:
+        record.update({"status": "error", "error": repr(e)})
+
+    manifest.add(record)
+    return record["status"]
+
+
+def collect_scenes(
+    city_names: List[str],
+    data_dir: Path,
+    start: str = "2015-01-01",
+    end: str = "2025-12-31",
+    max_cloud_cover: float = 10,
+    workers: int = 8,
+    stats_store: Optional[SceneStatsStore] = None,
+) -> SceneManifest:
+    """Search every city and fetch all matching items concurrently, skipping items already in the manifest.
+
+    With ``stats_store`` every accepted scene is also summarized into the per-scene statistics index.
+    """
+    (data_dir / SCENES_DIRNAME).mkdir(parents=True, exist_ok=True)
+    manifest = SceneManifest(data_dir / MANIFEST_FILENAME)
+    masks = CityMasks()
+
+    with ThreadPoolExecutor(max_workers=workers) as item_pool, \
+            ThreadPoolExecutor(max_workers=workers * 3) as band_pool:
+        searches = {
+            item_pool.submit(search_city_items, city, start, end, max_cloud_cover): city
+            for city in dict.fromkeys(city_names)
+        }
+
+        item_futures = []
+        for future in as_completed(searches):
+            city = searches[future]
+            try:
+                bbox, items = future.result()
+            except Exception as e:
+                print(f"Skipping {city}: {e}")
+                continue
+
+            pending = [item for item in items if not manifest.is_done(scene_id(city, item.id))]
+            print(f"{city}: {len(items) - len(pending)} items already done, {len(pending)} queued")
+            item_futures += [
+                item_pool.submit(process_item, city, item, bbox, data_dir, manifest, band_pool, stats_store, masks)
+                for item in pending
+            ]
+
+        for idx, future in enumerate(as_completed(item_futures)):
+            future.result()
+            counts = manifest.counts()
+            print(
+                f"{idx+1}/{len(item_futures)} items "
+                f"({counts.get('ok', 0)} good, {counts.get('rejected', 0)} rejected, {counts.get('error', 0)} errors)",
+                end="\r",
+            )
+
+    print()
+    return manifest
+
+
+@lru_cache(maxsize=16)
+def load_scene(path: str) -> Tuple[np.ndarray, np.ndarray]:
+    with np.load(path) as scene:
+        return scene["ndvi"], scene["heat"]
 
 
 def sample_key(sample: Dict[str, Any]) -> Tuple[str, str, str, str, int, int]:
@@ -82,173 +291,162 @@ def sample_key(sample: Dict[str, Any]) -> Tuple[str, str, str, str, int, int]:
     )
 
 
-ndvi_heat_pairs: List[Dict[str, Any]] = []
-data_samples: List[Dict[str, Any]] = load_existing_samples()
-existing_keys: Set[Tuple[str, str, str, str, int, int]] = {
-    sample_key(sample) for sample in data_samples
-}
-samples_since_checkpoint = 0
-
-chunk_size = 128
-half_chunk = chunk_size // 2
-
-for city in cities:
-    bbox = None
-    while not bbox:
-        try:
-            bbox = geocode_city(city)
-        except Exception as e:
-            print(f"Error geocoding city {city}: {e}")
-            time.sleep(1)
-
-    search = catalog.search(
-        collections=["landsat-c2-l2"],
-        bbox=bbox,
-        datetime=f"2015-01-01/2025-12-31",
-        query={
-            "eo:cloud_cover": {"lt": 10},
-        },
-    )
-
-    items = list(search.item_collection())
-    good_images = 0
-
-    print(f"Found {len(items)} items for {city}")
-
-    for idx, item in enumerate(items):
-
-        print(f"{idx+1}/{len(items)} ({good_images} good images)", end="\r")
-
-        red, profile_red, red_asset = load_band(
-            item, "red", bbox, apply_scale=True, nodata_value=None, verbose=False
-        )
-        if red is None or np.isnan(red).any():
-            continue
-        
-        nir, profile_nir, nir_asset = load_band(
-            item, "nir08", bbox, apply_scale=True, nodata_value=None, verbose=False
-        )
-        if nir is None or np.isnan(nir).any():
-            continue
-
-        heat_dn, profile_heat, heat_asset = load_band(
-            item, "lwir11", bbox, apply_scale=False, verbose=False
-        )
-        if heat_dn is None or np.isnan(heat_dn).any():
-            continue
-
-        heat_celsius = convert_to_celsius(heat_asset, heat_dn)
-        if np.isnan(heat_celsius).any():
+def scene_shape(scene: Dict[str, Any], data_dir: Path) -> Tuple[int, ...]:
+    if scene.get("shape"):
+        return tuple(scene["shape"])
+    # Manifests written before shapes were recorded.
+    with np.load(data_dir / scene["path"], mmap_mode="r") as arrays:
+        return tuple(arrays["ndvi"].shape)
+
+
+def group_scenes(scenes: List[Dict[str, Any]], data_dir: Path) -> Dict[Tuple, List[Dict[str, Any]]]:
+    """Bucket scenes that may pair with each other, each bucket sorted by mean heat."""
+    groups: Dict[Tuple, List[Dict[str, Any]]] = {}
+    for scene in scenes:
+        key = (scene["city"], scene["vegetation_phase"], scene_shape(scene, data_dir))
+        groups.setdefault(key, []).append(scene)
+    for group in groups.values():
+        group.sort(key=lambda scene: (scene["mean_heat"], scene["asset_date"], scene["scene_id"]))
+    return groups
+
+
+def iter_pairs(
+    groups: Dict[Tuple, List[Dict[str, Any]]], tolerance: float = MAX_MEAN_HEAT_DIFF
+) -> Iterator[Tuple[Dict[str, Any], Dict[str, Any]]]:
+    """Yield every ordered pair within a group whose mean heats differ by at most ``tolerance``."""
+    for group in groups.values():
+        heats = [scene["mean_heat"] for scene in group]
+        for i, scene1 in enumerate(group):
+            lo = bisect.bisect_left(heats, heats[i] - tolerance)
+            hi = bisect.bisect_right(heats, heats[i] + tolerance)
+            for j in range(lo, hi):
+                if j != i:
+                    yield scene1, group[j]
+
+
+def extract_chunks(
+    delta_ndvi: np.ndarray, delta_heat: np.ndarray
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """Half-overlapping CHUNK_SIZE windows of both deltas, dropping windows that are entirely NaN."""
+    ndvi_windows = sliding_window_view(delta_ndvi, (CHUNK_SIZE, CHUNK_SIZE))[::HALF_CHUNK, ::HALF_CHUNK]
+    heat_windows = sliding_window_view(delta_heat, (CHUNK_SIZE, CHUNK_SIZE))[::HALF_CHUNK, ::HALF_CHUNK]
+
+    empty = np.isnan(ndvi_windows).all(axis=(2, 3)) | np.isnan(heat_windows).all(axis=(2, 3))
+    grid_rows, grid_cols = np.nonzero(~empty)
+    # Fancy indexing copies just the kept windows, so samples do not pin whole scenes in memory.
+    return ndvi_windows[grid_rows, grid_cols], heat_windows[grid_rows, grid_cols], grid_rows * HALF_CHUNK, grid_cols * HALF_CHUNK
+
+
+def iter_pair_samples(scenes: List[Dict[str, Any]], data_dir: Path) -> Iterator[Dict[str, Any]]:
+    """Yield delta chunks for every ordered pair of same-city, same-phase, same-shape scenes within 2.5 degrees."""
+    groups = group_scenes(scenes, data_dir)
+    total_pairs = 0
+
+    for total_pairs, (scene1, scene2) in enumerate(iter_pairs(groups), start=1):
+        print(f"Forming combination {total_pairs}", end="\r")
+
+        ndvi1, heat1 = load_scene(str(data_dir / scene1["path"]))
+        ndvi2, heat2 = load_scene(str(data_dir / scene2["path"]))
+        if heat1.shape != heat2.shape:
             continue
 
-        ndvi_denominator = nir + red
-        mask = np.isclose(ndvi_denominator, 0) | np.isnan(nir) | np.isnan(red)
-        ndvi = np.empty_like(nir, dtype=float)
-        ndvi[:] = np.nan
-        ndvi[~mask] = (nir[~mask] - red[~mask]) / ndvi_denominator[~mask]
-        ndvi = np.clip(ndvi, -1.0, 1.0)
-        
-        if np.isnan(ndvi).any():
-            continue
-
-        asset_date = item.properties["datetime"].split("T")[0]
-        asset_month = int(item.properties["datetime"].split("T")[0].split("-")[1])
-
-        vegetation_phase = get_vegetation_phase(asset_month)
-        mean_heat = np.nanmean(heat_celsius)
-
-        ndvi_heat_pairs.append(
-            {
-                "city": city,
-                "ndvi": ndvi,
-                "heat": heat_celsius,
-                "mean_heat": mean_heat,
-                "asset_date": asset_date,
-                "vegetation_phase": vegetation_phase,
+        ndvi_chunks, heat_chunks, rows, cols = extract_chunks(ndvi1 - ndvi2, heat1 - heat2)
+
+        for ndvi_chunk, heat_chunk, row, col in zip(ndvi_chunks, heat_chunks, rows.tolist(), cols.tolist()):
+            yield {
+                "city": scene1["city"],
+                "ndvi_delta": ndvi_chunk,
+                "lst_delta": heat_chunk,
+                "asset_date_1": scene1["asset_date"],
+                "asset_date_2": scene2["asset_date"],
+                "vegetation_phase": scene1["vegetation_phase"],
+                "row_start": row,
+                "col_start": col,
+                "row_end": row + CHUNK_SIZE,
+                "col_end": col + CHUNK_SIZE,
             }
-        )
-        good_images += 1
+    print()
+    print(f"Formed {total_pairs} scene pairs across {len(groups)} groups")
 
-# Save ndvi_heat_pairs to a file
-with open("ndvi_heat_pairs.pkl", "wb") as f:
-    pickle.dump(ndvi_heat_pairs, f)
 
-total_combinations_possible = len(ndvi_heat_pairs) * (len(ndvi_heat_pairs) - 1)
-total_combinations_formed = 0
+def build_samples(data_dir: Path, shard_size: int = SHARD_SIZE, dtype: str = "float32") -> int:
+    """Append paired delta samples for the scenes in the manifest to the sharded sample store.
 
-# Make pairs of ndvi and heat
-for i in range(len(ndvi_heat_pairs)):
-    for j in range(len(ndvi_heat_pairs)):
-        print(f"Forming combination {i+1}/{len(ndvi_heat_pairs)} ({j+1}/{len(ndvi_heat_pairs)})", end="\r")
-        
-        if i == j:
-            continue
+    Samples already in the store are skipped, so an interrupted run loses at most one unflushed shard.
+    """
+    store_path = data_dir / SAMPLES_DIRNAME
+    scenes = SceneManifest(data_dir / MANIFEST_FILENAME).scenes()
+    scenes.sort(key=lambda scene: (scene["city"], scene["asset_date"], scene["item_id"]))
 
-        pair1 = ndvi_heat_pairs[i]
-        pair2 = ndvi_heat_pairs[j]
-
-        ndvi1 = pair1["ndvi"]
-        heat1 = pair1["heat"]
-        mean_heat1 = pair1["mean_heat"]
-        asset_date1 = pair1["asset_date"]
-        vegetation_phase1 = pair1["vegetation_phase"]
-        city1 = pair1["city"]
-
-        ndvi2 = pair2["ndvi"]
-        heat2 = pair2["heat"]
-        mean_heat2 = pair2["mean_heat"]
-        asset_date2 = pair2["asset_date"]
-        vegetation_phase2 = pair2["vegetation_phase"]
-        city2 = pair2["city"]
-
-        # Check if pair can be formed (same vegetation phase and similar heat)
-        if vegetation_phase1 != vegetation_phase2 or abs(mean_heat1 - mean_heat2) > 2.5 or city1 != city2 or ndvi1.shape != ndvi2.shape or heat1.shape != heat2.shape:
-            continue
-
-        delta_ndvi = ndvi1 - ndvi2
-        delta_heat = heat1 - heat2
-        
-        dimension = delta_ndvi.shape[0]
-
-        for row in range(0, dimension - chunk_size + 1, half_chunk):
-            for col in range(0, dimension - chunk_size + 1, half_chunk):
-                ndvi_chunk = delta_ndvi[row : row + chunk_size, col : col + chunk_size]
-                heat_chunk = delta_heat[row : row + chunk_size, col : col + chunk_size]
-
-                if np.isnan(ndvi_chunk).all() or np.isnan(heat_chunk).all():
-                    continue
-
-                sample = {
-                    "ndvi_delta": ndvi_chunk,
-                    "lst_delta": heat_chunk,
-                    "asset_date_1": asset_date1,
-                    "asset_date_2": asset_date2,
-                    "vegetation_phase": vegetation_phase1,
-                    "row_start": row,
-                    "col_start": col,
-                    "row_end": row + chunk_size,
-                    "col_end": col + chunk_size,
-                }
-
-                key = sample_key(sample)
-                if key in existing_keys:
-                    continue
-
-                data_samples.append(sample)
+    store = SampleStore(store_path)
+    if not len(store) and (data_dir / LEGACY_SAMPLES_FILENAME).exists():
+        print(
+            f"Found legacy {LEGACY_SAMPLES_FILENAME}; run "
+            f"`python -m service.simulation.sample_store {data_dir / LEGACY_SAMPLES_FILENAME} --out {store_path}` "
+            "first to keep its samples"
+        )
+    existing_keys: Set[Tuple[str, str, str, str, int, int]] = set()
+    # Samples converted from the legacy pickle have no city, so they are matched on everything else.
+    cityless_keys: Set[Tuple[str, str, int, int]] = set()
+    for sample in store.iter_metadata():
+        key = sample_key(sample)
+        existing_keys.add(key)
+        if not key[0]:
+            cityless_keys.add(key[2:])
+    total_combinations_formed = 0
+
+    with SampleWriter(store_path, shard_size=shard_size, dtype=dtype) as writer:
+        for sample in iter_pair_samples(scenes, data_dir):
+            key = sample_key(sample)
+            if key in existing_keys or key[2:] in cityless_keys:
+                continue
+
+            if writer.append(sample):
                 existing_keys.add(key)
-                samples_since_checkpoint += 1
                 total_combinations_formed += 1
 
-                if samples_since_checkpoint >= CHECKPOINT_INTERVAL:
-                    save_samples(data_samples, CHECKPOINT_PATH, label="checkpoint")
-                    samples_since_checkpoint = 0
+    print(f"Total combinations formed: {total_combinations_formed}")
+    print(f"Saved {len(existing_keys)} samples to {store_path}")
+    return total_combinations_formed
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Build NDVI/LST delta training samples from Landsat scenes.")
+    parser.add_argument(
+        "stage",
+        nargs="?",
+        choices=["scenes", "pairs", "all"],
+        default="all",
+        help="Fetch scenes, form pair samples from fetched scenes, or both.",
+    )
+    parser.add_argument("--city", action="append", dest="cities", help="City to fetch (repeatable). Defaults to the built-in list.")
+    parser.add_argument("--data-dir", type=Path, default=DATA_DIR, help="Output directory for scenes, manifest and samples.")
+    parser.add_argument("--start", default="2015-01-01", help="Start of the acquisition date range.")
+    parser.add_argument("--end", default="2025-12-31", help="End of the acquisition date range.")
+    parser.add_argument("--max-cloud-cover", type=float, default=10, help="Maximum scene cloud cover in percent.")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 4, help="Number of items fetched concurrently.")
+    parser.add_argument("--shard-size", type=int, default=SHARD_SIZE, help="Samples per sample-store shard.")
+    parser.add_argument("--dtype", choices=["float16", "float32"], default="float32", help="On-disk sample dtype.")
+    parser.add_argument("--no-stats", action="store_true", help="Do not record fetched scenes in the scene statistics index.")
+    args = parser.parse_args(argv)
+
+    args.data_dir.mkdir(parents=True, exist_ok=True)
+
+    if args.stage in ("scenes", "all"):
+        manifest = collect_scenes(
+            args.cities or cities,
+            args.data_dir,
+            start=args.start,
+            end=args.end,
+            max_cloud_cover=args.max_cloud_cover,
+            workers=max(args.workers, 1),
+            stats_store=None if args.no_stats else get_scene_stats_store(),
+        )
+        print(f"Manifest: {manifest.counts()}")
 
-print(f"Total combinations possible: {total_combinations_possible}")
-print(f"Total combinations formed: {total_combinations_formed}")
+    if args.stage in ("pairs", "all"):
+        build_samples(args.data_dir, shard_size=args.shard_size, dtype=args.dtype)
 
-# Save data samples to a file
-save_samples(data_samples, FINAL_PATH, label="final")
 
-# Remove checkpoint if final save succeeded
-if CHECKPOINT_PATH.exists():
-    CHECKPOINT_PATH.unlink()
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+import argparse
+import json
+import platform
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from service.simulation.input_pipeline import make_dataset
+from service.simulation.model import build_unet
+from service.simulation.sample_store import DEFAULT_STORE_PATH, VAL_FRACTION, SampleStore, load_split, stack_tensor
+
+CHECKPOINT_DIR = Path(__file__).resolve().parent / "checkpoints"
+DEFAULT_BENCH_BATCH_SIZES = (1, 8, 32, 128)
+
+
+def _grouped_errors(names: np.ndarray, abs_errors: np.ndarray, sq_errors: np.ndarray) -> Dict[str, Dict[str, float]]:
+    labels, groups = np.unique(names, return_inverse=True)
+    counts = np.bincount(groups, minlength=len(labels))
+    mae = np.bincount(groups, weights=abs_errors, minlength=len(labels)) / np.maximum(counts, 1)
+    mse = np.bincount(groups, weights=sq_errors, minlength=len(labels)) / np.maximum(counts, 1)
+    return {
+        str(label or "unknown"): {"samples": int(count), "mae": float(m), "mse": float(s)}
+        for label, count, m, s in zip(labels, counts, mae, mse)
+    }
+
+
+def evaluate_accuracy(model, store: SampleStore, indices: np.ndarray, batch_size: int) -> Dict[str, Any]:
+    """Per-sample MAE/MSE over ``indices``, reported overall and per vegetation phase and city."""
+    dataset = make_dataset(store, indices, batch_size=batch_size, shuffle=False, augment=False)
+
+    abs_errors, sq_errors = [], []
+    for ndvi, lst in dataset:
+        predicted = np.asarray(model.predict_on_batch(ndvi), dtype=np.float32)
+        error = predicted - lst.numpy()
+        abs_errors.append(np.abs(error).mean(axis=(1, 2, 3)))
+        sq_errors.append(np.square(error).mean(axis=(1, 2, 3)))
+
+    abs_errors = np.concatenate(abs_errors) if abs_errors else np.zeros(0)
+    sq_errors = np.concatenate(sq_errors) if sq_errors else np.zeros(0)
+    # Unshuffled datasets keep index order, so errors line up with the metadata rows.
+    return {
+        "samples": int(len(indices)),
+        "mae": float(abs_errors.mean()) if len(abs_errors) else None,
+        "mse": float(sq_errors.mean()) if len(sq_errors) else None,
+        "by_phase": _grouped_errors(store.metadata["vegetation_phase"][indices], abs_errors, sq_errors),
+        "by_city": _grouped_errors(store.metadata["city"][indices], abs_errors, sq_errors),
+    }
+
+
+def benchmark(model, tiles: np.ndarray, batch_sizes: Sequence[int], min_tiles: int = 512) -> List[Dict[str, Any]]:
+    """Latency per batch and tile and tiles/sec for each batch size, after one warm-up call."""
+    results = []
+    for batch_size in batch_sizes:
+        batch = np.resize(tiles, (batch_size,) + tiles.shape[1:]).astype(np.float32)
+        model.predict_on_batch(batch)
+
+        repeats = max(3, -(-min_tiles // batch_size))
+        durations = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            model.predict_on_batch(batch)
+            durations.append(time.perf_counter() - start)
+
+        durations = np.asarray(durations)
+        results.append(
+            {
+                "batch_size": int(batch_size),
+                "batches": int(repeats),
+                "batch_ms_p50": float(np.percentile(durations, 50) * 1000.0),
+                "batch_ms_p90": float(np.percentile(durations, 90) * 1000.0),
+                "tile_ms": float(durations.mean() / batch_size * 1000.0),
+                "tiles_per_sec": float(batch_size * repeats / durations.sum()),
+            }
+        )
+    return results
+
+
+def evaluate_checkpoints(
+    checkpoints: Sequence[Path],
+    store: SampleStore,
+    indices: np.ndarray,
+    batch_size: int = 256,
+    bench_batch_sizes: Sequence[int] = DEFAULT_BENCH_BATCH_SIZES,
+) -> Dict[str, Any]:
+    bench_tiles = stack_tensor(store, "ndvi_delta", indices[: max(bench_batch_sizes)])
+
+    reports = []
+    for checkpoint in checkpoints:
+        print(f"Evaluating {checkpoint.name}")
+        model = build_unet()
+        model.load_weights(checkpoint)
+
+        start = time.perf_counter()
+        accuracy = evaluate_accuracy(model, store, indices, batch_size)
+        accuracy["eval_seconds"] = time.perf_counter() - start
+        speed = benchmark(model, bench_tiles, bench_batch_sizes)
+
+        best = max(speed, key=lambda entry: entry["tiles_per_sec"])
+        print(
+            f"  MAE={accuracy['mae']:.4f} MSE={accuracy['mse']:.4f} "
+            f"best {best['tiles_per_sec']:.1f} tiles/sec at batch {best['batch_size']}"
+        )
+        reports.append({"checkpoint": checkpoint.name, "path": str(checkpoint), **accuracy, "benchmark": speed})
+
+    ranked = sorted((r for r in reports if r["mae"] is not None), key=lambda r: r["mae"])
+    return {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "host": {"platform": platform.platform(), "processor": platform.processor()},
+        "samples": int(len(indices)),
+        "checkpoints": reports,
+        "best_by_mae": ranked[0]["checkpoint"] if ranked else None,
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Evaluate and benchmark U-Net checkpoints on the validation split.")
+    parser.add_argument("--checkpoints", type=Path, default=CHECKPOINT_DIR, help="Directory of *.weights.h5 files.")
+    parser.add_argument("--samples", type=Path, default=DEFAULT_STORE_PATH, help="Sample store directory.")
+    parser.add_argument("--val-fraction", type=float, default=VAL_FRACTION, help="Validation share used by the split.")
+    parser.add_argument("--batch-size", type=int, default=256, help="Batch size for the accuracy pass.")
+    parser.add_argument(
+        "--bench-batch-sizes",
+        default=",".join(str(v) for v in DEFAULT_BENCH_BATCH_SIZES),
+        help="Comma-separated batch sizes to time.",
+    )
+    parser.add_argument("--limit", type=int, default=None, help="Evaluate only the first N validation samples.")
+    parser.add_argument("--output", type=Path, default=Path("evaluation_report.json"), help="JSON report path.")
+    args = parser.parse_args(argv)
+
+    checkpoints = sorted(args.checkpoints.glob("*.weights.h5"))
+    if not checkpoints:
+        raise FileNotFoundError(f"No *.weights.h5 checkpoints in {args.checkpoints}")
+
+    store = SampleStore(args.samples)
+    _, val = load_split(store, args.val_fraction)
+    if args.limit:
+        val = val[: args.limit]
+    if not len(val):
+        raise ValueError(f"No validation samples in {args.samples}")
+
+    bench_batch_sizes = [int(v) for v in args.bench_batch_sizes.split(",") if v.strip()]
+    report = evaluate_checkpoints(checkpoints, store, val, args.batch_size, bench_batch_sizes)
+
+    args.output.write_text(json.dumps(report, indent=2))
+    print(f"Wrote report for {len(checkpoints)} checkpoints to {args.output} (best by MAE: {report['best_by_mae']})")
+
+
+if __name__ == "__main__":
+    main()
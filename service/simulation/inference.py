@@ -7,15 +7,15 @@ import numpy as np
 import tensorflow as tf
 from matplotlib.colors import TwoSlopeNorm
 
-from service.simulation.model import build_unet, load_samples, to_tensor
+from service.simulation.model import build_unet, to_tensor
+from service.simulation.sample_store import DEFAULT_STORE_PATH, SampleStore
 
 checkpoint_path = Path(__file__).resolve().parent / "checkpoints"
-samples_path = Path(__file__).resolve().parent / "data" / "data_samples.pkl"
 
 model = build_unet()
 model.load_weights(checkpoint_path / "epoch_02.weights.h5")
 
-samples = load_samples(samples_path)
+samples = SampleStore(DEFAULT_STORE_PATH)
 
 def predict(image):
     return model.predict(image)
@@ -66,7 +66,7 @@ def visualize_triplet(ndvi_tile: np.ndarray, lst_true: np.ndarray, lst_pred: np.
 
 
 if __name__ == "__main__":
-    random_sample = random.choice(samples)
+    random_sample = samples[random.randrange(len(samples))]
 
     input_data = to_tensor([random_sample], "ndvi_delta")
     expected_output = to_tensor([random_sample], "lst_delta")
@@ -0,0 +1,218 @@
+from __future__ import annotations
+
+import os
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from pathlib import Path
+from typing import Any, Callable, Deque, Dict, List, Optional
+
+import numpy as np
+
+from service.metrics import TILES_INFERRED, timed
+
+DEFAULT_WEIGHTS_PATH = Path(__file__).resolve().parent / "checkpoints" / "epoch_06.weights.h5"
+
+
+def load_unet(weights_path: Path = DEFAULT_WEIGHTS_PATH):
+    from service.simulation.model import build_unet
+
+    model = build_unet()
+    model.load_weights(weights_path)
+    print(f"Model loaded from {weights_path}")
+    return model
+
+
+def weights_version(weights_path: Path = DEFAULT_WEIGHTS_PATH) -> str:
+    try:
+        stat = weights_path.stat()
+    except OSError:
+        return weights_path.name
+    return f"{weights_path.name}:{stat.st_size}:{int(stat.st_mtime)}"
+
+
+class _InferenceRequest:
+    __slots__ = ("tiles", "future", "enqueued_at")
+
+    def __init__(self, tiles: np.ndarray) -> None:
+        self.tiles = tiles
+        self.future: Future = Future()
+        self.enqueued_at = time.monotonic()
+
+
+class InferenceServer:
+    """Owns the U-Net and serves predictions from a single worker thread.
+
+    Tiles submitted by concurrent requests are queued and merged into
+    micro-batches of up to ``max_batch_size`` tiles, waiting at most
+    ``max_delay`` seconds for a batch to fill, so the model is only ever
+    driven from one thread.
+    """
+
+    def __init__(
+        self,
+        model_factory: Callable[[], Any] = load_unet,
+        max_batch_size: int = 64,
+        max_delay: float = 0.005,
+        history_size: int = 1000,
+        model_version: Optional[str] = None,
+    ) -> None:
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size must be at least 1")
+
+        self.max_batch_size = max_batch_size
+        self.max_delay = max_delay
+        self.model_version = model_version or weights_version()
+
+        self._model_factory = model_factory
+        self._model: Any = None
+        self._queue: "queue.Queue[Optional[_InferenceRequest]]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+        self._requests_total = 0
+        self._tiles_total = 0
+        self._batches_total = 0
+        self._errors_total = 0
+        self._batch_sizes: Deque[int] = deque(maxlen=history_size)
+        self._queue_waits: Deque[float] = deque(maxlen=history_size)
+
+    def start(self) -> None:
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, name="inference-server", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        with self._lock:
+            thread = self._thread
+            self._thread = None
+        if thread is None:
+            return
+        self._queue.put(None)
+        thread.join(timeout)
+
+    def submit(self, tiles: np.ndarray) -> Future:
+        tiles = np.asarray(tiles, dtype=np.float32)
+        if tiles.ndim != 4:
+            raise ValueError(f"Expected tiles shaped (n, h, w, c), got {tiles.shape}")
+
+        self.start()
+        request = _InferenceRequest(tiles)
+        with self._lock:
+            self._requests_total += 1
+        self._queue.put(request)
+        return request.future
+
+    def predict(self, tiles: np.ndarray, timeout: Optional[float] = None) -> np.ndarray:
+        return self.submit(tiles).result(timeout)
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            batch_sizes = list(self._batch_sizes)
+            queue_waits = list(self._queue_waits)
+            return {
+                "queue_depth": self._queue.qsize(),
+                "requests_total": self._requests_total,
+                "tiles_total": self._tiles_total,
+                "batches_total": self._batches_total,
+                "errors_total": self._errors_total,
+                "max_batch_size": self.max_batch_size,
+                "max_delay_ms": self.max_delay * 1000.0,
+                "mean_batch_size": float(np.mean(batch_sizes)) if batch_sizes else 0.0,
+                "p95_batch_size": float(np.percentile(batch_sizes, 95)) if batch_sizes else 0.0,
+                "mean_queue_wait_ms": float(np.mean(queue_waits)) * 1000.0 if queue_waits else 0.0,
+            }
+
+    def _collect(self, first: _InferenceRequest) -> List[_InferenceRequest]:
+        pending = [first]
+        count = len(first.tiles)
+        deadline = time.monotonic() + self.max_delay
+
+        while count < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                request = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if request is None:
+                # Let the main loop see the shutdown sentinel after this batch.
+                self._queue.put(None)
+                break
+            pending.append(request)
+            count += len(request.tiles)
+
+        return pending
+
+    def _run(self) -> None:
+        while True:
+            first = self._queue.get()
+            if first is None:
+                return
+
+            pending = self._collect(first)
+            try:
+                if self._model is None:
+                    with timed("model_load"):
+                        self._model = self._model_factory()
+                self._run_batch(pending)
+            except Exception as exc:
+                with self._lock:
+                    self._errors_total += 1
+                for request in pending:
+                    if not request.future.done():
+                        request.future.set_exception(exc)
+
+    def _run_batch(self, pending: List[_InferenceRequest]) -> None:
+        started = time.monotonic()
+        with self._lock:
+            for request in pending:
+                self._queue_waits.append(started - request.enqueued_at)
+
+        tiles = np.concatenate([request.tiles for request in pending], axis=0)
+        outputs = []
+        for start in range(0, len(tiles), self.max_batch_size):
+            batch = tiles[start : start + self.max_batch_size]
+            with timed("inference_batch"):
+                outputs.append(np.asarray(self._model.predict_on_batch(batch)))
+            TILES_INFERRED.inc(len(batch))
+            with self._lock:
+                self._batches_total += 1
+                self._tiles_total += len(batch)
+                self._batch_sizes.append(len(batch))
+        predictions = np.concatenate(outputs, axis=0)
+
+        offset = 0
+        for request in pending:
+            size = len(request.tiles)
+            request.future.set_result(predictions[offset : offset + size])
+            offset += size
+
+
+_server: Optional[InferenceServer] = None
+_server_lock = threading.Lock()
+
+
+def set_inference_server(server: InferenceServer) -> None:
+    global _server
+    with _server_lock:
+        _server = server
+
+
+def get_inference_server() -> InferenceServer:
+    global _server
+    with _server_lock:
+        if _server is None:
+            weights_path = Path(os.getenv("INFERENCE_WEIGHTS_PATH", str(DEFAULT_WEIGHTS_PATH)))
+            _server = InferenceServer(
+                model_factory=lambda: load_unet(weights_path),
+                max_batch_size=int(os.getenv("INFERENCE_MAX_BATCH_SIZE", "64")),
+                max_delay=float(os.getenv("INFERENCE_MAX_DELAY_MS", "5")) / 1000.0,
+                model_version=weights_version(weights_path),
+            )
+        return _server
@@ -0,0 +1,81 @@
+from typing import Optional, Sequence, Tuple
+
+import numpy as np
+import tensorflow as tf
+
+from service.simulation.sample_store import TILE_SIZE, SampleStore
+
+NDVI_CLIP = (-2.0, 2.0)
+LST_CLIP = (-10.0, 10.0)
+DEFAULT_BATCH_SIZE = 64
+
+
+def read_batch(store: SampleStore, indices: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Gather one batch from the memory-mapped shards, reading each shard's rows in file order."""
+    order = np.argsort(indices, kind="stable")
+    ndvi = np.empty((len(indices), TILE_SIZE, TILE_SIZE), dtype=np.float32)
+    lst = np.empty_like(ndvi)
+    ndvi[order] = store.read("ndvi_delta", indices[order])
+    lst[order] = store.read("lst_delta", indices[order])
+    return ndvi, lst
+
+
+def _clean(ndvi: tf.Tensor, lst: tf.Tensor) -> Tuple[tf.Tensor, tf.Tensor]:
+    ndvi = tf.where(tf.math.is_nan(ndvi), tf.zeros_like(ndvi), ndvi)
+    lst = tf.where(tf.math.is_nan(lst), tf.zeros_like(lst), lst)
+    ndvi = tf.clip_by_value(ndvi, *NDVI_CLIP)
+    lst = tf.clip_by_value(lst, *LST_CLIP)
+    return ndvi[..., tf.newaxis], lst[..., tf.newaxis]
+
+
+def _augment(ndvi: tf.Tensor, lst: tf.Tensor) -> Tuple[tf.Tensor, tf.Tensor]:
+    """Random per-sample flip and 90° rotation, applied identically to input and target.
+
+    Deltas have no preferred orientation, so the eight dihedral variants are all valid samples.
+    """
+    stacked = tf.concat([ndvi, lst], axis=-1)
+    batch = tf.shape(stacked)[0]
+
+    flip = tf.random.uniform([batch, 1, 1, 1]) < 0.5
+    stacked = tf.where(flip, tf.reverse(stacked, axis=[2]), stacked)
+
+    rotations = tf.stack([tf.image.rot90(stacked, k) for k in range(4)], axis=1)
+    k = tf.random.uniform([batch], maxval=4, dtype=tf.int32)
+    stacked = tf.gather(rotations, k, axis=1, batch_dims=1)
+
+    return stacked[..., :1], stacked[..., 1:]
+
+
+def make_dataset(
+    store: SampleStore,
+    indices: Optional[Sequence[int]] = None,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    shuffle: bool = True,
+    augment: bool = True,
+    seed: Optional[int] = None,
+) -> tf.data.Dataset:
+    """Stream ``(ndvi_delta, lst_delta)`` batches shaped ``(b, TILE, TILE, 1)`` from a sample store.
+
+    Only sample indices are shuffled in memory; tile data is read from the shards
+    batch by batch, so the dataset can be larger than RAM.
+    """
+    indices = np.arange(len(store), dtype=np.int64) if indices is None else np.asarray(indices, dtype=np.int64)
+
+    dataset = tf.data.Dataset.from_tensor_slices(indices)
+    if shuffle:
+        dataset = dataset.shuffle(len(indices), seed=seed, reshuffle_each_iteration=True)
+    dataset = dataset.batch(batch_size)
+
+    def load(batch_indices: tf.Tensor) -> Tuple[tf.Tensor, tf.Tensor]:
+        ndvi, lst = tf.numpy_function(
+            lambda value: read_batch(store, value), [batch_indices], [tf.float32, tf.float32]
+        )
+        ndvi.set_shape([None, TILE_SIZE, TILE_SIZE])
+        lst.set_shape([None, TILE_SIZE, TILE_SIZE])
+        return _clean(ndvi, lst)
+
+    dataset = dataset.map(load, num_parallel_calls=tf.data.AUTOTUNE, deterministic=not shuffle)
+    if augment:
+        dataset = dataset.map(_augment, num_parallel_calls=tf.data.AUTOTUNE, deterministic=not shuffle)
+
+    return dataset.prefetch(tf.data.AUTOTUNE)
@@ -1,11 +1,16 @@
+import argparse
 import pickle
 from pathlib import Path
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 
 import numpy as np
 import tensorflow as tf
 from tensorflow.keras import layers, models
 
+from service.simulation.input_pipeline import DEFAULT_BATCH_SIZE, make_dataset
+from service.simulation.sample_store import ARRAY_KEYS, DEFAULT_STORE_PATH, VAL_FRACTION, SampleStore, load_split
+from service.simulation.training import PRECISIONS, ThroughputLogger, configure_precision, configure_threads
+
 def build_unet(input_shape=(128, 128, 1)):
     inputs = layers.Input(shape=input_shape)
 
@@ -33,7 +38,8 @@ def build_unet(input_shape=(128, 128, 1)):
     u1 = layers.concatenate([u1, c1])
     c5 = layers.Conv2D(64, 3, activation='relu', padding='same')(u1)
 
-    outputs = layers.Conv2D(1, 1, activation='linear', padding='same')(c5)
+    # Keep the output in float32 so losses stay full precision under a mixed policy.
+    outputs = layers.Conv2D(1, 1, activation='linear', padding='same', dtype='float32')(c5)
 
     model = models.Model(inputs, outputs)
     return model
@@ -66,57 +72,75 @@ def describe_split(name: str, tensors: np.ndarray) -> None:
         f"mean={np.mean(tensors):.4f}, std={np.std(tensors):.4f}"
     )
 
-def main() -> None:
-    default_path = Path(__file__).resolve().parent / "data" / "data_samples.pkl"
-    checkpoint_path = Path(__file__).resolve().parent / "checkpoints"
-    samples_path = default_path
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Train the NDVI to LST delta U-Net.")
+    parser.add_argument("--samples", type=Path, default=DEFAULT_STORE_PATH, help="Sample store directory.")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="Training batch size.")
+    parser.add_argument("--epochs", type=int, default=50, help="Maximum number of epochs.")
+    parser.add_argument("--learning-rate", type=float, default=1e-4, help="Initial Adam learning rate.")
+    parser.add_argument("--val-fraction", type=float, default=VAL_FRACTION, help="Share of scene pairs held out.")
+    parser.add_argument("--seed", type=int, default=None, help="Shuffle and augmentation seed.")
+    parser.add_argument("--no-augment", action="store_true", help="Disable random flips and rotations.")
+    parser.add_argument("--intra-op-threads", type=int, default=None, help="Threads used inside a single op.")
+    parser.add_argument("--inter-op-threads", type=int, default=None, help="Ops run concurrently.")
+    parser.add_argument("--xla", action="store_true", help="JIT-compile the train step with XLA.")
+    parser.add_argument(
+        "--precision",
+        choices=PRECISIONS,
+        default="float32",
+        help="bfloat16 enables mixed precision; auto uses it when the CPU supports it natively.",
+    )
+    return parser.parse_args(argv)
 
-    if not samples_path.exists():
-        raise FileNotFoundError(f"Samples file not found at {samples_path}")
 
-    samples = load_samples(samples_path)
+def main(argv: Optional[List[str]] = None) -> None:
+    args = parse_args(argv)
+    configure_threads(args.intra_op_threads, args.inter_op_threads)
+    configure_precision(args.precision)
+
+    checkpoint_path = Path(__file__).resolve().parent / "checkpoints"
+    samples = SampleStore(args.samples)
 
-    if not samples:
-        raise ValueError("No samples found in the provided file.")
+    if not len(samples):
+        raise FileNotFoundError(f"No samples found in {args.samples}")
+
+    if args.seed is not None:
+        tf.random.set_seed(args.seed)
 
     # Compile model
     model = build_unet()
-    model.compile(optimizer=tf.keras.optimizers.Adam(1e-4),
+    model.compile(optimizer=tf.keras.optimizers.Adam(args.learning_rate),
                 loss='mse',
-                metrics=[tf.keras.metrics.MeanAbsoluteError()])
+                metrics=[tf.keras.metrics.MeanAbsoluteError()],
+                jit_compile=args.xla)
 
     # Prepare data
     print("Data loaded (items: {})".format(len(samples)))
-    print("Sample items: {}".format(samples[2445].keys()))
+    print("Sample items: {}".format(list(samples.metadata) + list(ARRAY_KEYS)))
     
-    total_samples = len(samples)
-    train_set = samples[:int(total_samples * 0.8)]
-    test_set = samples[int(total_samples * 0.8):]
-
-    train_x = to_tensor(train_set, "ndvi_delta")
-    train_y = to_tensor(train_set, "lst_delta")
-    test_x = to_tensor(test_set, "ndvi_delta")
-    test_y = to_tensor(test_set, "lst_delta")
-
-    # Clip values
-    train_x = np.clip(train_x, -2.0, 2.0)
-    train_y = np.clip(train_y, -10.0, 10.0)
-    test_x = np.clip(test_x, -2.0, 2.0)
-    test_y = np.clip(test_y, -10.0, 10.0)
-
-    describe_split("train_x", train_x)
-    describe_split("train_y", train_y)
-    describe_split("test_x", test_x)
-    describe_split("test_y", test_y)
+    # Whole scene pairs go to one side, so overlapping chunks never leak into validation.
+    train_set, test_set = load_split(samples, args.val_fraction)
+
+    train_data = make_dataset(
+        samples, train_set, batch_size=args.batch_size, shuffle=True, augment=not args.no_augment, seed=args.seed
+    )
+    test_data = make_dataset(samples, test_set, batch_size=args.batch_size, shuffle=False, augment=False)
+
+    # Summaries of the first batch only; the full splits are never materialised.
+    train_x, train_y = next(iter(train_data))
+    test_x, test_y = next(iter(test_data))
+    describe_split("train_x (first batch)", train_x.numpy())
+    describe_split("train_y (first batch)", train_y.numpy())
+    describe_split("test_x (first batch)", test_x.numpy())
+    describe_split("test_y (first batch)", test_y.numpy())
 
     history = model.fit(
-        train_x,
-        train_y,
-        epochs=50,
-        batch_size=4,
-        validation_data=(test_x, test_y),
+        train_data,
+        epochs=args.epochs,
+        validation_data=test_data,
         verbose=1,
         callbacks=[
+            ThroughputLogger(len(train_set)),
             tf.keras.callbacks.ReduceLROnPlateau(factor=0.5, patience=5, min_lr=1e-6),
             tf.keras.callbacks.EarlyStopping(patience=10, restore_best_weights=True),
             tf.keras.callbacks.ModelCheckpoint(
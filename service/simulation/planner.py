@@ -0,0 +1,257 @@
+from __future__ import annotations
+
+import time
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from service.metrics import timed
+from service.simulation.simulator import (
+    INTERVENTION_NDVI,
+    STRIDE,
+    TILE_SIZE,
+    WINDOW,
+    pixel_to_point,
+    point_to_pixel,
+    predict_tiles,
+)
+from service.simulation.tiled_inference import grid_shape, normalization_map, pad_for_tiling, window_weights
+
+PREDICT_CHUNK = 512
+
+
+def _site_pixels(
+    sites: Sequence[Tuple[int, int]],
+    shape: Tuple[int, int],
+    capacity: int,
+    allowed: Optional[np.ndarray] = None,
+) -> List[np.ndarray]:
+    """Pixels each site can plant, nearest first, each owned by its closest site.
+
+    Returned as flat indices so a site's first ``n`` entries are its ``n``-unit placement.
+    """
+    radius = int(np.ceil(np.sqrt(capacity))) + 2
+    offsets = np.arange(-radius, radius + 1)
+    d_row, d_col = np.meshgrid(offsets, offsets, indexing="ij")
+    order = np.argsort((d_row ** 2 + d_col ** 2).ravel(), kind="stable")
+    d_row, d_col = d_row.ravel()[order], d_col.ravel()[order]
+
+    centres = np.asarray(sites, dtype=np.int64).reshape(-1, 2)
+    pixels = []
+    for index, (row, col) in enumerate(centres):
+        rows, cols = row + d_row, col + d_col
+        inside = (rows >= 0) & (rows < shape[0]) & (cols >= 0) & (cols < shape[1])
+        rows, cols = rows[inside], cols[inside]
+        if allowed is not None:
+            keep = allowed[rows, cols]
+            rows, cols = rows[keep], cols[keep]
+
+        distances = (rows[:, None] - centres[:, 0]) ** 2 + (cols[:, None] - centres[:, 1]) ** 2
+        owned = np.argmin(distances, axis=1) == index
+        pixels.append((rows[owned] * shape[1] + cols[owned])[:capacity])
+    return pixels
+
+
+class TileObjective:
+    """Mean heat change inside a mask, evaluated one stride-grid tile at a time.
+
+    Overlap-add blending is linear in the tile predictions, so the masked mean of
+    the blended raster is a sum of per-tile dot products with a fixed gain map.
+    Tiles without interventions all contribute the same all-zero prediction,
+    which lets a candidate layout be scored from its touched tiles alone.
+    """
+
+    def __init__(
+        self,
+        mask: np.ndarray,
+        ndvi_value: float,
+        predict_fn: Callable[[np.ndarray], np.ndarray] = predict_tiles,
+    ) -> None:
+        self.shape = mask.shape
+        self.ndvi_value = float(np.clip(ndvi_value, -2, 2))
+        self.predict_fn = predict_fn
+
+        padded_mask = pad_for_tiling(mask.astype(np.float32), TILE_SIZE, STRIDE)
+        self.grid = grid_shape(padded_mask.shape, TILE_SIZE, STRIDE)
+        self.weights = window_weights(TILE_SIZE, STRIDE, WINDOW)
+        self.gain_map = padded_mask / normalization_map(padded_mask.shape, TILE_SIZE, STRIDE, WINDOW)
+        self.mask_pixels = max(int(mask.sum()), 1)
+
+        self.zero_prediction = self._predict(np.zeros((1, TILE_SIZE, TILE_SIZE), dtype=np.float32))[0]
+        # Every tile sees the all-zero prediction when nothing is planted.
+        total_gain = np.zeros((TILE_SIZE, TILE_SIZE), dtype=np.float32)
+        for tile_row in range(self.grid[0]):
+            for tile_col in range(self.grid[1]):
+                total_gain += self._tile_gain(tile_row, tile_col)
+        self.baseline = float(np.sum(total_gain * self.zero_prediction))
+
+        self._contributions: Dict[Tuple[int, int, bytes], float] = {}
+        self.tiles_evaluated = 0
+        self.tiles_predicted = 0
+
+    def _predict(self, tiles: np.ndarray) -> np.ndarray:
+        predictions = [
+            np.asarray(self.predict_fn(tiles[start : start + PREDICT_CHUNK]), dtype=np.float32)
+            for start in range(0, len(tiles), PREDICT_CHUNK)
+        ]
+        return np.concatenate(predictions).reshape(tiles.shape)
+
+    def _tile_gain(self, tile_row: int, tile_col: int) -> np.ndarray:
+        top, left = tile_row * STRIDE, tile_col * STRIDE
+        return self.weights * self.gain_map[top : top + TILE_SIZE, left : left + TILE_SIZE]
+
+    def tiles_for(self, pixels: np.ndarray) -> np.ndarray:
+        """Unique ``(tile_row, tile_col)`` pairs whose window covers any of ``pixels``."""
+        rows, cols = np.divmod(np.asarray(pixels, dtype=np.int64), self.shape[1])
+        k = TILE_SIZE // STRIDE
+        tiles = set()
+        for di in range(k):
+            for dj in range(k):
+                tile_rows, tile_cols = rows // STRIDE - di, cols // STRIDE - dj
+                valid = (tile_rows >= 0) & (tile_rows < self.grid[0]) & (tile_cols >= 0) & (tile_cols < self.grid[1])
+                tiles.update(zip(tile_rows[valid].tolist(), tile_cols[valid].tolist()))
+        return np.array(sorted(tiles), dtype=np.int64).reshape(-1, 2)
+
+    def tile_content(self, tile_row: int, tile_col: int, pixels: np.ndarray) -> bytes:
+        rows, cols = np.divmod(pixels, self.shape[1])
+        rows, cols = rows - tile_row * STRIDE, cols - tile_col * STRIDE
+        inside = (rows >= 0) & (rows < TILE_SIZE) & (cols >= 0) & (cols < TILE_SIZE)
+        return np.sort(rows[inside] * TILE_SIZE + cols[inside]).astype(np.int32).tobytes()
+
+    def evaluate(self, keys: Sequence[Tuple[int, int, bytes]]) -> List[float]:
+        """Contribution of each ``(tile_row, tile_col, content)`` relative to an empty tile."""
+        self.tiles_evaluated += len(keys)
+        missing = list({key for key in keys if key not in self._contributions})
+        if missing:
+            tiles = np.zeros((len(missing), TILE_SIZE * TILE_SIZE), dtype=np.float32)
+            for index, (_, _, content) in enumerate(missing):
+                tiles[index, np.frombuffer(content, dtype=np.int32)] = self.ndvi_value
+            predictions = self._predict(tiles.reshape(-1, TILE_SIZE, TILE_SIZE))
+            self.tiles_predicted += len(missing)
+
+            for (tile_row, tile_col, content), prediction in zip(missing, predictions):
+                change = prediction - self.zero_prediction
+                self._contributions[(tile_row, tile_col, content)] = float(
+                    np.sum(self._tile_gain(tile_row, tile_col) * change)
+                )
+        return [self._contributions[key] for key in keys]
+
+    def cooling(self, heat_change: float) -> float:
+        """Mean cooling in degrees inside the mask for a summed tile contribution."""
+        return -(self.baseline + heat_change) / self.mask_pixels
+
+
+@timed("plan")
+def plan_interventions(
+    sites: Sequence[Tuple[float, float]],
+    bbox: Tuple[float, float, float, float],
+    mask: np.ndarray,
+    intervention: str = "trees",
+    budget: int = 200,
+    step: int = 10,
+    beam_width: int = 1,
+    predict_fn: Callable[[np.ndarray], np.ndarray] = predict_tiles,
+) -> Dict[str, Any]:
+    """Spread ``budget`` single-pixel interventions over candidate ``sites`` to maximise cooling in ``mask``.
+
+    Each round grows every beam state by ``step`` units at one site, scores all
+    candidates with a single batched prediction over the tiles they touch, and
+    keeps the ``beam_width`` best. Search stops early once no site cools further.
+    """
+    if intervention not in INTERVENTION_NDVI:
+        raise ValueError(f"Unknown intervention '{intervention}', expected one of {sorted(INTERVENTION_NDVI)}")
+    if budget < 1 or step < 1 or beam_width < 1:
+        raise ValueError("budget, step and beam_width must be at least 1")
+
+    timer = time.time()
+    mask = np.asarray(mask, dtype=bool)
+    shape = mask.shape
+    centres = [point_to_pixel(lat, lon, bbox, shape) for lat, lon in sites]
+    site_pixels = _site_pixels(centres, shape, budget, mask) if centres else []
+
+    objective = TileObjective(mask, INTERVENTION_NDVI[intervention], predict_fn)
+
+    # A beam state is (summed tile contribution, units per site, heat change attributed per site).
+    empty = tuple(0 for _ in site_pixels)
+    beam = [(0.0, empty, tuple(0.0 for _ in site_pixels))]
+    best = beam[0]
+    rounds = 0
+
+    while sum(best[1]) < budget:
+        candidates = {}
+        for score, counts, gains in beam:
+            units = min(step, budget - sum(counts))
+            for site, pixels in enumerate(site_pixels):
+                if counts[site] >= len(pixels):
+                    continue
+                grown = counts[:site] + (min(counts[site] + units, len(pixels)),) + counts[site + 1 :]
+                if grown not in candidates:
+                    candidates[grown] = (score, counts, gains, site)
+        if not candidates:
+            break
+
+        # Only tiles under the newly planted pixels change between a state and its parent.
+        lookups = []
+        for grown, (_, counts, _, site) in candidates.items():
+            added = site_pixels[site][counts[site] : grown[site]]
+            before = np.concatenate([pixels[:count] for pixels, count in zip(site_pixels, counts)])
+            after = np.concatenate([before, added])
+            for tile_row, tile_col in objective.tiles_for(added):
+                lookups.append((grown, (tile_row, tile_col, objective.tile_content(tile_row, tile_col, before)), 1.0))
+                lookups.append((grown, (tile_row, tile_col, objective.tile_content(tile_row, tile_col, after)), -1.0))
+
+        values = objective.evaluate([key for _, key, _ in lookups])
+        # Contributions are heat changes; negate so a larger delta means more cooling.
+        deltas = dict.fromkeys(candidates, 0.0)
+        for (grown, _, sign), value in zip(lookups, values):
+            deltas[grown] += sign * value
+
+        scored = []
+        for grown, (score, _, gains, site) in candidates.items():
+            site_gains = gains[:site] + (gains[site] + deltas[grown],) + gains[site + 1 :]
+            scored.append((score + deltas[grown], grown, site_gains))
+        scored.sort(key=lambda state: (-state[0], state[1]))
+
+        beam = scored[:beam_width]
+        rounds += 1
+        if beam[0][0] <= best[0]:
+            break
+        best = beam[0]
+
+    score, counts, gains = best
+    plan = []
+    types, lats, lons = [], [], []
+    for site, count in enumerate(counts):
+        if count == 0:
+            continue
+        lat, lon = sites[site]
+        plan.append(
+            {
+                "lat": float(lat),
+                "lon": float(lon),
+                "count": int(count),
+                "cooling": gains[site] / objective.mask_pixels,
+            }
+        )
+        for pixel in site_pixels[site][:count]:
+            point_lat, point_lon = pixel_to_point(*divmod(int(pixel), shape[1]), bbox, shape)
+            types.append(intervention)
+            lats.append(point_lat)
+            lons.append(point_lon)
+
+    plan.sort(key=lambda entry: -entry["cooling"])
+    for rank, entry in enumerate(plan, start=1):
+        entry["rank"] = rank
+
+    return {
+        "plan": plan,
+        "interventions": {"types": types, "lats": lats, "lons": lons},
+        "placed": len(types),
+        "budget": budget,
+        "expected_cooling": objective.cooling(-score),
+        "baseline_cooling": objective.cooling(0.0),
+        "rounds": rounds,
+        "tiles_evaluated": objective.tiles_evaluated,
+        "tiles_predicted": objective.tiles_predicted,
+        "elapsed": time.time() - timer,
+    }
@@ -0,0 +1,143 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import threading
+import zlib
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+import numpy as np
+
+
+def raster_fingerprint(array: np.ndarray) -> str:
+    data = np.ascontiguousarray(array)
+    digest = hashlib.sha1()
+    digest.update(f"{data.dtype.str}:{data.shape}".encode("utf-8"))
+    digest.update(data.tobytes())
+    return digest.hexdigest()
+
+
+def raster_version(array: np.ndarray, fingerprint: Optional[str] = None) -> str:
+    """Cache identity of a session raster: the fingerprint stored with it, hashing only when there is none."""
+    return fingerprint or raster_fingerprint(array)
+
+
+def simulation_cache_key(
+    interventions: Iterable[Tuple[str, float, float]],
+    heat_fingerprint: str,
+    bbox: Tuple[float, float, float, float],
+    model_version: str,
+) -> str:
+    canonical = sorted((str(kind), round(float(lat), 7), round(float(lon), 7)) for kind, lat, lon in interventions)
+    payload = json.dumps(
+        {
+            "interventions": canonical,
+            "heat": heat_fingerprint,
+            "bbox": [float(v) for v in bbox],
+            "model": model_version,
+        },
+        separators=(",", ":"),
+    )
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+class _CachedSimulation:
+    __slots__ = ("shape", "dtype", "compressed_delta", "image_bytes")
+
+    def __init__(self, shape, dtype, compressed_delta: bytes, image_bytes: bytes) -> None:
+        self.shape = shape
+        self.dtype = dtype
+        self.compressed_delta = compressed_delta
+        self.image_bytes = image_bytes
+
+    @property
+    def nbytes(self) -> int:
+        return len(self.compressed_delta) + len(self.image_bytes)
+
+
+class SimulationResultCache:
+    """LRU cache of simulation outputs bounded by their stored size in bytes."""
+
+    def __init__(self, max_bytes: int = 256 * 1024 * 1024, compression_level: int = 1) -> None:
+        self.max_bytes = max_bytes
+        self.compression_level = compression_level
+
+        self._entries: "OrderedDict[str, _CachedSimulation]" = OrderedDict()
+        self._bytes = 0
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Tuple[np.ndarray, bytes]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self._hits += 1
+
+        heat_delta = np.frombuffer(zlib.decompress(entry.compressed_delta), dtype=entry.dtype).reshape(entry.shape)
+        return heat_delta, entry.image_bytes
+
+    def put(self, key: str, heat_delta: np.ndarray, image_bytes: bytes) -> None:
+        heat_delta = np.ascontiguousarray(heat_delta, dtype=np.float32)
+        entry = _CachedSimulation(
+            heat_delta.shape,
+            heat_delta.dtype,
+            zlib.compress(heat_delta.tobytes(), self.compression_level),
+            bytes(image_bytes),
+        )
+        if entry.nbytes > self.max_bytes:
+            return
+
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= previous.nbytes
+            self._entries[key] = entry
+            self._bytes += entry.nbytes
+
+            while self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted.nbytes
+                self._evictions += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self._hits,
+                "misses": self._misses,
+                "evictions": self._evictions,
+            }
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+
+_cache: Optional[SimulationResultCache] = None
+_cache_lock = threading.Lock()
+
+
+def set_simulation_cache(cache: SimulationResultCache) -> None:
+    global _cache
+    with _cache_lock:
+        _cache = cache
+
+
+def get_simulation_cache() -> SimulationResultCache:
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = SimulationResultCache(
+                max_bytes=int(float(os.getenv("SIMULATION_CACHE_MAX_MB", "256")) * 1024 * 1024)
+            )
+        return _cache
@@ -0,0 +1,274 @@
+"""Sharded on-disk storage for NDVI/LST delta training samples.
+
+Shard ``k`` is ``shard_0000k.{ndvi_delta,lst_delta}.npy`` holding ``(n, 128, 128)``
+arrays plus ``shard_0000k.meta.npz`` with the matching metadata columns. Shards
+are write-once; the metadata file lands last and marks the shard complete.
+"""
+
+import argparse
+import hashlib
+import os
+import pickle
+import re
+import threading
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+DEFAULT_STORE_PATH = Path(__file__).resolve().parent / "data" / "samples"
+TILE_SIZE = 128
+SHARD_SIZE = 2048
+ARRAY_KEYS = ("ndvi_delta", "lst_delta")
+STRING_COLUMNS = ("city", "asset_date_1", "asset_date_2", "vegetation_phase")
+INT_COLUMNS = ("row_start", "col_start", "row_end", "col_end")
+SPLIT_FILENAME = "split.npz"
+VAL_FRACTION = 0.2
+SPLIT_SALT = "v1"
+
+_SHARD_PATTERN = re.compile(r"^shard_(\d+)\.meta\.npz$")
+
+
+def _shard_path(root: Path, shard: int, suffix: str) -> Path:
+    return root / f"shard_{shard:05d}.{suffix}"
+
+
+def _save_atomic(path: Path, writer) -> None:
+    tmp_path = path.with_name(f".{path.name}.tmp")
+    with tmp_path.open("wb") as f:
+        writer(f)
+    os.replace(tmp_path, path)
+
+
+def _shard_ids(root: Path) -> List[int]:
+    if not root.exists():
+        return []
+    matches = (_SHARD_PATTERN.match(path.name) for path in root.iterdir())
+    return sorted(int(match.group(1)) for match in matches if match)
+
+
+class SampleWriter:
+    """Buffer samples in memory and append them to the store one full shard at a time."""
+
+    def __init__(self, root: Path = DEFAULT_STORE_PATH, shard_size: int = SHARD_SIZE, dtype: str = "float32") -> None:
+        if dtype not in ("float16", "float32"):
+            raise ValueError(f"Unsupported dtype '{dtype}', expected float16 or float32")
+
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.shard_size = shard_size
+        self.dtype = np.dtype(dtype)
+
+        existing = _shard_ids(self.root)
+        self._next_shard = existing[-1] + 1 if existing else 0
+        self._buffer: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+        self.written = 0
+
+    def append(self, sample: Dict[str, Any]) -> bool:
+        """Queue one sample; returns False for samples that are not TILE_SIZE x TILE_SIZE."""
+        ndvi = np.asarray(sample["ndvi_delta"])
+        lst = np.asarray(sample["lst_delta"])
+        if ndvi.shape != (TILE_SIZE, TILE_SIZE) or lst.shape != (TILE_SIZE, TILE_SIZE):
+            return False
+
+        with self._lock:
+            self._buffer.append(sample)
+            if len(self._buffer) >= self.shard_size:
+                self._flush_locked()
+        return True
+
+    def flush(self) -> None:
+        with self._lock:
+            self._flush_locked()
+
+    def close(self) -> None:
+        self.flush()
+
+    def __enter__(self) -> "SampleWriter":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def _flush_locked(self) -> None:
+        if not self._buffer:
+            return
+
+        shard, samples = self._next_shard, self._buffer
+        for key in ARRAY_KEYS:
+            stacked = np.stack([np.asarray(sample[key], dtype=self.dtype) for sample in samples])
+            _save_atomic(_shard_path(self.root, shard, f"{key}.npy"), lambda f: np.save(f, stacked))
+
+        columns = {name: np.array([str(sample.get(name) or "") for sample in samples]) for name in STRING_COLUMNS}
+        columns.update({name: np.array([int(sample[name]) for sample in samples], dtype=np.int32) for name in INT_COLUMNS})
+        _save_atomic(_shard_path(self.root, shard, "meta.npz"), lambda f: np.savez(f, **columns))
+
+        self.written += len(samples)
+        self._next_shard += 1
+        self._buffer = []
+
+
+class SampleStore:
+    """Random-access, memory-mapped view over every complete shard of a store."""
+
+    def __init__(self, root: Path = DEFAULT_STORE_PATH) -> None:
+        self.root = Path(root)
+        self.shards = _shard_ids(self.root)
+
+        metadata: Dict[str, List[np.ndarray]] = {name: [] for name in STRING_COLUMNS + INT_COLUMNS}
+        shard_index, offsets = [], []
+        for position, shard in enumerate(self.shards):
+            with np.load(_shard_path(self.root, shard, "meta.npz")) as meta:
+                for name in metadata:
+                    metadata[name].append(meta[name])
+                count = len(meta["row_start"])
+            shard_index.append(np.full(count, position, dtype=np.int32))
+            offsets.append(np.arange(count, dtype=np.int32))
+
+        self.metadata = {
+            name: np.concatenate(columns) if columns else np.array([], dtype=np.int32 if name in INT_COLUMNS else str)
+            for name, columns in metadata.items()
+        }
+        self.shard_index = np.concatenate(shard_index) if shard_index else np.array([], dtype=np.int32)
+        self.offsets = np.concatenate(offsets) if offsets else np.array([], dtype=np.int32)
+
+        self._arrays: Dict[str, List[np.ndarray]] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.offsets)
+
+    def arrays(self, key: str) -> List[np.ndarray]:
+        """Memory-mapped ``(n, TILE, TILE)`` arrays for ``key``, one per shard."""
+        if key not in ARRAY_KEYS:
+            raise KeyError(f"Unknown array '{key}', expected one of {ARRAY_KEYS}")
+        with self._lock:
+            if key not in self._arrays:
+                self._arrays[key] = [
+                    np.load(_shard_path(self.root, shard, f"{key}.npy"), mmap_mode="r") for shard in self.shards
+                ]
+            return self._arrays[key]
+
+    def read(self, key: str, indices: Optional[Sequence[int]] = None) -> np.ndarray:
+        """Gather samples into one ``(n, TILE, TILE)`` array, touching only the shards involved."""
+        indices = np.arange(len(self)) if indices is None else np.asarray(indices, dtype=np.int64)
+        arrays = self.arrays(key)
+        out = np.empty((len(indices), TILE_SIZE, TILE_SIZE), dtype=arrays[0].dtype if arrays else np.float32)
+
+        shards = self.shard_index[indices]
+        for position in np.unique(shards):
+            selected = np.flatnonzero(shards == position)
+            out[selected] = arrays[position][self.offsets[indices[selected]]]
+        return out
+
+    def metadata_record(self, index: int) -> Dict[str, Any]:
+        return {
+            name: (int(column[index]) if name in INT_COLUMNS else str(column[index]))
+            for name, column in self.metadata.items()
+        }
+
+    def iter_metadata(self) -> Iterator[Dict[str, Any]]:
+        for index in range(len(self)):
+            yield self.metadata_record(index)
+
+    def __getitem__(self, index: int) -> Dict[str, Any]:
+        """One sample as the dict layout used by the legacy pickle."""
+        if not -len(self) <= index < len(self):
+            raise IndexError(index)
+        index %= len(self)
+        sample = self.metadata_record(index)
+        shard, offset = self.shard_index[index], self.offsets[index]
+        for key in ARRAY_KEYS:
+            sample[key] = self.arrays(key)[shard][offset]
+        return sample
+
+
+def stack_tensor(store: SampleStore, key: str, indices: Optional[Sequence[int]] = None) -> np.ndarray:
+    """``(n, TILE, TILE, 1)`` float32 tensor with NaNs zeroed, matching ``model.to_tensor``."""
+    stacked = store.read(key, indices).astype(np.float32)
+    np.nan_to_num(stacked, copy=False, nan=0.0)
+    return stacked[..., np.newaxis]
+
+
+def split_groups(store: SampleStore) -> Tuple[np.ndarray, np.ndarray]:
+    """Group id per sample, plus group names, keyed by city and unordered date pair.
+
+    Every chunk of a scene pair, in either direction, lands in the same group.
+    """
+    first, second = store.metadata["asset_date_1"], store.metadata["asset_date_2"]
+    swap = first > second
+    early, late = np.where(swap, second, first), np.where(swap, first, second)
+    keys = np.char.add(np.char.add(np.char.add(store.metadata["city"], "|"), np.char.add(early, "|")), late)
+    names, groups = np.unique(keys, return_inverse=True)
+    return groups.astype(np.int64), names
+
+
+def compute_split(store: SampleStore, val_fraction: float = VAL_FRACTION, salt: str = SPLIT_SALT) -> Tuple[np.ndarray, np.ndarray]:
+    """Deterministic (train, val) index arrays; a group's side depends only on its name and ``salt``."""
+    groups, names = split_groups(store)
+    scores = np.array(
+        [int(hashlib.sha1(f"{salt}:{name}".encode("utf-8")).hexdigest()[:8], 16) / 2 ** 32 for name in names]
+    )
+    is_val = scores[groups] < val_fraction if len(groups) else np.zeros(0, dtype=bool)
+    return np.flatnonzero(~is_val), np.flatnonzero(is_val)
+
+
+def load_split(store: SampleStore, val_fraction: float = VAL_FRACTION, salt: str = SPLIT_SALT) -> Tuple[np.ndarray, np.ndarray]:
+    """Read the cached split for this store, recomputing it when samples were appended or parameters changed."""
+    path = store.root / SPLIT_FILENAME
+    if path.exists():
+        with np.load(path) as split:
+            if (
+                int(split["num_samples"]) == len(store)
+                and float(split["val_fraction"]) == val_fraction
+                and str(split["salt"]) == salt
+            ):
+                return split["train"], split["val"]
+
+    train, val = compute_split(store, val_fraction, salt)
+    _save_atomic(
+        path,
+        lambda f: np.savez(
+            f, train=train, val=val, num_samples=len(store), val_fraction=val_fraction, salt=np.array(salt)
+        ),
+    )
+    print(f"Wrote split to {path}: {len(train)} train / {len(val)} val samples")
+    return train, val
+
+
+def write_samples(samples: Iterable[Dict[str, Any]], root: Path, shard_size: int = SHARD_SIZE, dtype: str = "float32") -> int:
+    written = skipped = 0
+    with SampleWriter(root, shard_size=shard_size, dtype=dtype) as writer:
+        for sample in samples:
+            if writer.append(sample):
+                written += 1
+            else:
+                skipped += 1
+    if skipped:
+        print(f"Skipped {skipped} samples that are not {TILE_SIZE}x{TILE_SIZE}")
+    return written
+
+
+def convert_pickle(pickle_path: Path, root: Path = DEFAULT_STORE_PATH, shard_size: int = SHARD_SIZE, dtype: str = "float32") -> int:
+    """Append the samples of a legacy ``data_samples.pkl`` to a sharded store."""
+    with Path(pickle_path).open("rb") as f:
+        samples = pickle.load(f)
+    written = write_samples(samples, root, shard_size=shard_size, dtype=dtype)
+    print(f"Converted {written} samples from {pickle_path} into {root}")
+    return written
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Convert pickled training samples to a sharded store.")
+    parser.add_argument("pickle_path", type=Path, help="Path to a legacy data_samples.pkl file.")
+    parser.add_argument("--out", type=Path, default=DEFAULT_STORE_PATH, help="Store directory to append to.")
+    parser.add_argument("--shard-size", type=int, default=SHARD_SIZE, help="Samples per shard.")
+    parser.add_argument("--dtype", choices=["float16", "float32"], default="float32", help="On-disk sample dtype.")
+    args = parser.parse_args(argv)
+
+    convert_pickle(args.pickle_path, args.out, shard_size=args.shard_size, dtype=args.dtype)
+
+
+if __name__ == "__main__":
+    main()
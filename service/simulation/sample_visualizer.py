@@ -7,6 +7,8 @@ import matplotlib.pyplot as plt
 import numpy as np
 from matplotlib.colors import TwoSlopeNorm
 
+from service.simulation.sample_store import DEFAULT_STORE_PATH, SampleStore
+
 
 def load_samples(path: Path) -> List[Dict[str, Any]]:
     with path.open("rb") as f:
@@ -70,29 +72,28 @@ def main() -> None:
         "--path",
         type=Path,
         default=None,
-        help="Path to pickled samples file. Defaults to <module_dir>/data/data_samples.pkl",
+        help="Sample store directory or legacy pickled samples file. Defaults to <module_dir>/data/samples",
     )
     parser.add_argument(
         "--index",
         type=int,
-        default=0,
-        help="Index of the sample to visualize.",
+        default=None,
+        help="Index of the sample to visualize. Defaults to a random sample.",
     )
     args = parser.parse_args()
 
-    default_path = Path(__file__).resolve().parent / "data" / "data_samples.pkl"
-    samples_path = args.path or default_path
+    samples_path = args.path or DEFAULT_STORE_PATH
 
     if not samples_path.exists():
-        raise FileNotFoundError(f"Samples file not found at {samples_path}")
+        raise FileNotFoundError(f"Samples not found at {samples_path}")
 
-    samples = load_samples(samples_path)
+    samples = SampleStore(samples_path) if samples_path.is_dir() else load_samples(samples_path)
 
-    if not samples:
-        raise ValueError("No samples found in the provided file.")
+    if not len(samples):
+        raise ValueError("No samples found at the provided path.")
 
-    # Randomly select a sample
-    index = np.random.randint(0, len(samples))
+    # Randomly select a sample unless one was requested
+    index = args.index if args.index is not None else np.random.randint(0, len(samples))
     sample = samples[index]
 
     visualize_sample(sample)
@@ -0,0 +1,94 @@
+from __future__ import annotations
+
+import time
+from typing import Iterable, Tuple
+
+import numpy as np
+
+from service.metrics import timed
+from service.simulation.inference_server import get_inference_server
+from service.simulation.tiled_inference import predict_tiled
+
+TILE_SIZE = 128
+STRIDE = 64
+WINDOW = "hann"
+
+INTERVENTION_NDVI = {
+    "trees": 0.3,
+    "shrubs": 0.15,
+    "grass": 0.05,
+    "buildings": -0.3,
+    "roads": -0.15,
+    "waterbodies": -0.9,
+}
+
+
+def point_to_pixel(
+    latitude: float,
+    longitude: float,
+    bbox: Tuple[float, float, float, float],
+    shape: Tuple[int, int],
+) -> Tuple[int, int]:
+    lon_min, lat_min, lon_max, lat_max = bbox
+    col = (longitude - lon_min) / (lon_max - lon_min) * shape[1]
+    row = (lat_max - latitude) / (lat_max - lat_min) * shape[0]
+    return int(np.clip(row, 0, shape[0] - 1)), int(np.clip(col, 0, shape[1] - 1))
+
+
+def pixel_to_point(
+    row: int,
+    col: int,
+    bbox: Tuple[float, float, float, float],
+    shape: Tuple[int, int],
+) -> Tuple[float, float]:
+    lon_min, lat_min, lon_max, lat_max = bbox
+    latitude = lat_max - (row + 0.5) / shape[0] * (lat_max - lat_min)
+    longitude = lon_min + (col + 0.5) / shape[1] * (lon_max - lon_min)
+    return float(latitude), float(longitude)
+
+
+def rasterize_interventions(
+    interventions: Iterable[Tuple[str, float, float]],
+    bbox: Tuple[float, float, float, float],
+    shape: Tuple[int, int],
+) -> np.ndarray:
+    ndvi_delta = np.zeros(shape, dtype=np.float32)
+
+    for point_type, latitude, longitude in interventions:
+        row, col = point_to_pixel(latitude, longitude, bbox, shape)
+        ndvi_delta[row, col] += INTERVENTION_NDVI.get(point_type, 0.0)
+        ndvi_delta[row, col] = np.clip(ndvi_delta[row, col], -2, 2)
+
+    return ndvi_delta
+
+
+def calibrate_predictions(ndvi_tiles: np.ndarray, predicted: np.ndarray) -> np.ndarray:
+    """Rescale raw U-Net outputs per tile by the sign and size of the mean NDVI change."""
+    non_zero = ndvi_tiles != 0
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean_non_zero_ndvi = np.where(non_zero, ndvi_tiles, 0).sum(axis=(1, 2)) / non_zero.sum(axis=(1, 2))
+
+    vegetation = (mean_non_zero_ndvi > 0)[:, None, None]
+    water = (mean_non_zero_ndvi < -0.6)[:, None, None]
+    city = ((mean_non_zero_ndvi < 0) & (mean_non_zero_ndvi >= -0.6))[:, None, None]
+
+    predicted = np.where(vegetation & (predicted < 0), predicted * 35, predicted)
+    predicted = np.where(vegetation & (predicted > 0), predicted * -8, predicted)
+    predicted = np.where(water, np.abs(predicted) * -20, predicted)
+    predicted = np.where(city & (predicted > 0), predicted * 12, predicted)
+    return predicted
+
+
+def predict_tiles(ndvi_tiles: np.ndarray) -> np.ndarray:
+    """Calibrated heat-delta predictions for an ``(n, TILE_SIZE, TILE_SIZE)`` stack of NDVI-delta tiles."""
+    ndvi_tiles = np.asarray(ndvi_tiles, dtype=np.float32)
+    predicted = np.squeeze(get_inference_server().predict(ndvi_tiles[..., np.newaxis]), axis=3)
+    return calibrate_predictions(ndvi_tiles, predicted)
+
+
+@timed("simulate")
+def simulate_heat_delta(ndvi_delta: np.ndarray) -> np.ndarray:
+    timer = time.time()
+    heat_delta = predict_tiled(ndvi_delta, predict_tiles, tile_size=TILE_SIZE, stride=STRIDE, window=WINDOW)
+    print(f"Generation time: {time.time() - timer}")
+    return heat_delta
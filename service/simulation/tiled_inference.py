@@ -0,0 +1,133 @@
+from __future__ import annotations
+
+from functools import lru_cache
+from typing import Callable, Optional, Tuple
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+WINDOWS = ("hann", "gaussian", "flat")
+
+
+def _check_geometry(tile_size: int, stride: int) -> int:
+    if stride <= 0 or tile_size <= 0 or tile_size % stride != 0:
+        raise ValueError(f"tile_size ({tile_size}) must be a positive multiple of stride ({stride})")
+    return tile_size // stride
+
+
+@lru_cache(maxsize=32)
+def window_weights(tile_size: int, stride: int, window: str = "hann") -> np.ndarray:
+    """Per-pixel blending weights for one tile, computed once per geometry."""
+    _check_geometry(tile_size, stride)
+
+    if window == "hann":
+        # Drop the zero end points so border pixels covered by a single tile keep some weight.
+        profile = np.hanning(tile_size + 2)[1:-1]
+    elif window == "gaussian":
+        positions = np.arange(tile_size) - (tile_size - 1) / 2.0
+        profile = np.exp(-0.5 * (positions / (tile_size / 4.0)) ** 2)
+    elif window == "flat":
+        profile = np.ones(tile_size)
+    else:
+        raise ValueError(f"Unknown window '{window}', expected one of {WINDOWS}")
+
+    weights = np.outer(profile, profile).astype(np.float32)
+    weights.setflags(write=False)
+    return weights
+
+
+def padded_shape(shape: Tuple[int, int], tile_size: int, stride: int) -> Tuple[int, int]:
+    _check_geometry(tile_size, stride)
+    rows = int(np.ceil(shape[0] / stride) * stride + (tile_size - stride))
+    cols = int(np.ceil(shape[1] / stride) * stride + (tile_size - stride))
+    return rows, cols
+
+
+def pad_for_tiling(array: np.ndarray, tile_size: int, stride: int, fill: float = 0.0) -> np.ndarray:
+    padded = np.full(padded_shape(array.shape, tile_size, stride), fill, dtype=np.float32)
+    padded[: array.shape[0], : array.shape[1]] = array
+    return padded
+
+
+def grid_shape(padded: Tuple[int, int], tile_size: int, stride: int) -> Tuple[int, int]:
+    return (padded[0] - tile_size) // stride + 1, (padded[1] - tile_size) // stride + 1
+
+
+def extract_tiles(padded: np.ndarray, tile_size: int, stride: int) -> np.ndarray:
+    """Return a read-only ``(grid_rows, grid_cols, tile_size, tile_size)`` view of ``padded``."""
+    _check_geometry(tile_size, stride)
+    return sliding_window_view(padded, (tile_size, tile_size))[::stride, ::stride]
+
+
+def _accumulate(weighted: np.ndarray, out_shape: Tuple[int, int], stride: int) -> np.ndarray:
+    grid_rows, grid_cols, tile_size, _ = weighted.shape
+    k = tile_size // stride
+
+    # Split every tile into k x k stride-sized blocks; block (di, dj) of all tiles
+    # tiles the output without overlap once shifted by (di, dj) strides.
+    blocks = weighted.reshape(grid_rows, grid_cols, k, stride, k, stride)
+    out = np.zeros(out_shape, dtype=np.float32)
+    for di in range(k):
+        for dj in range(k):
+            block = blocks[:, :, di, :, dj, :].transpose(0, 2, 1, 3).reshape(grid_rows * stride, grid_cols * stride)
+            out[di * stride : di * stride + grid_rows * stride, dj * stride : dj * stride + grid_cols * stride] += block
+    return out
+
+
+@lru_cache(maxsize=16)
+def normalization_map(shape: Tuple[int, int], tile_size: int, stride: int, window: str = "hann") -> np.ndarray:
+    """Sum of window weights over every tile covering each pixel of a padded raster."""
+    grid_rows, grid_cols = grid_shape(shape, tile_size, stride)
+    weights = np.broadcast_to(window_weights(tile_size, stride, window), (grid_rows, grid_cols, tile_size, tile_size))
+    norm = _accumulate(weights, shape, stride)
+    norm[norm == 0] = 1.0
+    norm.setflags(write=False)
+    return norm
+
+
+def overlap_add(
+    predictions: np.ndarray,
+    shape: Tuple[int, int],
+    tile_size: int,
+    stride: int,
+    window: str = "hann",
+    tile_mask: Optional[np.ndarray] = None,
+) -> np.ndarray:
+    """Blend a grid of tile predictions back into a padded raster of ``shape``.
+
+    ``predictions`` is shaped ``(grid_rows, grid_cols, tile_size, tile_size)``.
+    Tiles where ``tile_mask`` is False contribute no weight.
+    """
+    weights = window_weights(tile_size, stride, window)
+    weighted = predictions * weights
+
+    if tile_mask is None:
+        return _accumulate(weighted, shape, stride) / normalization_map(tuple(shape), tile_size, stride, window)
+
+    mask = tile_mask[:, :, None, None].astype(np.float32)
+    norm = _accumulate(np.broadcast_to(weights, predictions.shape) * mask, shape, stride)
+    norm[norm == 0] = 1.0
+    return _accumulate(weighted * mask, shape, stride) / norm
+
+
+def predict_tiled(
+    array: np.ndarray,
+    predict_fn: Callable[[np.ndarray], np.ndarray],
+    tile_size: int = 128,
+    stride: int = 64,
+    window: str = "hann",
+) -> np.ndarray:
+    """Run ``predict_fn`` over overlapping tiles of ``array`` and blend the results.
+
+    ``predict_fn`` maps an ``(n, tile_size, tile_size)`` float32 stack to
+    predictions of the same shape.
+    """
+    padded = pad_for_tiling(np.nan_to_num(array, nan=0.0), tile_size, stride)
+    tiles = extract_tiles(padded, tile_size, stride)
+    grid_rows, grid_cols = tiles.shape[:2]
+
+    predictions = predict_fn(tiles.reshape(-1, tile_size, tile_size))
+    predictions = np.asarray(predictions, dtype=np.float32).reshape(grid_rows, grid_cols, tile_size, tile_size)
+
+    blended = overlap_add(predictions, padded.shape, tile_size, stride, window)
+    return blended[: array.shape[0], : array.shape[1]]
@@ -0,0 +1,95 @@
+import time
+from pathlib import Path
+from typing import List, Optional
+
+import numpy as np
+import tensorflow as tf
+
+PRECISIONS = ("float32", "bfloat16", "auto")
+_BF16_CPU_FLAGS = ("avx512_bf16", "amx_bf16")
+
+
+def configure_threads(intra_op: Optional[int] = None, inter_op: Optional[int] = None) -> None:
+    """Set TensorFlow's thread pools; must run before the first op executes. ``None`` keeps TF's default."""
+    if intra_op:
+        tf.config.threading.set_intra_op_parallelism_threads(intra_op)
+    if inter_op:
+        tf.config.threading.set_inter_op_parallelism_threads(inter_op)
+    print(
+        "TensorFlow threads: "
+        f"intra_op={tf.config.threading.get_intra_op_parallelism_threads() or 'auto'}, "
+        f"inter_op={tf.config.threading.get_inter_op_parallelism_threads() or 'auto'}"
+    )
+
+
+def bf16_supported(cpuinfo: Path = Path("/proc/cpuinfo")) -> bool:
+    """True when the CPU has native bfloat16 instructions (AVX512-BF16 or AMX)."""
+    try:
+        text = cpuinfo.read_text()
+    except OSError:
+        return False
+    flags = set()
+    for line in text.splitlines():
+        if line.startswith("flags"):
+            flags.update(line.split(":", 1)[1].split())
+    return any(flag in flags for flag in _BF16_CPU_FLAGS)
+
+
+def configure_precision(precision: str = "float32") -> str:
+    """Apply the Keras global dtype policy and return the policy name in effect."""
+    if precision not in PRECISIONS:
+        raise ValueError(f"Unknown precision '{precision}', expected one of {PRECISIONS}")
+
+    if precision == "auto":
+        precision = "bfloat16" if bf16_supported() else "float32"
+    elif precision == "bfloat16" and not bf16_supported():
+        print("Warning: this CPU has no native bfloat16 support; mixed precision will be emulated and slower")
+
+    policy = "mixed_bfloat16" if precision == "bfloat16" else "float32"
+    tf.keras.mixed_precision.set_global_policy(policy)
+    print(f"Keras dtype policy: {policy}")
+    return policy
+
+
+class ThroughputLogger(tf.keras.callbacks.Callback):
+    """Log training samples/sec and step-time percentiles at the end of every epoch."""
+
+    def __init__(self, samples_per_epoch: int, percentiles=(50, 90, 99)) -> None:
+        super().__init__()
+        self.samples_per_epoch = samples_per_epoch
+        self.percentiles = percentiles
+        self._step_times: List[float] = []
+        self._step_start = 0.0
+        self._epoch_start = 0.0
+        self._train_end = 0.0
+
+    def on_epoch_begin(self, epoch, logs=None) -> None:
+        self._step_times = []
+        self._epoch_start = time.perf_counter()
+
+    def on_train_batch_begin(self, batch, logs=None) -> None:
+        self._step_start = time.perf_counter()
+
+    def on_train_batch_end(self, batch, logs=None) -> None:
+        self._train_end = time.perf_counter()
+        self._step_times.append(self._train_end - self._step_start)
+
+    def on_epoch_end(self, epoch, logs=None) -> None:
+        if not self._step_times:
+            return
+
+        # Validation runs after the last train step and is excluded from throughput.
+        elapsed = self._train_end - self._epoch_start
+        samples_per_sec = self.samples_per_epoch / elapsed if elapsed > 0 else float("nan")
+        step_ms = np.percentile(np.asarray(self._step_times) * 1000.0, self.percentiles)
+
+        summary = ", ".join(f"p{p}={value:.1f}ms" for p, value in zip(self.percentiles, step_ms))
+        print(
+            f"\nEpoch {epoch + 1}: {samples_per_sec:.1f} samples/sec over {len(self._step_times)} steps "
+            f"({elapsed:.1f}s), step time {summary}"
+        )
+
+        if logs is not None:
+            logs["samples_per_sec"] = samples_per_sec
+            for p, value in zip(self.percentiles, step_ms):
+                logs[f"step_time_p{p}_ms"] = float(value)
@@ -0,0 +1,30 @@
+import cv2
+import numpy as np
+import pytest
+
+from service.imagery.weak_spots import compute_score_map, iter_clusters, percentile_threshold
+
+BBOX = (-79.9, 43.6, -79.6, 43.8)
+
+
+def _scene(seed: int, size: int):
+    rng = np.random.default_rng(seed)
+    heat = cv2.GaussianBlur(rng.random((size, size)).astype(np.float32), (0, 0), 6) * 30
+    ndvi = cv2.GaussianBlur(rng.random((size, size)).astype(np.float32), (0, 0), 6)
+    return heat, ndvi
+
+
+def _summary(clusters):
+    return sorted((c["pixels"], round(c["lat"], 6), round(c["lon"], 6), round(c["mean_score"], 6)) for c in clusters)
+
+
+@pytest.mark.parametrize("seed,size", [(0, 1024), (4, 1024), (7, 1280), (11, 1536)])
+@pytest.mark.parametrize("percentile", [90, 95, 99])
+def test_pyramid_clusters_match_full_resolution(seed, size, percentile):
+    heat, ndvi = _scene(seed, size)
+    score_map = compute_score_map(heat, ndvi)
+    threshold = percentile_threshold(score_map, percentile)
+
+    expected = _summary(iter_clusters(score_map, heat, ndvi, threshold, BBOX, min_area=100, factor=1))
+    for factor in (2, 4):
+        assert _summary(iter_clusters(score_map, heat, ndvi, threshold, BBOX, min_area=100, factor=factor)) == expected